@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Archivos estáticos servidos por el mismo proceso (uvicorn no los sirve)
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -97,6 +99,10 @@ DATABASES = {
         'PASSWORD': 'hola1234',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Conexiones persistentes (web y workers de la cola): close_old_connections las
+        # recicla pasado este tiempo y las descarta si se cortaron (health checks)
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -139,11 +145,56 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'jio_app' / 'static',
 ]
+# Destino de collectstatic en producción
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # Media files (uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Archivos privados (comprobantes de pago): se guardan fuera de MEDIA_ROOT y solo se
+# entregan por la vista protegida en MEDIA_PRIVADO_URL, que revisa los permisos y
+# delega el envío al servidor web:
+# - 'nginx': cabecera X-Accel-Redirect hacia una location 'internal' que apunte a
+#   MEDIA_PRIVADO_ROOT (JIO_MEDIA_PRIVADO_URL_INTERNA). nginx conserva el Content-Type y
+#   el Content-Disposition de la respuesta; la location debe repetir con add_header las
+#   cabeceras Content-Security-Policy y X-Content-Type-Options
+# - 'apache' (mod_xsendfile) o 'lighttpd': cabecera X-Sendfile con la ruta del archivo
+# - vacío (desarrollo): Django envía el archivo con FileResponse
+MEDIA_PRIVADO_URL = '/privado/'
+MEDIA_PRIVADO_ROOT = BASE_DIR / 'media_privado'
+JIO_MEDIA_PRIVADO_SERVIDOR = os.environ.get('JIO_MEDIA_PRIVADO_SERVIDOR', '')
+JIO_MEDIA_PRIVADO_URL_INTERNA = os.environ.get('JIO_MEDIA_PRIVADO_URL_INTERNA', '/media-privado-interno/')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'privado': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': MEDIA_PRIVADO_ROOT,
+            'base_url': MEDIA_PRIVADO_URL,
+        },
+    },
+}
+
+# Caché compartido entre procesos (web, run_scheduler y run_workers) en la base de datos:
+# los reportes que precalcula el programador quedan disponibles para todos los workers
+# web. La tabla se crea con `python manage.py createcachetable`.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'jio_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -155,4 +206,11 @@ AUTH_USER_MODEL = 'jio_app.Usuario'
 # Google Maps API Key
 # Obtener tu API key en: https://console.cloud.google.com/google/maps-apis
 # IMPORTANTE: Para producción, usa variables de entorno
-GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY', '')
\ No newline at end of file
+GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY', '')
+
+# Geocodificación de direcciones (coordenadas de reservas e instalaciones)
+# En producción se usa Google; en desarrollo y pruebas se puede usar el geocodificador
+# local ('jio_app.geocodificacion.GeocodificadorLocal'), opcionalmente con un archivo
+# JSON de direcciones conocidas {"direccion normalizada": [lat, lng]}
+JIO_GEOCODIFICADOR = os.environ.get('JIO_GEOCODIFICADOR', 'jio_app.geocodificacion.GeocodificadorGoogle')
+JIO_GEOCODIFICADOR_FIXTURE = os.environ.get('JIO_GEOCODIFICADOR_FIXTURE', '')
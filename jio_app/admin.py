@@ -1,9 +1,15 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.shortcuts import render
+from django.urls import path
 from .models import (
     Usuario, Cliente, Repartidor, Juego, PrecioTemporada,
-    Reserva, DetalleReserva, Instalacion, Retiro, Pago
+    Reserva, DetalleReserva, Instalacion, Retiro, Pago, Egreso, BalanceMensual,
+    TareaProgramada, EjecucionTarea, TareaEnCola, DireccionGeocodificada,
+    EventoTiempoReal, AccionSincronizada, EventoReparto
 )
+from .conciliacion import VENTANA_DIAS_DEFAULT, conciliar_cartola, leer_cartola
 
 # Register your models here.
 
@@ -35,10 +41,11 @@ class ClienteAdmin(admin.ModelAdmin):
     """
     Configuración del admin para el modelo Cliente
     """
-    list_display = ('usuario', 'rut', 'tipo_cliente')
+    list_display = ('usuario', 'rut', 'tipo_cliente', 'total_reservas', 'ultima_reserva', 'gasto_total')
     list_filter = ('tipo_cliente',)
     search_fields = ('usuario__username', 'usuario__first_name', 'usuario__last_name', 'rut')
     raw_id_fields = ('usuario',)
+    readonly_fields = ('primera_reserva', 'ultima_reserva', 'total_reservas', 'gasto_total')
 
 
 @admin.register(Repartidor)
@@ -108,12 +115,12 @@ class ReservaAdmin(admin.ModelAdmin):
     """
     Configuración del admin para el modelo Reserva
     """
-    list_display = ('id', 'cliente', 'fecha_evento', 'hora_instalacion', 'hora_retiro', 'estado', 'total_reserva', 'fecha_creacion')
+    list_display = ('id', 'cliente', 'fecha_evento', 'hora_instalacion', 'hora_retiro', 'estado', 'total_reserva', 'saldo_pendiente', 'fecha_creacion')
     list_filter = ('estado', 'fecha_evento', 'fecha_creacion')
     search_fields = ('cliente__usuario__username', 'cliente__usuario__first_name', 'cliente__usuario__last_name', 'direccion_evento')
     raw_id_fields = ('cliente',)
     inlines = [DetalleReservaInline]
-    readonly_fields = ('fecha_creacion', 'fecha_modificacion')
+    readonly_fields = ('saldo_pendiente', 'fecha_creacion', 'fecha_modificacion')
     
     fieldsets = (
         ('Información del Cliente', {
@@ -123,7 +130,7 @@ class ReservaAdmin(admin.ModelAdmin):
             'fields': ('fecha_evento', 'hora_instalacion', 'hora_retiro', 'direccion_evento')
         }),
         ('Estado y Observaciones', {
-            'fields': ('estado', 'observaciones', 'total_reserva')
+            'fields': ('estado', 'observaciones', 'total_reserva', 'saldo_pendiente')
         }),
         ('Fechas del Sistema', {
             'fields': ('fecha_creacion', 'fecha_modificacion'),
@@ -206,6 +213,7 @@ class PagoAdmin(admin.ModelAdmin):
     search_fields = ('reserva__cliente__usuario__username', 'observaciones')
     raw_id_fields = ('reserva',)
     readonly_fields = ('fecha_creacion',)
+    change_list_template = 'admin/jio_app/pago/change_list.html'
     
     fieldsets = (
         ('Información de la Reserva', {
@@ -222,9 +230,243 @@ class PagoAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def get_urls(self):
+        urls = [
+            path(
+                'importar-cartola/',
+                self.admin_site.admin_view(self.importar_cartola),
+                name='jio_app_pago_importar_cartola'
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def importar_cartola(self, request):
+        """
+        Sube una cartola bancaria CSV y concilia los abonos con pagos pendientes
+        """
+        resultado = None
+        errores = []
+        if request.method == 'POST':
+            form = ImportarCartolaForm(request.POST, request.FILES)
+            if form.is_valid():
+                lineas, errores = leer_cartola(form.cleaned_data['archivo'].read())
+                simular = form.cleaned_data['simular']
+                resultado = conciliar_cartola(
+                    lineas,
+                    ventana_dias=form.cleaned_data['ventana'],
+                    aplicar=not simular
+                )
+                if not simular:
+                    messages.success(
+                        request,
+                        f'{len(resultado["pagos"])} pagos conciliados y '
+                        f'{len(resultado["reservas"])} pagos creados desde la cartola'
+                    )
+        else:
+            form = ImportarCartolaForm()
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar cartola bancaria',
+            'form': form,
+            'resultado': resultado,
+            'errores': errores,
+        }
+        return render(request, 'admin/jio_app/pago/importar_cartola.html', context)
+
+
+class ImportarCartolaForm(forms.Form):
+    archivo = forms.FileField(label='Cartola (CSV)')
+    ventana = forms.IntegerField(
+        label='Tolerancia en días',
+        min_value=0,
+        max_value=60,
+        initial=VENTANA_DIAS_DEFAULT
+    )
+    simular = forms.BooleanField(
+        label='Solo simular (no modifica pagos)',
+        required=False,
+        initial=True
+    )
+
+
+@admin.register(Egreso)
+class EgresoAdmin(admin.ModelAdmin):
+    """
+    Configuración del admin para el modelo Egreso
+    """
+    list_display = ('fecha', 'categoria', 'monto', 'descripcion', 'registrado_por')
+    list_filter = ('categoria', 'fecha')
+    search_fields = ('descripcion',)
+    date_hierarchy = 'fecha'
+    readonly_fields = ('registrado_por', 'fecha_creacion')
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.registrado_por = request.user
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(BalanceMensual)
+class BalanceMensualAdmin(admin.ModelAdmin):
+    """
+    Configuración del admin para los cierres mensuales (solo lectura)
+    """
+    list_display = ('año', 'mes', 'saldo_inicial', 'ingresos', 'egresos', 'saldo_final', 'fecha_cierre')
+    list_filter = ('año',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TareaProgramada)
+class TareaProgramadaAdmin(admin.ModelAdmin):
+    """
+    Estado de las tareas periódicas del programador (solo lectura)
+    """
+    list_display = ('nombre', 'programacion', 'ultima_ejecucion', 'bloqueado_hasta', 'nodo')
+    
+    def programacion(self, obj):
+        from .programador import TAREAS
+        return TAREAS[obj.nombre][0] if obj.nombre in TAREAS else '-'
+    programacion.short_description = 'Programación (cron)'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EjecucionTarea)
+class EjecucionTareaAdmin(admin.ModelAdmin):
+    """
+    Historial de ejecuciones de las tareas periódicas (solo lectura)
+    """
+    list_display = ('tarea', 'inicio', 'duracion', 'exito', 'nodo')
+    list_filter = ('tarea', 'exito')
+    date_hierarchy = 'inicio'
+    readonly_fields = ('tarea', 'nodo', 'inicio', 'duracion', 'exito', 'resultado')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(TareaEnCola)
+class TareaEnColaAdmin(admin.ModelAdmin):
+    """
+    Cola de tareas en segundo plano, con profundidad y latencias sobre el listado
+    """
+    list_display = ('id', 'nombre', 'estado', 'intentos', 'max_intentos', 'disponible_desde', 'fecha_creacion', 'fecha_fin', 'trabajador')
+    list_filter = ('estado', 'nombre')
+    readonly_fields = (
+        'nombre', 'argumentos', 'estado', 'intentos', 'max_intentos', 'disponible_desde',
+        'trabajador', 'ultimo_error', 'fecha_creacion', 'fecha_inicio', 'fecha_fin'
+    )
+    change_list_template = 'admin/jio_app/tareaencola/change_list.html'
+    actions = ['reintentar']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        from .cola import estadisticas_cola
+        extra_context = {**(extra_context or {}), 'estadisticas_cola': estadisticas_cola()}
+        return super().changelist_view(request, extra_context=extra_context)
+    
+    @admin.action(description='Reintentar tareas fallidas seleccionadas')
+    def reintentar(self, request, queryset):
+        from django.utils import timezone
+        total = queryset.filter(estado='fallida').update(
+            estado='pendiente',
+            intentos=0,
+            disponible_desde=timezone.now(),
+            fecha_fin=None
+        )
+        messages.success(request, f'{total} tareas devueltas a la cola')
+
+@admin.register(DireccionGeocodificada)
+class DireccionGeocodificadaAdmin(admin.ModelAdmin):
+    """
+    Caché de geocodificación (solo lectura). Borrar una fila obliga a consultar de nuevo esa dirección
+    """
+    list_display = ('direccion_normalizada', 'latitud', 'longitud', 'proveedor', 'fecha_creacion')
+    list_filter = ('proveedor',)
+    search_fields = ('direccion_normalizada', 'direccion_original')
+    readonly_fields = ('direccion_normalizada', 'direccion_original', 'latitud', 'longitud', 'proveedor', 'fecha_creacion')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EventoTiempoReal)
+class EventoTiempoRealAdmin(admin.ModelAdmin):
+    """
+    Eventos enviados a los paneles en vivo (solo lectura). Se borran pasados unos días
+    """
+    list_display = ('id', 'tipo', 'tipo_reparto', 'reparto_id', 'repartidor', 'fecha_creacion')
+    list_filter = ('tipo', 'tipo_reparto')
+    readonly_fields = ('tipo', 'tipo_reparto', 'reparto_id', 'repartidor', 'datos', 'fecha_creacion')
+    list_select_related = ('repartidor__usuario',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AccionSincronizada)
+class AccionSincronizadaAdmin(admin.ModelAdmin):
+    """
+    Acciones recibidas de los dispositivos de los repartidores (solo lectura)
+    """
+    list_display = ('id_accion', 'tipo', 'repartidor', 'fecha_accion', 'fecha_creacion')
+    list_filter = ('tipo',)
+    search_fields = ('id_accion', 'repartidor__usuario__first_name', 'repartidor__usuario__last_name')
+    readonly_fields = ('repartidor', 'id_accion', 'tipo', 'fecha_accion', 'resultado', 'fecha_creacion')
+    list_select_related = ('repartidor__usuario',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EventoReparto)
+class EventoRepartoAdmin(admin.ModelAdmin):
+    """
+    Historial de instalaciones y retiros (solo lectura)
+    """
+    list_display = ('id', 'tipo', 'tipo_reparto', 'reparto_id', 'actor', 'fecha')
+    list_filter = ('tipo', 'tipo_reparto')
+    search_fields = ('reparto_id',)
+    readonly_fields = ('tipo', 'tipo_reparto', 'reparto_id', 'actor', 'fecha', 'datos')
+    list_select_related = ('actor',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 # Configuración personalizada del sitio de administración
 admin.site.site_header = "JIO - Sistema de Arriendos"
 admin.site.site_title = "JIO Admin"
 admin.site.index_title = "Panel de Administración"
+
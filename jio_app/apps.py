@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class JioAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'jio_app'
+
+    def ready(self):
+        # Registrar señales que mantienen los resúmenes de reportes
+        from . import signals  # noqa: F401
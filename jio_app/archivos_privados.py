@@ -0,0 +1,88 @@
+"""
+Entrega de archivos privados (comprobantes de pago y sus versiones).
+
+Los archivos viven en el almacenamiento 'privado', fuera de MEDIA_ROOT, así que el
+servidor web no los publica. La vista protegida revisa los permisos y, en producción,
+solo responde una cabecera (X-Accel-Redirect o X-Sendfile) para que nginx o Apache
+envíen el archivo directamente, sin pasar los bytes por los workers de Django.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import storages
+from django.http import FileResponse, Http404, HttpResponse
+
+from .imagenes import rutas_variantes
+from .models import Instalacion
+
+# Los archivos no cambian (las versiones llevan el hash del contenido), pero son
+# privados: solo el navegador del usuario puede guardarlos en caché
+CACHE_CONTROL = 'private, max-age=86400'
+# Tipos que se muestran en el navegador; cualquier otro archivo se entrega como descarga
+# (application/octet-stream, attachment) para que nunca se interprete como HTML o SVG
+TIPOS_EN_LINEA = {'image/jpeg', 'image/png', 'image/webp'}
+# Aunque un archivo se abriera como documento, no puede ejecutar scripts ni cargar nada
+CONTENT_SECURITY_POLICY = "default-src 'none'; img-src 'self'"
+
+
+def puede_ver(usuario, ruta):
+    """
+    True si el usuario puede ver el archivo: los administradores ven todos y los
+    repartidores solo los comprobantes (y sus versiones) de sus instalaciones
+    """
+    if usuario.tipo_usuario == 'administrador':
+        return True
+    if usuario.tipo_usuario != 'repartidor' or not hasattr(usuario, 'repartidor'):
+        return False
+    instalaciones = Instalacion.objects.filter(repartidor=usuario.repartidor)
+    if instalaciones.filter(comprobante_pago=ruta).exists():
+        return True
+    # Las versiones se llaman {hash}-{nombre}.webp
+    resumen = os.path.basename(ruta).split('-', 1)[0]
+    return any(
+        ruta in rutas_variantes(variantes)
+        for variantes in instalaciones.filter(
+            comprobante_variantes__hash=resumen
+        ).values_list('comprobante_variantes', flat=True)
+    )
+
+
+def respuesta_archivo(ruta):
+    """
+    Respuesta que entrega el archivo privado según JIO_MEDIA_PRIVADO_SERVIDOR. Solo
+    JPEG, PNG y WebP se muestran en línea; el resto se fuerza como descarga.
+    Lanza Http404 si la ruta no existe o sale del almacenamiento.
+    """
+    almacenamiento = storages['privado']
+    try:
+        if not almacenamiento.exists(ruta):
+            raise Http404('Archivo no encontrado')
+        ruta_absoluta = almacenamiento.path(ruta)
+    except SuspiciousFileOperation:
+        raise Http404('Archivo no encontrado')
+
+    tipo_contenido = mimetypes.guess_type(ruta)[0]
+    en_linea = tipo_contenido in TIPOS_EN_LINEA
+    if not en_linea:
+        tipo_contenido = 'application/octet-stream'
+    servidor = settings.JIO_MEDIA_PRIVADO_SERVIDOR
+    if servidor == 'nginx':
+        respuesta = HttpResponse(content_type=tipo_contenido)
+        interna = settings.JIO_MEDIA_PRIVADO_URL_INTERNA.rstrip('/')
+        respuesta['X-Accel-Redirect'] = f'{interna}/{quote(ruta)}'
+    elif servidor in ('apache', 'lighttpd'):
+        respuesta = HttpResponse(content_type=tipo_contenido)
+        respuesta['X-Sendfile'] = ruta_absoluta
+    else:
+        respuesta = FileResponse(open(ruta_absoluta, 'rb'), content_type=tipo_contenido)
+
+    respuesta['Cache-Control'] = CACHE_CONTROL
+    respuesta['X-Content-Type-Options'] = 'nosniff'
+    respuesta['Content-Security-Policy'] = CONTENT_SECURITY_POLICY
+    if not en_linea:
+        nombre = quote(os.path.basename(ruta))
+        respuesta['Content-Disposition'] = f"attachment; filename*=UTF-8''{nombre}"
+    return respuesta
@@ -0,0 +1,281 @@
+"""
+Asignación automática de repartidores a instalaciones y retiros sin asignar.
+
+Para cada día se parte de las rutas que los repartidores habilitados ya tienen y se
+insertan las paradas libres una a una donde agregan menos costo (inserción más barata).
+Luego una búsqueda local mueve e intercambia paradas entre repartidores mientras el
+costo total baje. El costo de una ruta es el mismo de rutas.py (kilómetros más minutos
+de atraso penalizados) y se suma un término cuadrático por cantidad de paradas para
+repartir la carga de forma pareja.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+
+from .historial import evento_historial, registrar
+from .models import Instalacion, Repartidor, Retiro
+from .tiempo_real import evento_reparto, publicar
+from .rutas import (
+    ORIGEN_RUTAS, costo_ruta, datos_paradas, matriz_distancias, mejorar_dos_opt,
+    parada_instalacion, parada_retiro, simular_ruta
+)
+
+# Cada parada adicional de un repartidor con n paradas cuesta (2n + 1) veces esto, en km
+PESO_BALANCE_KM = 2
+MAX_PASADAS_BUSQUEDA = 10
+
+ESTADOS_INSTALACION_ACTIVOS = ['programada', 'pendiente']
+ESTADOS_RETIRO_ACTIVOS = ['programado', 'pendiente']
+
+
+def _mejor_insercion(ruta, indice, datos, matriz):
+    """(costo, posición) de la mejor posición para insertar indice en la ruta"""
+    mejor = None
+    for posicion in range(len(ruta) + 1):
+        costo = costo_ruta(ruta[:posicion] + [indice] + ruta[posicion:], datos, matriz)
+        if mejor is None or costo < mejor[0]:
+            mejor = (costo, posicion)
+    return mejor
+
+
+def _balance(cantidad):
+    return PESO_BALANCE_KM * cantidad ** 2
+
+
+def _reubicar(rutas, costos, libres, datos, matriz):
+    """Mueve una parada libre a otro repartidor si baja el costo total. Retorna True si movió alguna"""
+    mejoro = False
+    for indice in libres:
+        origen = next(r for r, ruta in rutas.items() if indice in ruta)
+        sin_parada = [i for i in rutas[origen] if i != indice]
+        costo_sin = costo_ruta(sin_parada, datos, matriz)
+        for destino, ruta in rutas.items():
+            if destino == origen:
+                continue
+            costo_con, posicion = _mejor_insercion(ruta, indice, datos, matriz)
+            delta = (
+                costo_sin - costos[origen] + costo_con - costos[destino]
+                + _balance(len(sin_parada)) - _balance(len(rutas[origen]))
+                + _balance(len(ruta) + 1) - _balance(len(ruta))
+            )
+            if delta < -1e-9:
+                rutas[origen], costos[origen] = sin_parada, costo_sin
+                rutas[destino] = ruta[:posicion] + [indice] + ruta[posicion:]
+                costos[destino] = costo_con
+                mejoro = True
+                break
+    return mejoro
+
+
+def _intercambiar(rutas, costos, libres, datos, matriz):
+    """Intercambia dos paradas libres de repartidores distintos si baja el costo total"""
+    mejoro = False
+    ubicacion = {i: r for r, ruta in rutas.items() for i in ruta}
+    for posicion_a, a in enumerate(libres):
+        for b in libres[posicion_a + 1:]:
+            ruta_a, ruta_b = ubicacion[a], ubicacion[b]
+            if ruta_a == ruta_b:
+                continue
+            nueva_a = [b if i == a else i for i in rutas[ruta_a]]
+            nueva_b = [a if i == b else i for i in rutas[ruta_b]]
+            costo_a = costo_ruta(nueva_a, datos, matriz)
+            costo_b = costo_ruta(nueva_b, datos, matriz)
+            if costo_a + costo_b < costos[ruta_a] + costos[ruta_b] - 1e-9:
+                rutas[ruta_a], rutas[ruta_b] = nueva_a, nueva_b
+                costos[ruta_a], costos[ruta_b] = costo_a, costo_b
+                ubicacion[a], ubicacion[b] = ruta_b, ruta_a
+                mejoro = True
+    return mejoro
+
+
+def asignar_dia(libres, fijas, repartidores, origen=ORIGEN_RUTAS):
+    """
+    Reparte las paradas libres de un día entre los repartidores.
+    fijas es un diccionario repartidor_id -> paradas ya asignadas ese día (no se mueven).
+    Las paradas sin coordenadas se ubican en el origen: solo cuentan por su horario y carga.
+    Retorna (asignacion, rutas): asignacion mapea la posición de cada parada libre al
+    repartidor_id y rutas mapea repartidor_id -> (paradas, km, minutos_atraso).
+    """
+    todas = [parada for repartidor in repartidores for parada in fijas.get(repartidor, [])] + list(libres)
+    puntos = [origen] + [
+        (float(p['lat']), float(p['lng'])) if p.get('lat') is not None and p.get('lng') is not None else origen
+        for p in todas
+    ]
+    matriz = matriz_distancias(puntos)
+    datos = datos_paradas(todas)
+
+    rutas = {}
+    indice = 1
+    for repartidor in repartidores:
+        cantidad = len(fijas.get(repartidor, []))
+        rutas[repartidor] = sorted(range(indice, indice + cantidad), key=lambda i: datos[i][0])
+        indice += cantidad
+    indices_libres = list(range(indice, len(todas) + 1))
+    costos = {r: costo_ruta(ruta, datos, matriz) for r, ruta in rutas.items()}
+
+    # Inserción más barata, partiendo por las ventanas que abren más temprano
+    for i in sorted(indices_libres, key=lambda i: (datos[i][0], datos[i][1])):
+        mejor = None
+        for repartidor, ruta in rutas.items():
+            costo, posicion = _mejor_insercion(ruta, i, datos, matriz)
+            delta = costo - costos[repartidor] + _balance(len(ruta) + 1) - _balance(len(ruta))
+            if mejor is None or delta < mejor[0]:
+                mejor = (delta, repartidor, posicion, costo)
+        _, repartidor, posicion, costo = mejor
+        rutas[repartidor].insert(posicion, i)
+        costos[repartidor] = costo
+
+    # Búsqueda local: orden interno con 2-opt, luego mover e intercambiar paradas libres
+    for _ in range(MAX_PASADAS_BUSQUEDA):
+        for repartidor in rutas:
+            rutas[repartidor] = mejorar_dos_opt(rutas[repartidor], datos, matriz)
+            costos[repartidor] = costo_ruta(rutas[repartidor], datos, matriz)
+        movio = _reubicar(rutas, costos, indices_libres, datos, matriz)
+        intercambio = _intercambiar(rutas, costos, indices_libres, datos, matriz)
+        if not movio and not intercambio:
+            break
+
+    inicio_libres = indice
+    asignacion = {}
+    resumen = {}
+    for repartidor, ruta in rutas.items():
+        for i in ruta:
+            if i >= inicio_libres:
+                asignacion[i - inicio_libres] = repartidor
+        km, atraso, _ = simular_ruta(ruta, datos, matriz)
+        resumen[repartidor] = (len(ruta), round(km, 1), int(round(atraso)))
+    return asignacion, resumen
+
+
+def proponer_asignacion(desde, hasta):
+    """
+    Propuesta de asignación para las instalaciones y retiros sin repartidor entre las
+    fechas indicadas (inclusive), sin guardar nada.
+    Retorna un diccionario con 'asignaciones' (una por parada libre, con repartidor_id
+    y nombre del repartidor), 'resumen' por día y repartidor ('paradas', 'nuevas', 'km',
+    'minutos_atraso') y 'sin_repartidores' si no hay repartidores habilitados.
+    """
+    repartidores = {
+        r.id: r for r in Repartidor.objects.filter(
+            estado='Habilitado',
+            usuario__is_active=True
+        ).select_related('usuario').order_by('id')
+    }
+    instalaciones = Instalacion.objects.filter(
+        fecha_instalacion__range=(desde, hasta),
+        estado_instalacion__in=ESTADOS_INSTALACION_ACTIVOS
+    ).select_related('reserva__cliente__usuario')
+    retiros = Retiro.objects.filter(
+        fecha_retiro__range=(desde, hasta),
+        estado_retiro__in=ESTADOS_RETIRO_ACTIVOS
+    ).select_related('reserva__cliente__usuario')
+
+    libres_por_dia = defaultdict(list)
+    fijas_por_dia = defaultdict(lambda: defaultdict(list))
+    for objeto, parada in [(i, parada_instalacion(i)) for i in instalaciones] + [(r, parada_retiro(r)) for r in retiros]:
+        if objeto.repartidor_id is None:
+            libres_por_dia[parada['fecha']].append(parada)
+        elif objeto.repartidor_id in repartidores:
+            fijas_por_dia[parada['fecha']][objeto.repartidor_id].append(parada)
+
+    propuesta = {'asignaciones': [], 'resumen': [], 'sin_repartidores': not repartidores}
+    if not repartidores:
+        return propuesta
+
+    for fecha in sorted(libres_por_dia):
+        libres = sorted(libres_por_dia[fecha], key=lambda p: p['hora'])
+        asignacion, resumen = asignar_dia(libres, fijas_por_dia[fecha], list(repartidores))
+        nuevas = defaultdict(int)
+        for posicion, parada in enumerate(libres):
+            repartidor = repartidores[asignacion[posicion]]
+            nuevas[repartidor.id] += 1
+            propuesta['asignaciones'].append({
+                'tipo': parada['tipo'],
+                'id': parada['id'],
+                'fecha': fecha.isoformat(),
+                'hora': parada['hora'].strftime('%H:%M'),
+                'cliente': parada['cliente'],
+                'direccion': parada['direccion'],
+                'repartidor_id': repartidor.id,
+                'repartidor': repartidor.usuario.get_full_name(),
+            })
+        for repartidor_id, (paradas, km, atraso) in resumen.items():
+            if paradas:
+                propuesta['resumen'].append({
+                    'fecha': fecha.isoformat(),
+                    'repartidor_id': repartidor_id,
+                    'repartidor': repartidores[repartidor_id].usuario.get_full_name(),
+                    'paradas': paradas,
+                    'nuevas': nuevas[repartidor_id],
+                    'km': km,
+                    'minutos_atraso': atraso,
+                })
+    return propuesta
+
+
+def aplicar_asignacion(asignaciones, actor=None):
+    """
+    Guarda una asignación (lista de diccionarios con 'tipo', 'id' y 'repartidor_id')
+    con un UPDATE por tipo de reparto y la registra en el historial de cada reparto. Solo se asignan los repartos que siguen sin
+    repartidor y activos, a repartidores habilitados, de modo que una asignación manual
+    hecha después de la vista previa no se sobrescribe.
+    Retorna (asignados, omitidos).
+    """
+    habilitados = {
+        r.id: r.usuario.get_full_name()
+        for r in Repartidor.objects.filter(estado='Habilitado', usuario__is_active=True).select_related('usuario')
+    }
+    por_tipo = {'instalacion': defaultdict(list), 'retiro': defaultdict(list)}
+    for asignacion in asignaciones:
+        tipo, repartidor_id = asignacion.get('tipo'), asignacion.get('repartidor_id')
+        if tipo in por_tipo and repartidor_id in habilitados:
+            por_tipo[tipo][repartidor_id].append(asignacion.get('id'))
+
+    modelos = {
+        'instalacion': (Instalacion, 'estado_instalacion', 'fecha_instalacion', 'hora_instalacion', ESTADOS_INSTALACION_ACTIVOS),
+        'retiro': (Retiro, 'estado_retiro', 'fecha_retiro', 'hora_retiro', ESTADOS_RETIRO_ACTIVOS),
+    }
+    asignados = 0
+    with transaction.atomic():
+        eventos = []
+        historial = []
+        for tipo, grupos in por_tipo.items():
+            if not grupos:
+                continue
+            modelo, campo_estado, campo_fecha, campo_hora, estados = modelos[tipo]
+            repartidor_de = {pk: repartidor_id for repartidor_id, pks in grupos.items() for pk in pks}
+            elegibles = modelo.objects.select_for_update().filter(
+                id__in=list(repartidor_de),
+                repartidor__isnull=True,
+                **{f'{campo_estado}__in': estados}
+            )
+            filas = list(elegibles.values_list('id', campo_estado, campo_fecha, campo_hora))
+            if not filas:
+                continue
+            asignados += modelo.objects.filter(id__in=[fila[0] for fila in filas]).update(repartidor_id=Case(
+                *[When(id__in=pks, then=Value(repartidor_id)) for repartidor_id, pks in grupos.items()],
+                output_field=IntegerField()
+            ))
+            nombres_estado = dict(modelo._meta.get_field(campo_estado).choices)
+            eventos += [
+                evento_reparto(
+                    'asignado', tipo, pk, repartidor_de[pk],
+                    estado=estado,
+                    estado_display=nombres_estado[estado],
+                    fecha=fecha.isoformat(),
+                    hora=hora.strftime('%H:%M'),
+                    repartidor=habilitados[repartidor_de[pk]],
+                )
+                for pk, estado, fecha, hora in filas
+            ]
+            historial += [
+                evento_historial(
+                    'asignado', tipo, pk, actor,
+                    repartidor=habilitados[repartidor_de[pk]], automatico=True
+                )
+                for pk, _, _, _ in filas
+            ]
+        registrar(historial)
+        publicar(eventos)
+    return asignados, len(asignaciones) - asignados
@@ -0,0 +1,309 @@
+"""
+Cola de tareas en segundo plano guardada en la base de datos (modelo TareaEnCola).
+
+Las vistas encolan trabajo lento con encolar() y los workers (comando run_workers) lo
+toman con SELECT ... FOR UPDATE SKIP LOCKED, de modo que varios workers pueden leer la
+misma tabla sin bloquearse entre sí ni tomar dos veces la misma tarea. Las tareas que
+fallan se reintentan con espera exponencial hasta max_intentos.
+"""
+import logging
+import random
+import time
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+from .models import TareaEnCola
+
+ESPERA_BASE_SEGUNDOS = 30
+ESPERA_MAXIMA_SEGUNDOS = 60 * 60
+# Una tarea en proceso por más tiempo que esto se considera abandonada (worker caído);
+# cada tarea puede declarar el suyo en tarea_en_cola
+TIEMPO_MAXIMO_EJECUCION = timedelta(minutes=30)
+DIAS_RETENCION_COMPLETADAS = 7
+# Espera de un worker tras un error de la base de datos (se duplica hasta el máximo)
+ESPERA_ERROR_BASE_SEGUNDOS = 1
+ESPERA_ERROR_MAXIMA_SEGUNDOS = 60
+
+REGISTRO = {}
+TIEMPOS_MAXIMOS = {}
+
+logger = logging.getLogger(__name__)
+
+
+def tarea_en_cola(nombre, tiempo_maximo=TIEMPO_MAXIMO_EJECUCION):
+    """
+    Decorador que registra una función como tarea ejecutable por los workers.
+    tiempo_maximo es cuánto puede durar antes de considerarla abandonada.
+    """
+    def registrar(funcion):
+        REGISTRO[nombre] = funcion
+        TIEMPOS_MAXIMOS[nombre] = tiempo_maximo
+        return funcion
+    return registrar
+
+
+def encolar(nombre, max_intentos=5, retraso=None, **argumentos):
+    """
+    Agrega una tarea a la cola. Los argumentos deben ser serializables a JSON.
+    Si hay una transacción abierta, la tarea solo será visible para los workers al confirmarse.
+    """
+    if nombre not in REGISTRO:
+        raise ValueError(f'Tarea no registrada: {nombre}')
+    return TareaEnCola.objects.create(
+        nombre=nombre,
+        argumentos=argumentos,
+        max_intentos=max_intentos,
+        disponible_desde=timezone.now() + (retraso or timedelta(0)),
+    )
+
+
+def encolar_al_confirmar(nombre, **argumentos):
+    """Encola la tarea cuando se confirme la transacción actual (o de inmediato si no hay)"""
+    transaction.on_commit(lambda: encolar(nombre, **argumentos))
+
+
+def encolar_unica_al_confirmar(nombre, **argumentos):
+    """
+    Como encolar_al_confirmar, pero no agrega la tarea si ya hay una igual (mismo nombre y
+    argumentos) pendiente: muchas escrituras sobre el mismo día, cliente o reserva se
+    resuelven con una sola ejecución. Una tarea en proceso no cuenta, porque pudo leer
+    los datos antes de este cambio. La búsqueda recorre solo las pendientes (índice parcial).
+    """
+    def encolar_si_no_hay_pendiente():
+        if not TareaEnCola.objects.filter(estado='pendiente', nombre=nombre, argumentos=argumentos).exists():
+            encolar(nombre, **argumentos)
+    transaction.on_commit(encolar_si_no_hay_pendiente)
+
+
+def tomar_tarea(trabajador):
+    """
+    Toma la siguiente tarea disponible y la marca en proceso. Las filas bloqueadas por
+    otros workers se saltan (SKIP LOCKED). Retorna la tarea o None si la cola está vacía.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        tarea = TareaEnCola.objects.select_for_update(skip_locked=True).filter(
+            estado='pendiente',
+            disponible_desde__lte=ahora
+        ).order_by('disponible_desde', 'id').first()
+        if tarea is None:
+            return None
+        tarea.estado = 'en_proceso'
+        tarea.intentos += 1
+        tarea.trabajador = trabajador
+        tarea.fecha_inicio = ahora
+        tarea.save(update_fields=['estado', 'intentos', 'trabajador', 'fecha_inicio'])
+    return tarea
+
+
+def _espera_reintento(intentos):
+    espera = min(ESPERA_BASE_SEGUNDOS * 2 ** (intentos - 1), ESPERA_MAXIMA_SEGUNDOS)
+    return timedelta(seconds=espera * random.uniform(1, 1.25))
+
+
+def ejecutar_tarea(tarea):
+    """
+    Ejecuta una tarea tomada por tomar_tarea. Si falla y le quedan intentos vuelve a
+    quedar pendiente con espera exponencial; si no, queda como fallida.
+    Retorna True si se completó.
+    """
+    funcion = REGISTRO.get(tarea.nombre)
+    try:
+        if funcion is None:
+            raise LookupError(f'Tarea no registrada: {tarea.nombre}')
+        funcion(**tarea.argumentos)
+    except Exception:
+        tarea.ultimo_error = traceback.format_exc()[-5000:]
+        if tarea.intentos < tarea.max_intentos:
+            tarea.estado = 'pendiente'
+            tarea.disponible_desde = timezone.now() + _espera_reintento(tarea.intentos)
+        else:
+            tarea.estado = 'fallida'
+            tarea.fecha_fin = timezone.now()
+        tarea.save(update_fields=['estado', 'disponible_desde', 'fecha_fin', 'ultimo_error'])
+        return False
+
+    tarea.estado = 'completada'
+    tarea.fecha_fin = timezone.now()
+    tarea.save(update_fields=['estado', 'fecha_fin'])
+    return True
+
+
+def rescatar_tareas_abandonadas():
+    """
+    Devuelve a la cola las tareas en proceso que superaron su tiempo máximo (el worker
+    dejó de responder). Las que ya usaron todos sus intentos quedan como fallidas: una
+    tarea que hace caer a su worker (falta de memoria, imagen maliciosa) no se repite
+    para siempre. Retorna (rescatadas, fallidas).
+    """
+    ahora = timezone.now()
+    por_tiempo = defaultdict(list)
+    for nombre, tiempo_maximo in TIEMPOS_MAXIMOS.items():
+        por_tiempo[tiempo_maximo].append(nombre)
+    vencidas = Q(fecha_inicio__lt=ahora - TIEMPO_MAXIMO_EJECUCION) & ~Q(nombre__in=list(TIEMPOS_MAXIMOS))
+    for tiempo_maximo, nombres in por_tiempo.items():
+        vencidas |= Q(nombre__in=nombres, fecha_inicio__lt=ahora - tiempo_maximo)
+    abandonadas = TareaEnCola.objects.filter(vencidas, estado='en_proceso')
+
+    with transaction.atomic():
+        fallidas = abandonadas.filter(intentos__gte=F('max_intentos')).update(
+            estado='fallida',
+            fecha_fin=ahora,
+            ultimo_error='El worker dejó de responder en el último intento',
+        )
+        rescatadas = abandonadas.filter(intentos__lt=F('max_intentos')).update(
+            estado='pendiente',
+            disponible_desde=ahora,
+        )
+    if fallidas:
+        logger.warning('%s tareas abandonadas sin intentos restantes quedaron como fallidas', fallidas)
+    return rescatadas, fallidas
+
+
+def limpiar_tareas_completadas():
+    limite = timezone.now() - timedelta(days=DIAS_RETENCION_COMPLETADAS)
+    eliminadas, _ = TareaEnCola.objects.filter(estado='completada', fecha_fin__lt=limite).delete()
+    return eliminadas
+
+
+def _esperar(segundos, detener):
+    """Duerme hasta segundos, despertando antes si detener() se vuelve verdadero"""
+    limite = time.monotonic() + segundos
+    while not detener() and time.monotonic() < limite:
+        time.sleep(min(0.5, limite - time.monotonic()))
+
+
+def procesar_cola(trabajador, detener, espera_vacia=1.0, una_vez=False):
+    """
+    Ciclo de un worker: toma y ejecuta tareas hasta que detener() sea verdadero.
+    Con una_vez=True termina cuando la cola queda vacía. Retorna las tareas procesadas.
+
+    Antes de cada vuelta se descartan las conexiones caducadas o rotas
+    (close_old_connections). Un error de la base de datos (reinicio, conexión cortada) no
+    termina el worker: se registra, se cierra la conexión y se reintenta con espera
+    creciente. Si la tarea ya estaba tomada, rescatar_tareas_abandonadas la devuelve a la
+    cola. Con una_vez=True el error se propaga.
+    """
+    procesadas = 0
+    espera_error = ESPERA_ERROR_BASE_SEGUNDOS
+    while not detener():
+        close_old_connections()
+        try:
+            tarea = tomar_tarea(trabajador)
+            if tarea is not None:
+                ejecutar_tarea(tarea)
+        except DatabaseError:
+            if una_vez:
+                raise
+            logger.exception('Error de base de datos en el worker %s; reintento en %s s', trabajador, espera_error)
+            connection.close()
+            _esperar(espera_error, detener)
+            espera_error = min(espera_error * 2, ESPERA_ERROR_MAXIMA_SEGUNDOS)
+            continue
+        espera_error = ESPERA_ERROR_BASE_SEGUNDOS
+        if tarea is None:
+            if una_vez:
+                break
+            _esperar(espera_vacia, detener)
+            continue
+        procesadas += 1
+    return procesadas
+
+
+def estadisticas_cola():
+    """
+    Profundidad de la cola por estado y latencias: antigüedad de la tarea pendiente más
+    antigua, espera promedio (creación -> inicio) y duración promedio en la última hora.
+    """
+    ahora = timezone.now()
+    por_estado = dict(
+        TareaEnCola.objects.values_list('estado').annotate(total=Count('id')).order_by()
+    )
+    mas_antigua = TareaEnCola.objects.filter(
+        estado='pendiente',
+        disponible_desde__lte=ahora
+    ).aggregate(minimo=Min('disponible_desde'))['minimo']
+    duracion = DurationField()
+    recientes = TareaEnCola.objects.filter(
+        estado='completada',
+        fecha_fin__gte=ahora - timedelta(hours=1)
+    ).aggregate(
+        cantidad=Count('id'),
+        espera=Avg(ExpressionWrapper(F('fecha_inicio') - F('fecha_creacion'), output_field=duracion)),
+        duracion=Avg(ExpressionWrapper(F('fecha_fin') - F('fecha_inicio'), output_field=duracion)),
+    )
+    return {
+        'pendientes': por_estado.get('pendiente', 0),
+        'en_proceso': por_estado.get('en_proceso', 0),
+        'completadas': por_estado.get('completada', 0),
+        'fallidas': por_estado.get('fallida', 0),
+        'antiguedad_maxima': ahora - mas_antigua if mas_antigua else None,
+        'completadas_ultima_hora': recientes['cantidad'],
+        'espera_promedio': recientes['espera'],
+        'duracion_promedio': recientes['duracion'],
+    }
+
+
+# ========== TAREAS REGISTRADAS ==========
+
+@tarea_en_cola('eliminar_archivo')
+def eliminar_archivo(ruta):
+    """Elimina un archivo del almacenamiento de medios (p. ej. una foto reemplazada)"""
+    from django.core.files.storage import default_storage
+    if ruta and default_storage.exists(ruta):
+        default_storage.delete(ruta)
+
+
+@tarea_en_cola('actualizar_resumen_diario')
+def actualizar_resumen_diario(fecha):
+    from datetime import date
+    from .reportes import actualizar_resumen_diario as actualizar
+    actualizar(date.fromisoformat(fecha))
+
+
+@tarea_en_cola('actualizar_resumen_juego')
+def actualizar_resumen_juego(juego_id, fecha):
+    from datetime import date
+    from .reportes import actualizar_resumen_juego as actualizar
+    actualizar(juego_id, date.fromisoformat(fecha))
+
+
+@tarea_en_cola('actualizar_contadores_cliente')
+def actualizar_contadores_cliente(cliente_id):
+    from .reportes import actualizar_contadores_cliente as actualizar
+    actualizar(cliente_id)
+
+
+@tarea_en_cola('actualizar_saldos_reservas')
+def actualizar_saldos_reservas(reserva_ids=None):
+    from .finanzas import actualizar_saldos_reservas as actualizar
+    actualizar(reserva_ids)
+
+
+@tarea_en_cola('geocodificar_reserva', tiempo_maximo=timedelta(minutes=5))
+def geocodificar_reserva(reserva_id):
+    from .geocodificacion import geocodificar_reserva as geocodificar
+    geocodificar(reserva_id)
+
+
+@tarea_en_cola('geocodificar_instalacion', tiempo_maximo=timedelta(minutes=5))
+def geocodificar_instalacion(instalacion_id):
+    from .geocodificacion import geocodificar_instalacion as geocodificar
+    geocodificar(instalacion_id)
+
+
+@tarea_en_cola('procesar_imagen', tiempo_maximo=timedelta(minutes=10))
+def procesar_imagen(tipo, objeto_id):
+    from .imagenes import procesar_imagen as procesar
+    procesar(tipo, objeto_id)
+
+
+@tarea_en_cola('eliminar_variantes')
+def eliminar_variantes(variantes, tipo='juego'):
+    from .imagenes import eliminar_variantes as eliminar
+    eliminar(variantes, tipo)
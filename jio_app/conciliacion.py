@@ -0,0 +1,309 @@
+"""
+Importación de cartolas bancarias (CSV) y conciliación de transferencias con pagos y reservas.
+
+Las líneas se comparan contra índices hash por (monto, palabra del apellido del cliente),
+por lo que cada línea solo revisa los candidatos con su mismo monto y alguna palabra de su
+glosa, y no todos los pagos o reservas del mismo monto. Cada candidato se valida luego por
+ventana de fechas, y los pagos conciliados se marcan como pagados con un único bulk_update.
+"""
+import csv
+import io
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .cola import encolar_al_confirmar
+from .models import Pago, Reserva
+
+VENTANA_DIAS_DEFAULT = 7
+LARGO_MINIMO_PALABRA = 3
+
+LineaCartola = namedtuple('LineaCartola', ['numero', 'fecha', 'monto', 'descripcion'])
+
+FORMATOS_FECHA = ['%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d', '%d/%m/%y']
+
+# Palabras clave para reconocer columnas (en orden de preferencia)
+COLUMNAS_FECHA = ['fecha']
+COLUMNAS_MONTO = ['abono', 'monto', 'importe', 'deposito']
+COLUMNAS_DESCRIPCION = ['glosa', 'descrip', 'detalle', 'nombre', 'origen']
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin tildes, para comparar nombres con la glosa del banco"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def _palabras(texto):
+    return {
+        palabra for palabra in re.split(r'[^a-z0-9]+', normalizar_texto(texto))
+        if len(palabra) >= LARGO_MINIMO_PALABRA
+    }
+
+
+def _parsear_monto(valor):
+    """Convierte montos como '$ 25.000', '25000' o '25.000,00' a un entero en pesos"""
+    limpio = re.sub(r'[^\d,.-]', '', valor or '')
+    if not limpio:
+        return None
+    if ',' in limpio:
+        limpio = limpio.replace('.', '').replace(',', '.')
+    elif limpio.count('.') > 1 or re.search(r'\.\d{3}$', limpio):
+        limpio = limpio.replace('.', '')
+    try:
+        return int(Decimal(limpio))
+    except InvalidOperation:
+        return None
+
+
+def _parsear_fecha(valor):
+    valor = (valor or '').strip()
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _buscar_columna(encabezados, claves):
+    for clave in claves:
+        for indice, encabezado in enumerate(encabezados):
+            if clave in encabezado:
+                return indice
+    return None
+
+
+def leer_cartola(contenido):
+    """
+    Lee una cartola CSV (separador ',' o ';') y retorna (lineas, errores).
+    Solo se consideran abonos (montos positivos).
+    """
+    if isinstance(contenido, bytes):
+        try:
+            contenido = contenido.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            contenido = contenido.decode('latin-1')
+
+    muestra = contenido[:4096]
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=';,\t')
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.reader(io.StringIO(contenido), dialecto)
+
+    errores = []
+    encabezados = [normalizar_texto(columna).strip() for columna in next(lector, [])]
+    columna_fecha = _buscar_columna(encabezados, COLUMNAS_FECHA)
+    columna_monto = _buscar_columna(encabezados, COLUMNAS_MONTO)
+    columna_descripcion = _buscar_columna(encabezados, COLUMNAS_DESCRIPCION)
+    if columna_fecha is None or columna_monto is None or columna_descripcion is None:
+        return [], ['No se reconocieron las columnas de fecha, monto y glosa en el encabezado']
+
+    lineas = []
+    for numero, fila in enumerate(lector, start=2):
+        if not any(celda.strip() for celda in fila):
+            continue
+        try:
+            fecha = _parsear_fecha(fila[columna_fecha])
+            monto = _parsear_monto(fila[columna_monto])
+            descripcion = fila[columna_descripcion]
+        except IndexError:
+            errores.append(f'Línea {numero}: cantidad de columnas inválida')
+            continue
+        if fecha is None:
+            errores.append(f'Línea {numero}: fecha inválida')
+            continue
+        if not monto or monto <= 0:
+            continue
+        lineas.append(LineaCartola(numero, fecha, monto, descripcion))
+    return lineas, errores
+
+
+def _distancia_ventana(fecha, desde, hasta):
+    if fecha < desde:
+        return (desde - fecha).days
+    if fecha > hasta:
+        return (fecha - hasta).days
+    return 0
+
+
+def _indexar(candidatos):
+    """Índice hash (monto, palabra del nombre) -> lista de candidatos"""
+    indice = defaultdict(list)
+    for candidato in candidatos:
+        for palabra in candidato['palabras']:
+            indice[(candidato['monto'], palabra)].append(candidato)
+    return indice
+
+
+def _buscar(indice, monto, palabras):
+    """Candidatos con el monto y al menos una de las palabras, sin repetir"""
+    vistos = set()
+    for palabra in palabras:
+        for candidato in indice.get((monto, palabra), ()):
+            if candidato['id'] not in vistos:
+                vistos.add(candidato['id'])
+                yield candidato
+
+
+def _candidatos_pagos():
+    for pago in Pago.objects.filter(estado__in=['pendiente', 'vencido']).values(
+        'id', 'monto', 'reserva_id', 'reserva__fecha_creacion', 'reserva__fecha_evento',
+        'reserva__cliente__usuario__first_name', 'reserva__cliente__usuario__last_name',
+    ).iterator(chunk_size=2000):
+        yield {
+            'tipo': 'pago',
+            'id': pago['id'],
+            'reserva_id': pago['reserva_id'],
+            'monto': int(pago['monto']),
+            'desde': timezone.localtime(pago['reserva__fecha_creacion']).date(),
+            'hasta': pago['reserva__fecha_evento'],
+            'palabras': _palabras(pago['reserva__cliente__usuario__last_name']) or _palabras(
+                pago['reserva__cliente__usuario__first_name']
+            ),
+        }
+
+
+def _candidatos_reservas():
+    """Reservas vigentes que aún no tienen ningún pago registrado"""
+    # El estado se guarda con mayúsculas distintas según dónde se creó la reserva
+    for reserva in Reserva.objects.filter(
+        Q(estado__iexact='pendiente') | Q(estado__iexact='confirmada'),
+        pagos__isnull=True
+    ).values(
+        'id', 'total_reserva', 'fecha_creacion', 'fecha_evento',
+        'cliente__usuario__first_name', 'cliente__usuario__last_name',
+    ).iterator(chunk_size=2000):
+        yield {
+            'tipo': 'reserva',
+            'id': reserva['id'],
+            'reserva_id': reserva['id'],
+            'monto': int(reserva['total_reserva']),
+            'desde': timezone.localtime(reserva['fecha_creacion']).date(),
+            'hasta': reserva['fecha_evento'],
+            'palabras': _palabras(reserva['cliente__usuario__last_name']) or _palabras(
+                reserva['cliente__usuario__first_name']
+            ),
+        }
+
+
+def _elegir(linea, candidatos, ventana, usados):
+    """El candidato más cercano en fechas; el índice ya garantiza monto y nombre"""
+    mejor = None
+    mejor_distancia = None
+    for candidato in candidatos:
+        if (candidato['tipo'], candidato['id']) in usados:
+            continue
+        distancia = _distancia_ventana(linea.fecha, candidato['desde'], candidato['hasta'])
+        if distancia > ventana:
+            continue
+        if mejor is None or distancia < mejor_distancia:
+            mejor, mejor_distancia = candidato, distancia
+    return mejor
+
+
+def conciliar_cartola(lineas, ventana_dias=VENTANA_DIAS_DEFAULT, aplicar=True):
+    """
+    Concilia las líneas de la cartola. Primero busca pagos pendientes o vencidos con el
+    mismo monto; si no hay, busca reservas sin pagos cuyo total coincida.
+    Con aplicar=True marca los pagos como pagados (un bulk_update) y crea los pagos
+    de las reservas conciliadas (un bulk_create), todo en una transacción. Las líneas
+    cuyo pago o reserva cambió durante la conciliación quedan sin coincidencia.
+    Retorna un diccionario con las listas 'pagos', 'reservas' y 'sin_coincidencia'.
+    """
+    indice_pagos = _indexar(_candidatos_pagos())
+    indice_reservas = _indexar(_candidatos_reservas())
+
+    usados = set()
+    conciliados_pagos = []
+    conciliados_reservas = []
+    sin_coincidencia = []
+
+    for linea in lineas:
+        palabras = _palabras(linea.descripcion)
+        candidato = _elegir(linea, _buscar(indice_pagos, linea.monto, palabras), ventana_dias, usados)
+        if candidato is None:
+            candidato = _elegir(linea, _buscar(indice_reservas, linea.monto, palabras), ventana_dias, usados)
+        if candidato is None:
+            sin_coincidencia.append(linea)
+            continue
+        usados.add((candidato['tipo'], candidato['id']))
+        if candidato['tipo'] == 'pago':
+            conciliados_pagos.append((linea, candidato))
+        else:
+            conciliados_reservas.append((linea, candidato))
+
+    if aplicar and (conciliados_pagos or conciliados_reservas):
+        ahora = timezone.now()
+        with transaction.atomic():
+            # Los candidatos se leyeron sin bloqueo: un pago pudo pagarse, cancelarse o
+            # editarse, y una reserva recibir un pago, mientras se conciliaba la cartola.
+            # Se bloquean y solo se aplican las filas que todavía cumplen las condiciones.
+            pagos_vigentes = set(Pago.objects.select_for_update().filter(
+                id__in=[candidato['id'] for _, candidato in conciliados_pagos],
+                estado__in=['pendiente', 'vencido']
+            ).values_list('id', flat=True))
+            reservas_vigentes = set(Reserva.objects.select_for_update().filter(
+                Q(estado__iexact='pendiente') | Q(estado__iexact='confirmada'),
+                ~Exists(Pago.objects.filter(reserva_id=OuterRef('pk'))),
+                id__in=[candidato['id'] for _, candidato in conciliados_reservas]
+            ).values_list('id', flat=True))
+            conciliados_pagos, descartadas_pagos = _separar_vigentes(conciliados_pagos, pagos_vigentes)
+            conciliados_reservas, descartadas_reservas = _separar_vigentes(conciliados_reservas, reservas_vigentes)
+            sin_coincidencia = sorted(
+                sin_coincidencia + descartadas_pagos + descartadas_reservas,
+                key=lambda linea: linea.numero
+            )
+
+            pagos = []
+            for linea, candidato in conciliados_pagos:
+                pago = Pago(id=candidato['id'])
+                pago.estado = 'pagado'
+                pago.fecha_pago = _fecha_pago(linea.fecha, ahora)
+                pagos.append(pago)
+            Pago.objects.bulk_update(pagos, ['estado', 'fecha_pago'], batch_size=1000)
+
+            Pago.objects.bulk_create([
+                Pago(
+                    reserva_id=candidato['reserva_id'],
+                    monto=linea.monto,
+                    metodo_pago='transferencia',
+                    estado='pagado',
+                    fecha_pago=_fecha_pago(linea.fecha, ahora),
+                    observaciones=f'Conciliado desde cartola: {linea.descripcion}'[:500],
+                )
+                for linea, candidato in conciliados_reservas
+            ], batch_size=1000)
+
+            # bulk_update y bulk_create no disparan señales: los saldos se recalculan en
+            # bloque en segundo plano
+            reserva_ids = sorted({candidato['reserva_id'] for _, candidato in conciliados_pagos + conciliados_reservas})
+            if reserva_ids:
+                encolar_al_confirmar('actualizar_saldos_reservas', reserva_ids=reserva_ids)
+
+    return {
+        'pagos': conciliados_pagos,
+        'reservas': conciliados_reservas,
+        'sin_coincidencia': sin_coincidencia,
+    }
+
+
+def _separar_vigentes(conciliados, vigentes):
+    """Separa los pares (línea, candidato) cuyo candidato sigue vigente de las líneas del resto"""
+    aplicables = [(linea, candidato) for linea, candidato in conciliados if candidato['id'] in vigentes]
+    descartadas = [linea for linea, candidato in conciliados if candidato['id'] not in vigentes]
+    return aplicables, descartadas
+
+
+def _fecha_pago(fecha, ahora):
+    """Fecha de la transferencia a mediodía local (la cartola no trae hora)"""
+    if fecha == timezone.localdate(ahora):
+        return ahora
+    return timezone.make_aware(datetime.combine(fecha, datetime.min.time()) + timedelta(hours=12))
@@ -0,0 +1,299 @@
+"""
+Exportación de reservas, pagos y repartos a CSV y XLSX en streaming.
+
+Las filas se leen con iterator(chunk_size=...) (cursores del lado del servidor en
+PostgreSQL) y se escriben por bloques, de modo que la memoria se mantiene constante y
+los primeros bytes se envían de inmediato, sin importar la cantidad de filas.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Instalacion, Pago, Reserva, Retiro
+
+TAMAÑO_LOTE = 2000
+FILAS_POR_BLOQUE = 500
+
+FORMATOS_EXPORTACION = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def _formatear_valor(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.strftime('%Y-%m-%d %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%Y-%m-%d')
+    if hasattr(valor, 'strftime'):
+        return valor.strftime('%H:%M')
+    if isinstance(valor, Decimal):
+        return int(valor) if valor == valor.to_integral_value() else float(valor)
+    return valor
+
+
+# ========== CSV ==========
+
+class _Eco:
+    """Pseudo-buffer que retorna lo escrito, para usar csv.writer sin acumular en memoria"""
+
+    def write(self, valor):
+        return valor
+
+
+def generar_csv(encabezados, filas):
+    """
+    Genera el CSV por bloques de FILAS_POR_BLOQUE filas. Usa ';' como separador y BOM
+    UTF-8 para que Excel con configuración regional chilena lo abra correctamente.
+    """
+    escritor = csv.writer(_Eco(), delimiter=';')
+    yield '\ufeff' + escritor.writerow(encabezados)
+    bloque = []
+    for fila in filas:
+        bloque.append(escritor.writerow([_formatear_valor(valor) for valor in fila]))
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            yield ''.join(bloque)
+            bloque = []
+    if bloque:
+        yield ''.join(bloque)
+
+
+# ========== XLSX ==========
+
+_CARACTERES_INVALIDOS_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _workbook_xml(nombre_hoja):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(nombre_hoja[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _letra_columna(indice):
+    letras = ''
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _fila_xml(numero, valores, columnas):
+    celdas = []
+    for columna, valor in zip(columnas, valores):
+        valor = _formatear_valor(valor)
+        if valor == '':
+            continue
+        referencia = f'{columna}{numero}'
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            celdas.append(f'<c r="{referencia}"><v>{valor}</v></c>')
+        else:
+            texto = escape(_CARACTERES_INVALIDOS_XML.sub('', str(valor)))
+            celdas.append(f'<c r="{referencia}" t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>')
+    return f'<row r="{numero}">{"".join(celdas)}</row>'
+
+
+class _BufferSalida:
+    """
+    Destino de solo escritura para zipfile: acumula los bytes comprimidos para que el
+    generador los entregue por partes (zipfile usa descriptores de datos al no poder
+    hacer seek, por lo que no necesita reescribir encabezados)
+    """
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def generar_xlsx(encabezados, filas, nombre_hoja='Datos'):
+    """
+    Genera un libro XLSX mínimo (una hoja, textos en línea) comprimiéndolo a medida que
+    se recorren las filas. No requiere dependencias externas.
+    """
+    buffer = _BufferSalida()
+    columnas = [_letra_columna(i) for i in range(len(encabezados))]
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+        libro.writestr('_rels/.rels', _RELS_XML)
+        libro.writestr('xl/workbook.xml', _workbook_xml(nombre_hoja))
+        libro.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS_XML)
+        yield buffer.vaciar()
+
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _fila_xml(1, encabezados, columnas)
+            ).encode('utf-8'))
+            bloque = []
+            for numero, fila in enumerate(filas, start=2):
+                bloque.append(_fila_xml(numero, fila, columnas))
+                if len(bloque) >= FILAS_POR_BLOQUE:
+                    hoja.write(''.join(bloque).encode('utf-8'))
+                    bloque = []
+                    datos = buffer.vaciar()
+                    if datos:
+                        yield datos
+            if bloque:
+                hoja.write(''.join(bloque).encode('utf-8'))
+            hoja.write(b'</sheetData></worksheet>')
+
+    yield buffer.vaciar()
+
+
+# ========== CONJUNTOS DE DATOS ==========
+
+def _nombre(nombre, apellido):
+    return f"{nombre or ''} {apellido or ''}".strip()
+
+
+def datos_reservas(desde, hasta):
+    """
+    Reservas con evento entre desde y hasta, una fila por detalle (juego).
+    Las reservas sin detalles aparecen una vez con las columnas del juego vacías.
+    """
+    encabezados = [
+        'ID Reserva', 'Fecha evento', 'Hora instalación', 'Hora retiro', 'Estado',
+        'Cliente', 'RUT', 'Email', 'Dirección', 'Distancia (km)', 'Precio distancia',
+        'Horas extra', 'Precio horas extra', 'Total reserva', 'Fecha creación',
+        'Juego', 'Cantidad', 'Precio unitario', 'Subtotal',
+    ]
+    consulta = Reserva.objects.filter(
+        fecha_evento__gte=desde,
+        fecha_evento__lte=hasta
+    ).order_by('fecha_evento', 'id', 'detalles__id').values_list(
+        'id', 'fecha_evento', 'hora_instalacion', 'hora_retiro', 'estado',
+        'cliente__usuario__first_name', 'cliente__usuario__last_name',
+        'cliente__rut', 'cliente__usuario__email', 'direccion_evento', 'distancia_km',
+        'precio_distancia', 'horas_extra', 'precio_horas_extra', 'total_reserva', 'fecha_creacion',
+        'detalles__juego__nombre', 'detalles__cantidad', 'detalles__precio_unitario', 'detalles__subtotal',
+    )
+
+    def filas():
+        for fila in consulta.iterator(chunk_size=TAMAÑO_LOTE):
+            yield fila[:5] + (_nombre(fila[5], fila[6]),) + fila[7:]
+
+    return encabezados, filas()
+
+
+def datos_pagos(desde, hasta):
+    """
+    Pagos con fecha_pago entre desde y hasta (o, si no tienen fecha_pago, creados en ese rango)
+    """
+    encabezados = [
+        'ID Pago', 'ID Reserva', 'Cliente', 'RUT', 'Monto', 'Método de pago',
+        'Estado', 'Fecha pago', 'Fecha creación', 'Observaciones',
+    ]
+    inicio = timezone.make_aware(datetime.combine(desde, datetime.min.time()))
+    fin = timezone.make_aware(datetime.combine(hasta, datetime.max.time()))
+    consulta = Pago.objects.filter(
+        Q(fecha_pago__gte=inicio, fecha_pago__lte=fin) |
+        Q(fecha_pago__isnull=True, fecha_creacion__gte=inicio, fecha_creacion__lte=fin)
+    ).order_by('id').values_list(
+        'id', 'reserva_id', 'reserva__cliente__usuario__first_name', 'reserva__cliente__usuario__last_name',
+        'reserva__cliente__rut', 'monto', 'metodo_pago', 'estado', 'fecha_pago', 'fecha_creacion', 'observaciones',
+    )
+
+    def filas():
+        for fila in consulta.iterator(chunk_size=TAMAÑO_LOTE):
+            yield fila[:2] + (_nombre(fila[2], fila[3]),) + fila[4:]
+
+    return encabezados, filas()
+
+
+def datos_repartos(desde, hasta):
+    """
+    Instalaciones y retiros con fecha entre desde y hasta (primero instalaciones, luego retiros)
+    """
+    encabezados = [
+        'Tipo', 'ID', 'ID Reserva', 'Fecha', 'Hora', 'Dirección', 'Estado',
+        'Repartidor', 'Cliente', 'Observaciones',
+    ]
+    instalaciones = Instalacion.objects.filter(
+        fecha_instalacion__gte=desde,
+        fecha_instalacion__lte=hasta
+    ).order_by('fecha_instalacion', 'hora_instalacion', 'id').values_list(
+        'id', 'reserva_id', 'fecha_instalacion', 'hora_instalacion', 'direccion_instalacion',
+        'estado_instalacion', 'repartidor__usuario__first_name', 'repartidor__usuario__last_name',
+        'reserva__cliente__usuario__first_name', 'reserva__cliente__usuario__last_name',
+        'observaciones_instalacion',
+    )
+    retiros = Retiro.objects.filter(
+        fecha_retiro__gte=desde,
+        fecha_retiro__lte=hasta
+    ).order_by('fecha_retiro', 'hora_retiro', 'id').values_list(
+        'id', 'reserva_id', 'fecha_retiro', 'hora_retiro', 'reserva__direccion_evento',
+        'estado_retiro', 'repartidor__usuario__first_name', 'repartidor__usuario__last_name',
+        'reserva__cliente__usuario__first_name', 'reserva__cliente__usuario__last_name',
+        'observaciones_retiro',
+    )
+
+    def filas_de(tipo, consulta):
+        for fila in consulta.iterator(chunk_size=TAMAÑO_LOTE):
+            yield (tipo,) + fila[:6] + (_nombre(fila[6], fila[7]), _nombre(fila[8], fila[9]), fila[10])
+
+    return encabezados, chain(filas_de('Instalación', instalaciones), filas_de('Retiro', retiros))
+
+
+CONJUNTOS_EXPORTACION = {
+    'reservas': datos_reservas,
+    'pagos': datos_pagos,
+    'repartos': datos_repartos,
+}
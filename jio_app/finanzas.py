@@ -0,0 +1,293 @@
+"""
+Cálculos contables: ingresos y egresos diarios, cierres mensuales (BalanceMensual)
+y saldos pendientes de las reservas
+"""
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DateField, DecimalField, Exists, F, Min, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest, TruncDay
+from django.utils import timezone
+
+from .models import BalanceMensual, Egreso, Instalacion, Pago, Reserva
+
+
+def _inicio_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, datetime.min.time()))
+
+
+def _siguiente_mes(año, mes):
+    return (año + 1, 1) if mes == 12 else (año, mes + 1)
+
+
+def _limites_mes(año, mes):
+    return date(año, mes, 1), date(año, mes, monthrange(año, mes)[1])
+
+
+def ingresos_diarios(desde, hasta):
+    """
+    Ingresos por día entre desde y hasta (inclusive).
+    Los pagos pagados se agrupan por el día de fecha_pago (TruncDay en la zona horaria
+    local) y los que no tienen fecha_pago por el día del evento de su reserva. Son dos
+    consultas, una por caso, y se suman aquí: un OR entre ambos casos cruza el join con
+    Reserva y obliga a recorrer todos los pagos pagados, mientras que cada consulta por
+    separado usa el índice compuesto Pago(estado, fecha_pago) (un rango de fechas y
+    fecha_pago IS NULL, respectivamente).
+    Retorna un diccionario {fecha: (total, cantidad_pagos)}.
+    """
+    con_fecha = Pago.objects.filter(
+        estado='pagado',
+        fecha_pago__gte=_inicio_dia(desde),
+        fecha_pago__lt=_inicio_dia(hasta + timedelta(days=1))
+    ).annotate(
+        dia_pago=TruncDay('fecha_pago', output_field=DateField())
+    ).values('dia_pago').annotate(
+        total=Sum('monto'),
+        cantidad=Count('id')
+    ).order_by()
+    sin_fecha = Pago.objects.filter(
+        estado='pagado',
+        fecha_pago__isnull=True,
+        reserva__fecha_evento__gte=desde,
+        reserva__fecha_evento__lte=hasta
+    ).values(dia_pago=F('reserva__fecha_evento')).annotate(
+        total=Sum('monto'),
+        cantidad=Count('id')
+    ).order_by()
+
+    por_dia = {}
+    for filas in (con_fecha, sin_fecha):
+        for fila in filas:
+            total, cantidad = por_dia.get(fila['dia_pago'], (Decimal('0'), 0))
+            por_dia[fila['dia_pago']] = (total + (fila['total'] or Decimal('0')), cantidad + fila['cantidad'])
+    return por_dia
+
+
+def egresos_diarios(desde, hasta):
+    """
+    Egresos por día entre desde y hasta (inclusive).
+    Retorna un diccionario {fecha: (total, cantidad_egresos)}.
+    """
+    filas = Egreso.objects.filter(
+        fecha__gte=desde,
+        fecha__lte=hasta
+    ).values('fecha').annotate(
+        total=Sum('monto'),
+        cantidad=Count('id')
+    ).order_by()
+    return {fila['fecha']: (fila['total'] or Decimal('0'), fila['cantidad']) for fila in filas}
+
+
+def _totales(por_dia):
+    total = sum((valor for valor, _ in por_dia.values()), Decimal('0'))
+    cantidad = sum(cantidad for _, cantidad in por_dia.values())
+    return total, cantidad
+
+
+def movimientos_mes(año, mes):
+    """
+    Calcula en vivo los ingresos y egresos de un mes (para el mes en curso o meses sin cierre)
+    """
+    desde, hasta = _limites_mes(año, mes)
+    ingresos, cantidad_pagos = _totales(ingresos_diarios(desde, hasta))
+    egresos, cantidad_egresos = _totales(egresos_diarios(desde, hasta))
+    return {
+        'ingresos': ingresos,
+        'egresos': egresos,
+        'cantidad_pagos': cantidad_pagos,
+        'cantidad_egresos': cantidad_egresos,
+    }
+
+
+def _saldo_anterior(año, mes):
+    anterior = BalanceMensual.objects.filter(
+        Q(año__lt=año) | Q(año=año, mes__lt=mes)
+    ).order_by('-año', '-mes').first()
+    return anterior.saldo_final if anterior else Decimal('0')
+
+
+def cerrar_mes(año, mes, hoy=None):
+    """
+    Escribe el balance inmutable de un mes ya terminado. El saldo inicial es el saldo
+    final del último cierre anterior. Si el mes ya estaba cerrado retorna el existente.
+    """
+    hoy = hoy or timezone.localdate()
+    if (año, mes) >= (hoy.year, hoy.month):
+        raise ValueError('Solo se pueden cerrar meses ya terminados')
+
+    existente = BalanceMensual.objects.filter(año=año, mes=mes).first()
+    if existente:
+        return existente
+
+    movimientos = movimientos_mes(año, mes)
+    saldo_inicial = _saldo_anterior(año, mes)
+    return BalanceMensual.objects.create(
+        año=año,
+        mes=mes,
+        saldo_inicial=saldo_inicial,
+        saldo_final=saldo_inicial + movimientos['ingresos'] - movimientos['egresos'],
+        **movimientos
+    )
+
+
+def _primer_mes_con_movimientos():
+    primer_pago = Pago.objects.filter(estado='pagado').aggregate(
+        con_fecha=Min('fecha_pago'),
+        sin_fecha=Min('reserva__fecha_evento', filter=Q(fecha_pago__isnull=True)),
+    )
+    candidatos = [
+        timezone.localtime(primer_pago['con_fecha']).date() if primer_pago['con_fecha'] else None,
+        primer_pago['sin_fecha'],
+        Egreso.objects.aggregate(primero=Min('fecha'))['primero'],
+    ]
+    candidatos = [fecha for fecha in candidatos if fecha]
+    return min(candidatos) if candidatos else None
+
+
+def cerrar_meses_pendientes(hoy=None):
+    """
+    Cierra en orden todos los meses terminados que aún no tienen balance, desde el mes
+    siguiente al último cierre (o desde el primer mes con movimientos).
+    Retorna la lista de balances creados.
+    """
+    hoy = hoy or timezone.localdate()
+    ultimo = BalanceMensual.objects.order_by('-año', '-mes').first()
+    if ultimo:
+        año, mes = _siguiente_mes(ultimo.año, ultimo.mes)
+    else:
+        primero = _primer_mes_con_movimientos()
+        if not primero:
+            return []
+        año, mes = primero.year, primero.month
+
+    creados = []
+    while (año, mes) < (hoy.year, hoy.month):
+        with transaction.atomic():
+            creados.append(cerrar_mes(año, mes, hoy=hoy))
+        año, mes = _siguiente_mes(año, mes)
+    return creados
+
+
+def resumen_balances(desde, hasta, hoy=None):
+    """
+    Resumen de un período de varios meses (desde y hasta son tuplas (año, mes)).
+    Los meses cerrados se leen de BalanceMensual; solo el mes en curso (o un mes
+    terminado aún sin cierre) se calcula en vivo.
+    Retorna un diccionario con las filas por mes y los totales del período.
+    """
+    hoy = hoy or timezone.localdate()
+    cerrados = {
+        (balance.año, balance.mes): balance
+        for balance in BalanceMensual.objects.filter(
+            Q(año__gt=desde[0]) | Q(año=desde[0], mes__gte=desde[1])
+        ).filter(
+            Q(año__lt=hasta[0]) | Q(año=hasta[0], mes__lte=hasta[1])
+        )
+    }
+
+    filas = []
+    año, mes = desde
+    saldo = None
+    while (año, mes) <= hasta and (año, mes) <= (hoy.year, hoy.month):
+        balance = cerrados.get((año, mes))
+        if balance:
+            fila = {
+                'año': año,
+                'mes': mes,
+                'saldo_inicial': balance.saldo_inicial,
+                'ingresos': balance.ingresos,
+                'egresos': balance.egresos,
+                'saldo_final': balance.saldo_final,
+                'cerrado': True,
+            }
+        else:
+            movimientos = movimientos_mes(año, mes)
+            saldo_inicial = saldo if saldo is not None else _saldo_anterior(año, mes)
+            fila = {
+                'año': año,
+                'mes': mes,
+                'saldo_inicial': saldo_inicial,
+                'ingresos': movimientos['ingresos'],
+                'egresos': movimientos['egresos'],
+                'saldo_final': saldo_inicial + movimientos['ingresos'] - movimientos['egresos'],
+                'cerrado': False,
+            }
+        saldo = fila['saldo_final']
+        filas.append(fila)
+        año, mes = _siguiente_mes(año, mes)
+
+    return {
+        'filas': filas,
+        'saldo_inicial': filas[0]['saldo_inicial'] if filas else Decimal('0'),
+        'ingresos': sum((fila['ingresos'] for fila in filas), Decimal('0')),
+        'egresos': sum((fila['egresos'] for fila in filas), Decimal('0')),
+        'saldo_final': filas[-1]['saldo_final'] if filas else Decimal('0'),
+    }
+
+
+# ========== SALDOS PENDIENTES ==========
+
+def _expresion_saldo_pendiente():
+    """
+    Saldo pendiente de cada reserva: total menos la suma de sus pagos pagados (nunca
+    negativo). Las reservas canceladas no adeudan nada, y tampoco las cobradas en la
+    entrega: marcar_reparto_realizado guarda el método de pago en la instalación
+    realizada sin crear un Pago.
+    """
+    campo = DecimalField(max_digits=10, decimal_places=2)
+    pagado = Pago.objects.filter(
+        reserva=OuterRef('pk'),
+        estado='pagado'
+    ).values('reserva').annotate(total=Sum('monto')).values('total')
+    cobrada_en_entrega = Instalacion.objects.filter(
+        reserva=OuterRef('pk'),
+        estado_instalacion='realizada',
+        metodo_pago__isnull=False
+    ).exclude(metodo_pago='')
+    return Case(
+        When(estado__iexact='cancelada', then=Value(Decimal('0'))),
+        When(Exists(cobrada_en_entrega), then=Value(Decimal('0'))),
+        default=Greatest(
+            F('total_reserva') - Coalesce(Subquery(pagado, output_field=campo), Value(Decimal('0'))),
+            Value(Decimal('0')),
+        ),
+        output_field=campo,
+    )
+
+
+def actualizar_saldos_reservas(reserva_ids=None):
+    """
+    Recalcula saldo_pendiente con un único UPDATE para las reservas indicadas
+    (o para todas si reserva_ids es None). Retorna la cantidad de filas actualizadas.
+    """
+    reservas = Reserva.objects.all()
+    if reserva_ids is not None:
+        reserva_ids = set(reserva_ids) - {None}
+        if not reserva_ids:
+            return 0
+        reservas = reservas.filter(pk__in=reserva_ids)
+    return reservas.update(saldo_pendiente=_expresion_saldo_pendiente())
+
+
+def reservas_con_deuda(orden='antiguedad', hoy=None):
+    """
+    Reservas con saldo pendiente mayor a cero (usa el índice parcial reserva_con_saldo_idx).
+    orden: 'antiguedad' (evento más antiguo primero), 'reciente' o 'saldo'.
+    """
+    hoy = hoy or timezone.localdate()
+    ordenes = {
+        'antiguedad': ['fecha_evento', 'id'],
+        'reciente': ['-fecha_evento', '-id'],
+        'saldo': ['-saldo_pendiente', 'fecha_evento'],
+    }
+    reservas = Reserva.objects.filter(saldo_pendiente__gt=0).select_related(
+        'cliente__usuario'
+    ).order_by(*ordenes.get(orden, ordenes['antiguedad']))
+    reservas = list(reservas)
+    for reserva in reservas:
+        reserva.dias_deuda = max((hoy - reserva.fecha_evento).days, 0)
+    return reservas
@@ -0,0 +1,235 @@
+"""
+Geocodificación de direcciones con caché en la base de datos (DireccionGeocodificada).
+
+El proveedor es intercambiable mediante settings.JIO_GEOCODIFICADOR (ruta a la clase):
+GeocodificadorGoogle en producción y GeocodificadorLocal para desarrollo y pruebas.
+Las direcciones se normalizan antes de buscarlas en el caché, por lo que variaciones de
+mayúsculas, tildes, espacios o abreviaturas comunes no generan consultas nuevas.
+"""
+import hashlib
+import json
+import math
+import re
+import time
+import unicodedata
+import urllib.parse
+import urllib.request
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
+
+from .models import DireccionGeocodificada, Instalacion, Reserva
+from .rutas import ORIGEN_RUTAS
+
+ABREVIATURAS = {
+    'av': 'avenida',
+    'avda': 'avenida',
+    'pje': 'pasaje',
+    'psje': 'pasaje',
+    'pob': 'poblacion',
+    'km': 'kilometro',
+    'n': '',
+    'no': '',
+    'nro': '',
+    'num': '',
+}
+
+CIUDAD_POR_DEFECTO = 'osorno'
+
+
+class ErrorGeocodificacion(Exception):
+    """Error transitorio del proveedor (cuota, red, credenciales): el resultado no se guarda"""
+
+
+def normalizar_direccion(direccion):
+    """
+    Clave del caché: minúsculas, sin tildes ni signos, abreviaturas expandidas y la
+    ciudad por defecto agregada si no aparece.
+    """
+    texto = unicodedata.normalize('NFKD', direccion or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = texto.replace('#', ' ').replace('°', ' ').replace('º', ' ')
+    palabras = []
+    for palabra in re.split(r'[^a-z0-9]+', texto):
+        if not palabra:
+            continue
+        palabra = ABREVIATURAS.get(palabra, palabra)
+        if palabra:
+            palabras.append(palabra)
+    if palabras and CIUDAD_POR_DEFECTO not in palabras:
+        palabras.append(CIUDAD_POR_DEFECTO)
+    return ' '.join(palabras)[:300]
+
+
+class GeocodificadorGoogle:
+    """Geocoding API de Google Maps (usa settings.GOOGLE_MAPS_API_KEY)"""
+    nombre = 'google'
+    URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+
+    def geocodificar(self, direccion):
+        """Retorna (lat, lng) o None si la dirección no existe"""
+        if not settings.GOOGLE_MAPS_API_KEY:
+            raise ErrorGeocodificacion('GOOGLE_MAPS_API_KEY no está configurada')
+        parametros = urllib.parse.urlencode({
+            'address': f'{direccion}, Chile' if 'chile' not in direccion.lower() else direccion,
+            'region': 'cl',
+            'components': 'country:CL',
+            'key': settings.GOOGLE_MAPS_API_KEY,
+        })
+        try:
+            with urllib.request.urlopen(f'{self.URL}?{parametros}', timeout=10) as respuesta:
+                datos = json.load(respuesta)
+        except (OSError, ValueError) as e:
+            raise ErrorGeocodificacion(f'Error consultando Google: {e}')
+
+        if datos.get('status') == 'ZERO_RESULTS':
+            return None
+        if datos.get('status') != 'OK':
+            raise ErrorGeocodificacion(f"Google respondió {datos.get('status')}: {datos.get('error_message', '')}")
+        ubicacion = datos['results'][0]['geometry']['location']
+        return ubicacion['lat'], ubicacion['lng']
+
+
+class GeocodificadorLocal:
+    """
+    Geocodificador sin red para desarrollo y pruebas. Usa el archivo JSON de
+    settings.JIO_GEOCODIFICADOR_FIXTURE si existe ({"direccion normalizada": [lat, lng]});
+    las demás direcciones reciben un punto determinístico a menos de 15 km de Osorno.
+    """
+    nombre = 'local'
+    RADIO_KM = 15
+
+    def __init__(self):
+        self.conocidas = {}
+        ruta = getattr(settings, 'JIO_GEOCODIFICADOR_FIXTURE', '')
+        if ruta:
+            with open(ruta, encoding='utf-8') as archivo:
+                self.conocidas = {
+                    normalizar_direccion(direccion): tuple(coordenadas)
+                    for direccion, coordenadas in json.load(archivo).items()
+                }
+
+    def geocodificar(self, direccion):
+        clave = normalizar_direccion(direccion)
+        if clave in self.conocidas:
+            return self.conocidas[clave]
+        resumen = hashlib.sha256(clave.encode()).digest()
+        angulo = int.from_bytes(resumen[:4], 'big') / 2**32 * 2 * math.pi
+        radio = int.from_bytes(resumen[4:8], 'big') / 2**32 * self.RADIO_KM
+        lat = ORIGEN_RUTAS[0] + radio / 111.0 * math.sin(angulo)
+        lng = ORIGEN_RUTAS[1] + radio / (111.0 * math.cos(math.radians(ORIGEN_RUTAS[0]))) * math.cos(angulo)
+        return lat, lng
+
+
+@lru_cache(maxsize=1)
+def obtener_geocodificador():
+    return import_string(settings.JIO_GEOCODIFICADOR)()
+
+
+def _coordenada(valor):
+    return Decimal(str(round(valor, 6)))
+
+
+def geocodificar(direccion, geocodificador=None):
+    """
+    Coordenadas (lat, lng) de una dirección o None si no se encontró. Primero busca en
+    el caché; solo si no está consulta al proveedor y guarda el resultado.
+    Retorna la tupla (coordenadas, consulto_proveedor).
+    """
+    clave = normalizar_direccion(direccion)
+    if not clave:
+        return None, False
+    existente = DireccionGeocodificada.objects.filter(direccion_normalizada=clave).first()
+    if existente:
+        return _resultado(existente), False
+
+    geocodificador = geocodificador or obtener_geocodificador()
+    coordenadas = geocodificador.geocodificar(direccion)
+    try:
+        with transaction.atomic():
+            registro = DireccionGeocodificada.objects.create(
+                direccion_normalizada=clave,
+                direccion_original=direccion[:300],
+                latitud=_coordenada(coordenadas[0]) if coordenadas else None,
+                longitud=_coordenada(coordenadas[1]) if coordenadas else None,
+                proveedor=geocodificador.nombre,
+            )
+    except IntegrityError:
+        # Otro proceso geocodificó la misma dirección al mismo tiempo
+        registro = DireccionGeocodificada.objects.get(direccion_normalizada=clave)
+    return _resultado(registro), True
+
+
+def _resultado(registro):
+    return (registro.latitud, registro.longitud) if registro.encontrada else None
+
+
+def geocodificar_reserva(reserva_id):
+    """Guarda las coordenadas de la dirección del evento en la reserva"""
+    direccion = Reserva.objects.filter(pk=reserva_id).values_list('direccion_evento', flat=True).first()
+    if direccion is None:
+        return
+    coordenadas, _ = geocodificar(direccion)
+    if coordenadas:
+        Reserva.objects.filter(pk=reserva_id).update(latitud=coordenadas[0], longitud=coordenadas[1])
+
+
+def geocodificar_instalacion(instalacion_id):
+    """Guarda las coordenadas de la dirección de instalación"""
+    direccion = Instalacion.objects.filter(pk=instalacion_id).values_list(
+        'direccion_instalacion', flat=True
+    ).first()
+    if direccion is None:
+        return
+    coordenadas, _ = geocodificar(direccion)
+    if coordenadas:
+        Instalacion.objects.filter(pk=instalacion_id).update(latitud=coordenadas[0], longitud=coordenadas[1])
+
+
+def _pendientes(modelo, campo_direccion, limite=None):
+    """Agrupa por dirección normalizada los ids de las filas sin coordenadas"""
+    grupos = {}
+    filas = modelo.objects.filter(latitud__isnull=True).exclude(
+        **{campo_direccion: ''}
+    ).values_list('id', campo_direccion).order_by('id')
+    for pk, direccion in filas.iterator(chunk_size=2000):
+        clave = normalizar_direccion(direccion)
+        if clave:
+            grupos.setdefault(clave, (direccion, []))[1].append(pk)
+    grupos = list(grupos.values())
+    return grupos[:limite] if limite else grupos
+
+
+def completar_coordenadas(por_segundo=5, limite=None, al_avanzar=None):
+    """
+    Geocodifica las reservas e instalaciones sin coordenadas. Cada dirección distinta se
+    resuelve una sola vez (caché) y se actualizan todas sus filas con un UPDATE. Solo las
+    consultas al proveedor cuentan para el límite de por_segundo.
+    Retorna un diccionario con las direcciones resueltas, consultas al proveedor,
+    no encontradas y filas actualizadas.
+    """
+    pausa = 1.0 / por_segundo if por_segundo else 0
+    geocodificador = obtener_geocodificador()
+    totales = {'direcciones': 0, 'consultas': 0, 'no_encontradas': 0, 'filas': 0}
+    for modelo, campo in [(Reserva, 'direccion_evento'), (Instalacion, 'direccion_instalacion')]:
+        for direccion, ids in _pendientes(modelo, campo, limite):
+            inicio = time.monotonic()
+            coordenadas, consulto = geocodificar(direccion, geocodificador)
+            totales['direcciones'] += 1
+            if coordenadas:
+                totales['filas'] += modelo.objects.filter(pk__in=ids).update(
+                    latitud=coordenadas[0], longitud=coordenadas[1]
+                )
+            else:
+                totales['no_encontradas'] += 1
+            if consulto:
+                totales['consultas'] += 1
+                espera = pausa - (time.monotonic() - inicio)
+                if espera > 0:
+                    time.sleep(espera)
+            if al_avanzar:
+                al_avanzar(totales)
+    return totales
@@ -0,0 +1,118 @@
+"""
+Historial de instalaciones y retiros (tabla EventoReparto, solo de inserción).
+
+Cada asignación, cambio de estado, entrega o incidente agrega una fila pequeña en vez
+de concatenar una línea con fecha en observaciones_instalacion / observaciones_retiro,
+que crecían sin límite y se reescribían completas en cada guardado. Los detalles de un
+reparto leen el historial por páginas, del evento más reciente al más antiguo.
+
+EventoTiempoReal sigue siendo la bandeja de salida de los paneles en vivo (se purga a
+los pocos días); este historial se conserva.
+"""
+from django.db.models import Q, Subquery
+from django.utils import timezone
+
+from .models import EventoReparto
+
+EVENTOS_POR_PAGINA = 20
+
+
+def evento_historial(tipo, tipo_reparto, reparto_id, actor=None, fecha=None, **datos):
+    """Evento sin guardar; se guarda con registrar()"""
+    return EventoReparto(
+        tipo=tipo,
+        tipo_reparto=tipo_reparto,
+        reparto_id=reparto_id,
+        actor=actor,
+        fecha=fecha or timezone.now(),
+        datos=datos,
+    )
+
+
+def evento_estado(tipo_reparto, reparto, estado_anterior, actor=None, fecha=None, **datos):
+    """Evento de cambio de estado con el estado anterior y el nuevo (y sus nombres)"""
+    campo_estado = 'estado_instalacion' if tipo_reparto == 'instalacion' else 'estado_retiro'
+    nombres = dict(reparto._meta.get_field(campo_estado).choices)
+    estado = getattr(reparto, campo_estado)
+    return evento_historial(
+        'estado', tipo_reparto, reparto.id, actor, fecha,
+        estado_anterior=estado_anterior,
+        estado_anterior_display=nombres.get(estado_anterior, estado_anterior),
+        estado=estado,
+        estado_display=nombres.get(estado, estado),
+        **datos
+    )
+
+
+def registrar(eventos):
+    """Guarda los eventos con un solo INSERT"""
+    eventos = list(eventos)
+    if not eventos:
+        return []
+    return EventoReparto.objects.bulk_create(eventos)
+
+
+# ========== LECTURA ==========
+
+def describir(evento):
+    """Texto del evento para los paneles"""
+    datos = evento.datos
+    if evento.tipo == 'asignado':
+        texto = f"Asignado a {datos.get('repartidor', '')}".strip()
+        if datos.get('automatico'):
+            texto += ' (asignación automática)'
+        return texto
+    if evento.tipo == 'estado':
+        texto = f"{datos.get('estado_anterior_display', '')} → {datos.get('estado_display', '')}"
+        if datos.get('automatico'):
+            texto += ' (automático: fuera de fecha y no realizado)'
+        return texto
+    if evento.tipo == 'realizado':
+        partes = ['Marcado como realizado']
+        if datos.get('metodo_pago_display'):
+            partes.append(f"Método de pago: {datos['metodo_pago_display']}")
+        if datos.get('comprobante_pendiente'):
+            partes.append('Comprobante de transferencia pendiente de envío')
+        if datos.get('hora_retiro'):
+            partes.append(f"Hora de retiro actualizada: {datos['hora_retiro']}")
+        if datos.get('error_hora_retiro'):
+            partes.append(datos['error_hora_retiro'])
+        return '. '.join(partes)
+    if evento.tipo == 'incidente':
+        texto = f"{datos.get('tipo_incidente', '')}: {datos.get('descripcion', '')}"
+        if datos.get('solucion'):
+            texto += f". Solución: {datos['solucion']}"
+        return texto
+    return evento.get_tipo_display()
+
+
+def datos_evento(evento):
+    actor = evento.actor
+    return {
+        'id': evento.id,
+        'tipo': evento.tipo,
+        'tipo_display': evento.get_tipo_display(),
+        'fecha': timezone.localtime(evento.fecha).strftime('%d/%m/%Y %H:%M'),
+        'actor': (actor.get_full_name() or actor.username) if actor else 'Sistema',
+        'descripcion': describir(evento),
+        'observaciones': evento.datos.get('observaciones', ''),
+        'sin_conexion': bool(evento.datos.get('sin_conexion')),
+    }
+
+
+def pagina_historial(tipo_reparto, reparto_id, antes=None, cantidad=EVENTOS_POR_PAGINA):
+    """
+    Página del historial de un reparto, del evento más reciente al más antiguo. antes es
+    el cursor retornado por la página anterior (el id de su último evento).
+    Retorna {'eventos': [...], 'siguiente': cursor de la página siguiente o None}.
+    """
+    eventos = EventoReparto.objects.filter(tipo_reparto=tipo_reparto, reparto_id=reparto_id)
+    if antes is not None:
+        # Paginación por clave (fecha, id): no se salta ni repite eventos aunque lleguen nuevos
+        referencia = Subquery(eventos.filter(id=antes).values('fecha')[:1])
+        eventos = eventos.filter(Q(fecha__lt=referencia) | Q(fecha=referencia, id__lt=antes))
+    pagina = list(eventos.select_related('actor').order_by('-fecha', '-id')[:cantidad + 1])
+    return {
+        'eventos': [datos_evento(evento) for evento in pagina[:cantidad]],
+        'siguiente': pagina[cantidad - 1].id if len(pagina) > cantidad else None,
+    }
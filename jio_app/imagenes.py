@@ -0,0 +1,212 @@
+"""
+Versiones optimizadas de las imágenes subidas (fotos de juegos y comprobantes de pago).
+
+Las vistas guardan el archivo tal como llega y los workers de la cola (run_workers)
+generan después las versiones WebP miniatura y mediana, fuera del request. También se
+quitan los metadatos EXIF del original (ubicación GPS y datos del teléfono), aplicando
+antes la rotación que indican. Los nombres llevan el hash del contenido, así que los
+archivos nunca cambian y se pueden cachear indefinidamente. Las versiones se guardan en
+el mismo almacenamiento que la imagen (los comprobantes, en el privado).
+"""
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import Instalacion, Juego
+
+# nombre de la versión: ancho máximo en píxeles
+TAMANOS = {'miniatura': 320, 'mediana': 960}
+CALIDAD_WEBP = 80
+CALIDAD_JPEG = 88
+# Formatos cuyo original se vuelve a guardar sin EXIF (MPO son las fotos JPEG de varios teléfonos)
+FORMATOS_ORIGINAL = {'JPEG': ('JPEG', '.jpg'), 'MPO': ('JPEG', '.jpg'), 'PNG': ('PNG', '.png'), 'WEBP': ('WEBP', '.webp')}
+
+# Formatos aceptados como comprobante de pago y la extensión con que se guardan
+FORMATOS_COMPROBANTE = {'JPEG': '.jpg', 'MPO': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+# tipo de imagen: (modelo, campo del archivo, campo de las versiones)
+IMAGENES = {
+    'juego': (Juego, 'foto', 'foto_variantes'),
+    'comprobante': (Instalacion, 'comprobante_pago', 'comprobante_variantes'),
+}
+
+
+def almacenamiento(tipo):
+    """Almacenamiento del campo de la imagen (y de sus versiones)"""
+    modelo, campo, _ = IMAGENES[tipo]
+    return modelo._meta.get_field(campo).storage
+
+
+def extension_comprobante(archivo):
+    """
+    Extensión que corresponde al contenido de archivo (abierto en binario) si es una
+    imagen JPEG, PNG o WebP válida, o None si no lo es. No confía en el nombre ni en el
+    tipo que informa el cliente: un SVG o HTML con nombre .jpg se rechaza.
+    """
+    posicion = archivo.tell()
+    try:
+        with Image.open(archivo) as imagen:
+            formato = imagen.format
+            imagen.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        archivo.seek(posicion)
+    return FORMATOS_COMPROBANTE.get(formato)
+
+
+def nombre_comprobante(nombre, extension):
+    """nombre con la extensión del formato detectado en vez de la que traía"""
+    base = os.path.splitext(os.path.basename(nombre or ''))[0] or 'comprobante'
+    return f'{base[:90]}{extension}'
+
+
+def _guardar(destino, ruta, contenido):
+    """Guarda el archivo si no existe (mismo hash, mismo contenido) y retorna su ruta final"""
+    if destino.exists(ruta):
+        return ruta
+    return destino.save(ruta, ContentFile(contenido))
+
+
+def _a_bytes(imagen, formato, **opciones):
+    buffer = io.BytesIO()
+    imagen.save(buffer, formato, **opciones)
+    return buffer.getvalue()
+
+
+def generar_variantes(destino, ruta):
+    """
+    Genera las versiones de la imagen guardada en ruta dentro del almacenamiento destino.
+    Retorna (variantes, ruta_original) o None si el archivo no es una imagen válida.
+    variantes es {'hash', 'ancho', 'alto', <nombre>: {'ruta', 'ancho'}} y ruta_original es
+    la del original sin EXIF (la misma ruta si no tenía metadatos que quitar).
+    """
+    with destino.open(ruta, 'rb') as archivo:
+        contenido = archivo.read()
+    resumen = hashlib.sha256(contenido).hexdigest()[:20]
+    carpeta = os.path.dirname(ruta)
+
+    try:
+        with Image.open(io.BytesIO(contenido)) as original:
+            formato = original.format
+            tiene_exif = bool(original.getexif()) or 'exif' in original.info
+            imagen = ImageOps.exif_transpose(original)
+            imagen.load()
+    except (OSError, Image.DecompressionBombError):
+        # Archivo que no es imagen o está truncado: reintentar no lo arregla
+        return None
+
+    ruta_original = ruta
+    if tiene_exif and formato in FORMATOS_ORIGINAL:
+        formato_salida, extension = FORMATOS_ORIGINAL[formato]
+        opciones = {'quality': CALIDAD_JPEG, 'optimize': True} if formato_salida == 'JPEG' else {}
+        sin_exif = imagen.convert('RGB') if formato_salida == 'JPEG' and imagen.mode != 'RGB' else imagen
+        ruta_original = _guardar(
+            destino,
+            f'{carpeta}/{resumen}{extension}',
+            _a_bytes(sin_exif, formato_salida, **opciones)
+        )
+
+    if imagen.mode not in ('RGB', 'RGBA'):
+        transparente = imagen.mode in ('LA', 'PA') or 'transparency' in imagen.info
+        imagen = imagen.convert('RGBA' if transparente else 'RGB')
+
+    variantes = {'hash': resumen, 'ancho': imagen.width, 'alto': imagen.height}
+    for nombre, ancho_maximo in TAMANOS.items():
+        copia = imagen.copy()
+        copia.thumbnail((ancho_maximo, ancho_maximo * 4), Image.LANCZOS)
+        variantes[nombre] = {
+            'ruta': _guardar(
+                destino,
+                f'{carpeta}/variantes/{resumen}-{nombre}.webp',
+                _a_bytes(copia, 'WEBP', quality=CALIDAD_WEBP, method=6)
+            ),
+            'ancho': copia.width,
+        }
+    return variantes, ruta_original
+
+
+def rutas_variantes(variantes):
+    return [variantes[nombre]['ruta'] for nombre in TAMANOS if nombre in (variantes or {})]
+
+
+def en_uso(resumen):
+    """True si alguna foto o comprobante usa las versiones con este hash"""
+    return any(
+        modelo.objects.filter(**{f'{campo_variantes}__hash': resumen}).exists()
+        for modelo, _, campo_variantes in IMAGENES.values()
+    )
+
+
+def procesar_imagen(tipo, objeto_id):
+    """
+    Genera las versiones de la imagen de un juego o comprobante y las guarda en la fila.
+    Si la imagen se reemplazó mientras se procesaba, no se toca la fila y se descartan
+    los archivos generados.
+    """
+    modelo, campo, campo_variantes = IMAGENES[tipo]
+    destino = almacenamiento(tipo)
+    ruta = modelo.objects.filter(pk=objeto_id).values_list(campo, flat=True).first()
+    if not ruta or not destino.exists(ruta):
+        return
+    resultado = generar_variantes(destino, ruta)
+    if resultado is None:
+        return
+    variantes, ruta_original = resultado
+
+    actualizados = modelo.objects.filter(pk=objeto_id, **{campo: ruta}).update(
+        **{campo: ruta_original, campo_variantes: variantes}
+    )
+    if actualizados and ruta_original != ruta:
+        # El original con EXIF ya no se usa
+        destino.delete(ruta)
+    elif not actualizados and not en_uso(variantes['hash']):
+        for sobrante in rutas_variantes(variantes) + ([ruta_original] if ruta_original != ruta else []):
+            destino.delete(sobrante)
+
+
+def encolar_pendientes():
+    """Encola el procesamiento de las fotos y comprobantes que aún no tienen versiones"""
+    from .cola import encolar
+    encoladas = 0
+    for tipo, (modelo, campo, campo_variantes) in IMAGENES.items():
+        pendientes = modelo.objects.exclude(**{f'{campo}__isnull': True}).exclude(
+            **{campo: ''}
+        ).filter(**{campo_variantes: {}}).values_list('id', flat=True)
+        for objeto_id in pendientes.iterator():
+            encolar('procesar_imagen', tipo=tipo, objeto_id=objeto_id)
+            encoladas += 1
+    return encoladas
+
+
+def eliminar_variantes(variantes, tipo='juego'):
+    """Borra las versiones de una imagen reemplazada si ninguna otra fila las usa"""
+    if variantes and not en_uso(variantes.get('hash')):
+        destino = almacenamiento(tipo)
+        for ruta in rutas_variantes(variantes):
+            destino.delete(ruta)
+
+
+# ========== URLs ==========
+
+def url_variante(variantes, nombre, tipo='juego'):
+    """URL de la versión indicada o None si todavía no se genera"""
+    variante = (variantes or {}).get(nombre)
+    return almacenamiento(tipo).url(variante['ruta']) if variante else None
+
+
+def srcset(variantes, absoluta=None, tipo='juego'):
+    """
+    Valor del atributo srcset ("url 320w, url 960w"); vacío si no hay versiones.
+    absoluta es una función para convertir las URLs (p. ej. request.build_absolute_uri).
+    """
+    partes = {}
+    for nombre in TAMANOS:
+        url = url_variante(variantes, nombre, tipo)
+        # Una imagen más angosta que los tamaños queda con versiones del mismo ancho
+        if url and variantes[nombre]['ancho'] not in partes:
+            partes[variantes[nombre]['ancho']] = absoluta(url) if absoluta else url
+    return ', '.join(f'{url} {ancho}w' for ancho, url in partes.items())
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from jio_app.repartos import cancelar_repartos_vencidos
+
+
+class Command(BaseCommand):
+    help = 'Cancela las instalaciones y retiros de días anteriores que no fueron realizados (programar una vez al día)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Cancelando repartos vencidos...'))
+        instalaciones, retiros = cancelar_repartos_vencidos()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {instalaciones} instalaciones y {retiros} retiros cancelados'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from jio_app.finanzas import cerrar_meses_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Cierra los meses terminados que aún no tienen balance mensual (saldo inicial, ingresos, egresos y saldo final)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Cerrando balances mensuales pendientes...'))
+        balances = cerrar_meses_pendientes()
+        for balance in balances:
+            self.stdout.write(f'  {balance.mes:02d}/{balance.año}: saldo final ${balance.saldo_final:,.0f}')
+        self.stdout.write(self.style.SUCCESS(f'✓ {len(balances)} meses cerrados'))
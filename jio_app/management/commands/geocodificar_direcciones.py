@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from jio_app.geocodificacion import ErrorGeocodificacion, completar_coordenadas
+
+
+class Command(BaseCommand):
+    help = 'Geocodifica las reservas e instalaciones sin coordenadas (con caché y límite de consultas por segundo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--por-segundo',
+            type=float,
+            default=5,
+            help='Máximo de consultas al proveedor por segundo (por defecto 5)'
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            help='Máximo de direcciones distintas a procesar por tipo'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Geocodificando direcciones sin coordenadas...'))
+
+        def al_avanzar(totales):
+            if totales['direcciones'] % 50 == 0:
+                self.stdout.write(f"  {totales['direcciones']} direcciones procesadas...")
+
+        try:
+            totales = completar_coordenadas(
+                por_segundo=options['por_segundo'],
+                limite=options['limite'],
+                al_avanzar=al_avanzar
+            )
+        except ErrorGeocodificacion as e:
+            raise CommandError(f'Geocodificación detenida: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {totales['direcciones']} direcciones ({totales['consultas']} consultas al proveedor, "
+            f"{totales['no_encontradas']} no encontradas), {totales['filas']} filas actualizadas"
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from jio_app.conciliacion import VENTANA_DIAS_DEFAULT, conciliar_cartola, leer_cartola
+
+
+class Command(BaseCommand):
+    help = 'Importa una cartola bancaria (CSV) y marca como pagados los pagos que coinciden por monto, fecha y nombre'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', type=str, help='Ruta del archivo CSV de la cartola')
+        parser.add_argument(
+            '--ventana',
+            type=int,
+            default=VENTANA_DIAS_DEFAULT,
+            help=f'Días de tolerancia alrededor de la reserva (por defecto {VENTANA_DIAS_DEFAULT})'
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Muestra las coincidencias sin modificar la base de datos'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                contenido = archivo.read()
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+
+        lineas, errores = leer_cartola(contenido)
+        for error in errores:
+            self.stdout.write(self.style.WARNING(error))
+        self.stdout.write(self.style.SUCCESS(f'Conciliando {len(lineas)} abonos...'))
+
+        resultado = conciliar_cartola(lineas, ventana_dias=options['ventana'], aplicar=not options['simular'])
+
+        for linea, candidato in resultado['pagos']:
+            self.stdout.write(f'  Línea {linea.numero}: ${linea.monto:,} -> Pago #{candidato["id"]}')
+        for linea, candidato in resultado['reservas']:
+            self.stdout.write(f'  Línea {linea.numero}: ${linea.monto:,} -> Reserva #{candidato["id"]} (pago nuevo)')
+        for linea in resultado['sin_coincidencia']:
+            self.stdout.write(f'  Línea {linea.numero}: ${linea.monto:,} sin coincidencia ({linea.descripcion})')
+
+        prefijo = '[simulación] ' if options['simular'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {prefijo}{len(resultado["pagos"])} pagos conciliados, '
+            f'{len(resultado["reservas"])} pagos creados, '
+            f'{len(resultado["sin_coincidencia"])} abonos sin coincidencia'
+        ))
@@ -13,32 +13,7 @@ from jio_app.models import (
     Usuario, Cliente, Juego, Reserva, DetalleReserva, 
     Instalacion, Retiro, Repartidor
 )
-
-
-def calcular_distancia_km(lat1, lon1, lat2, lon2):
-    """
-    Calcula la distancia entre dos puntos geográficos usando la fórmula de Haversine
-    Retorna la distancia en kilómetros
-    """
-    # Radio de la Tierra en kilómetros
-    R = 6371.0
-    
-    # Convertir a radianes
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    # Diferencias
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-    
-    # Fórmula de Haversine
-    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    distancia = R * c
-    return round(distancia, 1)
+from jio_app.rutas import calcular_distancia_km
 
 
 def generar_coordenadas_cerca_de_osorno(osorno_lat, osorno_lng, radio_max_km=30):
@@ -266,6 +241,8 @@ class Command(BaseCommand):
                     hora_instalacion=hora_instalacion,
                     hora_retiro=hora_retiro,
                     direccion_evento=direccion,
+                    latitud=Decimal(str(round(lat, 6))),
+                    longitud=Decimal(str(round(lng, 6))),
                     distancia_km=distancia_km,
                     precio_distancia=precio_distancia,
                     estado=estado,
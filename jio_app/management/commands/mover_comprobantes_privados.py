@@ -0,0 +1,29 @@
+from django.core.files.storage import default_storage, storages
+from django.core.management.base import BaseCommand
+
+from jio_app.imagenes import rutas_variantes
+from jio_app.models import Instalacion
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve los comprobantes de pago (y sus versiones) subidos antes de que fueran privados '
+        'desde MEDIA_ROOT al almacenamiento privado'
+    )
+
+    def handle(self, *args, **options):
+        privado = storages['privado']
+        movidos = 0
+        instalaciones = Instalacion.objects.exclude(comprobante_pago='').exclude(
+            comprobante_pago__isnull=True
+        ).values_list('comprobante_pago', 'comprobante_variantes')
+        for ruta, variantes in instalaciones.iterator():
+            for archivo in [ruta] + rutas_variantes(variantes):
+                if privado.exists(archivo) or not default_storage.exists(archivo):
+                    continue
+                with default_storage.open(archivo, 'rb') as contenido:
+                    # Se conserva la ruta: es la que está guardada en la instalación
+                    privado.save(archivo, contenido)
+                default_storage.delete(archivo)
+                movidos += 1
+        self.stdout.write(self.style.SUCCESS(f'✓ {movidos} archivos movidos al almacenamiento privado'))
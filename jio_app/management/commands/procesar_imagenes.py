@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from jio_app.imagenes import encolar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Encola la generación de versiones WebP de las fotos de juegos y comprobantes que aún no las tienen'
+
+    def handle(self, *args, **options):
+        encoladas = encolar_pendientes()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {encoladas} imágenes encoladas; las procesan los workers (python manage.py run_workers)'
+        ))
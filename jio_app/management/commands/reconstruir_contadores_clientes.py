@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from jio_app.reportes import reconstruir_contadores_clientes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores de reservas de cada cliente (primera/última reserva, cantidad y gasto total)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Reconstruyendo contadores de clientes...'))
+        total = reconstruir_contadores_clientes()
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} clientes actualizados'))
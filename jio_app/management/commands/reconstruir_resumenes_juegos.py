@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jio_app.reportes import reconstruir_resumenes_juegos
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los resúmenes diarios por juego usados por el reporte de utilización'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            type=str,
+            help='Fecha inicial (YYYY-MM-DD). Por defecto todo el historial'
+        )
+        parser.add_argument(
+            '--hasta',
+            type=str,
+            help='Fecha final (YYYY-MM-DD). Por defecto todo el historial'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            desde = datetime.strptime(options['desde'], '%Y-%m-%d').date() if options['desde'] else None
+            hasta = datetime.strptime(options['hasta'], '%Y-%m-%d').date() if options['hasta'] else None
+        except ValueError:
+            raise CommandError('Formato de fecha inválido (use YYYY-MM-DD)')
+
+        self.stdout.write(self.style.SUCCESS('Reconstruyendo resúmenes por juego...'))
+        filas = reconstruir_resumenes_juegos(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f'✓ {filas} filas (juego, día) reconstruidas'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from jio_app.finanzas import actualizar_saldos_reservas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el saldo pendiente de todas las reservas (total menos pagos pagados) con un único UPDATE'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Reconstruyendo saldos pendientes de reservas...'))
+        total = actualizar_saldos_reservas()
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} reservas actualizadas'))
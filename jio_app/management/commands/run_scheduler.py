@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection
+from django.utils import timezone
+
+from jio_app.programador import (
+    EXPRESIONES, TAREAS, ciclo_programador, ejecutar_tarea, esperar_siguiente_minuto,
+    identificador_nodo, registrar_tareas,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta las tareas periódicas (cancelación de repartos vencidos, cierres mensuales, '
+        'resúmenes, caché y limpiezas) según su programación tipo cron. Puede correr en varios '
+        'nodos: cada ejecución la toma un solo nodo mediante un bloqueo en la base de datos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Ejecuta las tareas que correspondan al minuto actual y termina (para usar desde cron)'
+        )
+        parser.add_argument(
+            '--ejecutar',
+            type=str,
+            help='Ejecuta inmediatamente la tarea indicada y termina'
+        )
+        parser.add_argument(
+            '--listar',
+            action='store_true',
+            help='Muestra las tareas registradas y su próxima ejecución'
+        )
+
+    def handle(self, *args, **options):
+        registrar_tareas()
+        nodo = identificador_nodo()
+
+        if options['listar']:
+            ahora = timezone.localtime()
+            for nombre, expresion in EXPRESIONES.items():
+                siguiente = expresion.siguiente(ahora)
+                self.stdout.write(f'  {nombre:<30} {expresion.expresion:<15} próxima: {siguiente:%d/%m/%Y %H:%M}')
+            return
+
+        if options['ejecutar']:
+            if options['ejecutar'] not in TAREAS:
+                raise CommandError(f'Tarea desconocida. Disponibles: {", ".join(TAREAS)}')
+            ejecucion = ejecutar_tarea(options['ejecutar'], nodo=nodo)
+            if ejecucion is None:
+                raise CommandError('La tarea está bloqueada por otro nodo')
+            self._informar(ejecucion)
+            return
+
+        actual = timezone.localtime().replace(second=0, microsecond=0)
+        # El minuto actual también se evalúa en el primer ciclo
+        ultimo_minuto = actual - timedelta(minutes=1)
+        if options['una_vez']:
+            ciclo_programador(ultimo_minuto, nodo, self._informar)
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Programador iniciado en {nodo} ({len(TAREAS)} tareas)'))
+        try:
+            while True:
+                # Como en run_workers: se descartan las conexiones caducadas o rotas y un
+                # error de la base de datos no detiene el programador. Los minutos del ciclo
+                # fallido se revisan de nuevo en el siguiente (hasta MAX_MINUTOS_ATRASO).
+                close_old_connections()
+                try:
+                    ultimo_minuto = ciclo_programador(ultimo_minuto, nodo, self._informar)
+                except DatabaseError as e:
+                    self.stderr.write(self.style.ERROR(f'Error de base de datos en el programador: {e}'))
+                    connection.close()
+                esperar_siguiente_minuto()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('✓ Programador detenido'))
+
+    def _informar(self, ejecucion):
+        segundos = ejecucion.duracion.total_seconds()
+        if ejecucion.exito:
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {ejecucion.tarea} ({segundos:.1f}s): {ejecucion.resultado}'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'✗ {ejecucion.tarea} falló ({segundos:.1f}s)\n{ejecucion.resultado}'
+            ))
@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Cada cuánto el proceso principal devuelve a la cola las tareas de workers caídos
+INTERVALO_RESCATE_SEGUNDOS = 60
+
+
+def _trabajar_hilo(trabajador, detener, una_vez):
+    from django.db import connection
+    from jio_app.cola import procesar_cola
+    try:
+        procesar_cola(trabajador, detener.is_set, una_vez=una_vez)
+    finally:
+        connection.close()
+
+
+def _trabajar_proceso(prefijo, hilos, detener, una_vez):
+    """Proceso worker: ejecuta la cola en varios hilos, cada uno con su propia conexión"""
+    import django
+    django.setup()
+
+    def manejar_senal(signum, frame):
+        detener.set()
+    signal.signal(signal.SIGTERM, manejar_senal)
+    signal.signal(signal.SIGINT, manejar_senal)
+
+    lista_hilos = [
+        threading.Thread(
+            target=_trabajar_hilo,
+            args=(f'{prefijo}-{indice}', detener, una_vez),
+            daemon=True
+        )
+        for indice in range(hilos)
+    ]
+    for hilo in lista_hilos:
+        hilo.start()
+    for hilo in lista_hilos:
+        hilo.join()
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los workers de la cola de tareas en segundo plano (procesos x hilos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=1, help='Cantidad de procesos (por defecto 1)')
+        parser.add_argument('--hilos', type=int, default=2, help='Hilos por proceso (por defecto 2)')
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa las tareas disponibles y termina cuando la cola queda vacía'
+        )
+
+    def handle(self, *args, **options):
+        from django.db import DatabaseError, close_old_connections, connections
+        from jio_app.cola import rescatar_tareas_abandonadas
+
+        procesos, hilos = options['procesos'], options['hilos']
+        if procesos < 1 or hilos < 1:
+            raise CommandError('--procesos y --hilos deben ser mayores que cero')
+
+        rescatadas, fallidas = rescatar_tareas_abandonadas()
+        if rescatadas:
+            self.stdout.write(self.style.WARNING(f'{rescatadas} tareas abandonadas devueltas a la cola'))
+        if fallidas:
+            self.stdout.write(self.style.WARNING(f'{fallidas} tareas abandonadas sin intentos restantes marcadas como fallidas'))
+
+        nodo = f'{socket.gethostname()}:{os.getpid()}'
+        detener = multiprocessing.Event()
+
+        def manejar_senal(signum, frame):
+            detener.set()
+        signal.signal(signal.SIGTERM, manejar_senal)
+        signal.signal(signal.SIGINT, manejar_senal)
+
+        # Las conexiones abiertas no deben heredarse a los procesos hijos
+        connections.close_all()
+        lista_procesos = [
+            multiprocessing.Process(
+                target=_trabajar_proceso,
+                args=(f'{nodo}/{indice}', hilos, detener, options['una_vez'])
+            )
+            for indice in range(procesos)
+        ]
+        for proceso in lista_procesos:
+            proceso.start()
+        self.stdout.write(self.style.SUCCESS(
+            f'Workers iniciados en {nodo}: {procesos} procesos x {hilos} hilos'
+        ))
+
+        while any(proceso.is_alive() for proceso in lista_procesos):
+            for proceso in lista_procesos:
+                proceso.join(timeout=INTERVALO_RESCATE_SEGUNDOS / len(lista_procesos))
+            if not detener.is_set() and not options['una_vez']:
+                close_old_connections()
+                try:
+                    rescatar_tareas_abandonadas()
+                except DatabaseError as e:
+                    # Se reintenta en la siguiente vuelta; los workers siguen trabajando
+                    self.stderr.write(f'No se pudieron rescatar tareas abandonadas: {e}')
+                    connections.close_all()
+        connections.close_all()
+        self.stdout.write(self.style.SUCCESS('✓ Workers detenidos'))
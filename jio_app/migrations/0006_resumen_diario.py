@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0005_agregar_campos_categoria_juego'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('total_reservas', models.PositiveIntegerField(default=0)),
+                ('total_ventas', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('clientes_distintos', models.PositiveIntegerField(default=0, help_text='Clientes distintos del día (exacto)')),
+                ('clientes_hll', models.BinaryField(blank=True, help_text='Sketch HyperLogLog de los clientes del día', null=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario',
+                'verbose_name_plural': 'Resúmenes Diarios',
+                'ordering': ['fecha'],
+            },
+        ),
+    ]
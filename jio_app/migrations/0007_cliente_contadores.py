@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:05
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def poblar_contadores(apps, schema_editor):
+    Cliente = apps.get_model('jio_app', 'Cliente')
+    Reserva = apps.get_model('jio_app', 'Reserva')
+    filas = Reserva.objects.exclude(estado__iexact='cancelada').values('cliente_id').annotate(
+        primera=Min('fecha_evento'),
+        ultima=Max('fecha_evento'),
+        total=Count('id'),
+        gasto=Sum('total_reserva'),
+    ).order_by()
+    for fila in filas:
+        Cliente.objects.filter(pk=fila['cliente_id']).update(
+            primera_reserva=fila['primera'],
+            ultima_reserva=fila['ultima'],
+            total_reservas=fila['total'],
+            gasto_total=fila['gasto'] or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0006_resumen_diario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='gasto_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='primera_reserva',
+            field=models.DateField(blank=True, help_text='Fecha del primer evento reservado', null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='total_reservas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='ultima_reserva',
+            field=models.DateField(blank=True, help_text='Fecha del último evento reservado', null=True),
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
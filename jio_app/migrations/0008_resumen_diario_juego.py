@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0007_cliente_contadores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiarioJuego',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('reservas', models.PositiveIntegerField(default=0)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('juego', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='jio_app.juego')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario por Juego',
+                'verbose_name_plural': 'Resúmenes Diarios por Juego',
+                'ordering': ['fecha', 'juego'],
+                'indexes': [models.Index(fields=['fecha', 'juego'], name='jio_app_res_fecha_739dc8_idx')],
+                'unique_together': {('juego', 'fecha')},
+            },
+        ),
+    ]
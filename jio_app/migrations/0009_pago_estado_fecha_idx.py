@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0008_resumen_diario_juego'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['estado', 'fecha_pago'], name='pago_estado_fecha_idx'),
+        ),
+    ]
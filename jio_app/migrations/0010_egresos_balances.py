@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0009_pago_estado_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('año', models.PositiveSmallIntegerField()),
+                ('mes', models.PositiveSmallIntegerField()),
+                ('saldo_inicial', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('ingresos', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('egresos', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('saldo_final', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('cantidad_pagos', models.PositiveIntegerField(default=0)),
+                ('cantidad_egresos', models.PositiveIntegerField(default=0)),
+                ('fecha_cierre', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Balance Mensual',
+                'verbose_name_plural': 'Balances Mensuales',
+                'ordering': ['año', 'mes'],
+                'unique_together': {('año', 'mes')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Egreso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categoria', models.CharField(choices=[('combustible', 'Combustible'), ('reparaciones', 'Reparaciones'), ('personal', 'Personal'), ('mantencion', 'Mantención'), ('insumos', 'Insumos'), ('otros', 'Otros')], max_length=20)),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha', models.DateField()),
+                ('descripcion', models.CharField(blank=True, max_length=300)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('registrado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='egresos_registrados', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Egreso',
+                'verbose_name_plural': 'Egresos',
+                'ordering': ['-fecha', '-fecha_creacion'],
+                'indexes': [models.Index(fields=['fecha'], name='egreso_fecha_idx')],
+            },
+        ),
+    ]
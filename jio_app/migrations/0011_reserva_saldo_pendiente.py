@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:19
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+
+def poblar_saldos(apps, schema_editor):
+    Reserva = apps.get_model('jio_app', 'Reserva')
+    Pago = apps.get_model('jio_app', 'Pago')
+    campo = models.DecimalField(max_digits=10, decimal_places=2)
+    pagado = Pago.objects.filter(
+        reserva=OuterRef('pk'),
+        estado='pagado'
+    ).values('reserva').annotate(total=Sum('monto')).values('total')
+    Reserva.objects.update(saldo_pendiente=Case(
+        When(estado__iexact='cancelada', then=Value(Decimal('0'))),
+        default=Greatest(
+            F('total_reserva') - Coalesce(Subquery(pagado, output_field=campo), Value(Decimal('0'))),
+            Value(Decimal('0')),
+        ),
+        output_field=campo,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0010_egresos_balances'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='saldo_pendiente',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Total de la reserva menos los pagos pagados (se mantiene automáticamente)', max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('saldo_pendiente__gt', 0)), fields=['fecha_evento'], name='reserva_con_saldo_idx'),
+        ),
+        migrations.RunPython(poblar_saldos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0011_reserva_saldo_pendiente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaProgramada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('bloqueado_hasta', models.DateTimeField(blank=True, null=True)),
+                ('nodo', models.CharField(blank=True, help_text='Nodo que tiene o tuvo el bloqueo', max_length=150)),
+                ('ultima_programacion', models.DateTimeField(blank=True, help_text='Minuto programado de la última ejecución (evita ejecutarlo dos veces)', null=True)),
+                ('ultima_ejecucion', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea Programada',
+                'verbose_name_plural': 'Tareas Programadas',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EjecucionTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tarea', models.CharField(max_length=100)),
+                ('nodo', models.CharField(blank=True, max_length=150)),
+                ('inicio', models.DateTimeField()),
+                ('duracion', models.DurationField(blank=True, null=True)),
+                ('exito', models.BooleanField(default=False)),
+                ('resultado', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Ejecución de Tarea',
+                'verbose_name_plural': 'Ejecuciones de Tareas',
+                'ordering': ['-inicio'],
+                'indexes': [models.Index(fields=['tarea', '-inicio'], name='ejecucion_tarea_inicio_idx')],
+            },
+        ),
+    ]
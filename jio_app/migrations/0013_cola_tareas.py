@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0012_programador_tareas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaEnCola',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=5)),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now, help_text='No se ejecuta antes de esta fecha (reintentos con espera)')),
+                ('trabajador', models.CharField(blank=True, max_length=150)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea en Cola',
+                'verbose_name_plural': 'Cola de Tareas',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(condition=models.Q(('estado', 'pendiente')), fields=['disponible_desde', 'id'], name='cola_pendientes_idx'), models.Index(fields=['estado', 'fecha_fin'], name='cola_estado_fin_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0013_cola_tareas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='latitud',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='longitud',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+    ]
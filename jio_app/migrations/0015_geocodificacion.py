@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0014_reserva_coordenadas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DireccionGeocodificada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direccion_normalizada', models.CharField(max_length=300, unique=True)),
+                ('direccion_original', models.CharField(max_length=300)),
+                ('latitud', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('longitud', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('proveedor', models.CharField(max_length=50)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Dirección Geocodificada',
+                'verbose_name_plural': 'Direcciones Geocodificadas',
+                'ordering': ['direccion_normalizada'],
+            },
+        ),
+        migrations.AddField(
+            model_name='instalacion',
+            name='latitud',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='instalacion',
+            name='longitud',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+    ]
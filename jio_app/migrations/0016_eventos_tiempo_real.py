@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0015_geocodificacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoTiempoReal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('asignado', 'Asignado'), ('desasignado', 'Desasignado'), ('estado', 'Cambio de estado'), ('incidente', 'Incidente')], max_length=20)),
+                ('tipo_reparto', models.CharField(choices=[('instalacion', 'Instalación'), ('retiro', 'Retiro')], max_length=20)),
+                ('reparto_id', models.PositiveIntegerField()),
+                ('datos', models.JSONField(blank=True, default=dict)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('repartidor', models.ForeignKey(blank=True, db_index=False, help_text='Repartidor que recibe el evento (los administradores reciben todos)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='eventos_tiempo_real', to='jio_app.repartidor')),
+            ],
+            options={
+                'verbose_name': 'Evento en Tiempo Real',
+                'verbose_name_plural': 'Eventos en Tiempo Real',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['repartidor', 'id'], name='evento_tr_repartidor_idx'), models.Index(fields=['fecha_creacion'], name='evento_tr_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0016_eventos_tiempo_real'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventotiemporeal',
+            name='tipo',
+            field=models.CharField(choices=[('asignado', 'Asignado'), ('desasignado', 'Desasignado'), ('estado', 'Cambio de estado'), ('incidente', 'Incidente'), ('modificado', 'Cambio de fecha, hora o dirección')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='AccionSincronizada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_accion', models.CharField(help_text='Identificador generado por el dispositivo', max_length=64)),
+                ('tipo', models.CharField(max_length=30)),
+                ('fecha_accion', models.DateTimeField(help_text='Momento en que se realizó la acción en el dispositivo')),
+                ('resultado', models.JSONField(blank=True, default=dict)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('repartidor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='acciones_sincronizadas', to='jio_app.repartidor')),
+            ],
+            options={
+                'verbose_name': 'Acción Sincronizada',
+                'verbose_name_plural': 'Acciones Sincronizadas',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['fecha_creacion'], name='accion_sync_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('repartidor', 'id_accion'), name='accion_sincronizada_unica')],
+            },
+        ),
+    ]
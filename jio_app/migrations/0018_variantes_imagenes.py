@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0017_sincronizacion_repartidores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instalacion',
+            name='comprobante_variantes',
+            field=models.JSONField(blank=True, default=dict, help_text='Versiones WebP del comprobante (las genera la cola de tareas)'),
+        ),
+        migrations.AddField(
+            model_name='juego',
+            name='foto_variantes',
+            field=models.JSONField(blank=True, default=dict, help_text='Versiones WebP de la foto (las genera la cola de tareas)'),
+        ),
+    ]
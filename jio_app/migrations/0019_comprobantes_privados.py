@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:52
+
+import jio_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0018_variantes_imagenes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='instalacion',
+            name='comprobante_pago',
+            field=models.ImageField(blank=True, null=True, storage=jio_app.models.almacenamiento_privado, upload_to='comprobantes/'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:55
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0019_comprobantes_privados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaComprobante',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('tipo_contenido', models.CharField(max_length=100)),
+                ('tamano', models.PositiveBigIntegerField(help_text='Tamaño total del archivo en bytes')),
+                ('recibidos', models.PositiveBigIntegerField(default=0, help_text='Bytes recibidos de forma continua desde el inicio')),
+                ('estado', models.CharField(choices=[('en_curso', 'En curso'), ('completada', 'Completada')], default='en_curso', max_length=20)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('instalacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subidas_comprobante', to='jio_app.instalacion')),
+                ('repartidor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subidas_comprobante', to='jio_app.repartidor')),
+            ],
+            options={
+                'verbose_name': 'Subida de Comprobante',
+                'verbose_name_plural': 'Subidas de Comprobantes',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['fecha_actualizacion'], name='subida_comprobante_fecha_idx')],
+            },
+        ),
+    ]
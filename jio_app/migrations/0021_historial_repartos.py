@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0020_subidas_comprobantes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoReparto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('asignado', 'Asignación'), ('estado', 'Cambio de estado'), ('realizado', 'Realizado'), ('incidente', 'Incidente')], max_length=20)),
+                ('tipo_reparto', models.CharField(choices=[('instalacion', 'Instalación'), ('retiro', 'Retiro')], max_length=20)),
+                ('reparto_id', models.PositiveIntegerField()),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, help_text='Cuándo ocurrió (la hora del dispositivo si se registró sin conexión)')),
+                ('datos', models.JSONField(blank=True, default=dict)),
+                ('actor', models.ForeignKey(blank=True, help_text='Usuario que hizo el cambio (vacío si lo hizo el sistema)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_reparto', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Evento de Reparto',
+                'verbose_name_plural': 'Eventos de Repartos',
+                'ordering': ['-fecha', '-id'],
+                'indexes': [models.Index(fields=['tipo_reparto', 'reparto_id', 'fecha'], name='evento_reparto_idx')],
+            },
+        ),
+    ]
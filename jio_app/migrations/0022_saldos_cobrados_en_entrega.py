@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:40
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def anular_saldos_cobrados(apps, schema_editor):
+    """Las reservas cobradas al instalar (método de pago en la instalación realizada) no adeudan nada"""
+    Reserva = apps.get_model('jio_app', 'Reserva')
+    Instalacion = apps.get_model('jio_app', 'Instalacion')
+    cobrada = Instalacion.objects.filter(
+        reserva=OuterRef('pk'),
+        estado_instalacion='realizada',
+        metodo_pago__isnull=False
+    ).exclude(metodo_pago='')
+    Reserva.objects.filter(Exists(cobrada), saldo_pendiente__gt=0).update(saldo_pendiente=Decimal('0'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jio_app', '0021_historial_repartos'),
+    ]
+
+    operations = [
+        migrations.RunPython(anular_saldos_cobrados, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,18 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.files.storage import storages
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from decimal import Decimal
+import uuid
 
 # Create your models here.
 
+def almacenamiento_privado():
+    """Almacenamiento de los archivos que no se publican en MEDIA_URL (comprobantes de pago)"""
+    return storages['privado']
+
+
 class Usuario(AbstractUser):
     """
     Modelo de usuario personalizado que extiende AbstractUser
@@ -48,6 +56,11 @@ class Cliente(models.Model):
         choices=TIPO_CLIENTE_CHOICES,
         default='particular'
     )
+    # Contadores desnormalizados de reservas (no canceladas), mantenidos por señales
+    primera_reserva = models.DateField(null=True, blank=True, help_text="Fecha del primer evento reservado")
+    ultima_reserva = models.DateField(null=True, blank=True, help_text="Fecha del último evento reservado")
+    total_reservas = models.PositiveIntegerField(default=0)
+    gasto_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     
     class Meta:
         verbose_name = 'Cliente'
@@ -110,6 +123,11 @@ class Juego(models.Model):
     peso_maximo = models.PositiveIntegerField(help_text="Peso máximo en kg")
     precio_base = models.PositiveIntegerField()
     foto = models.ImageField(upload_to='juegos/', blank=True, null=True, help_text="Imagen del juego inflable")
+    foto_variantes = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Versiones WebP de la foto (las genera la cola de tareas)"
+    )
     estado = models.CharField(
         max_length=20, 
         choices=ESTADO_CHOICES, 
@@ -138,6 +156,26 @@ class Juego(models.Model):
         """Devuelve las dimensiones formateadas como string para compatibilidad"""
         return f"{self.dimension_largo}m x {self.dimension_ancho}m x {self.dimension_alto}m"
     
+    @property
+    def foto_miniatura_url(self):
+        """URL de la miniatura WebP, o de la foto original mientras no se genera"""
+        from .imagenes import url_variante
+        if not self.foto:
+            return ''
+        return url_variante(self.foto_variantes, 'miniatura') or self.foto.url
+    
+    @property
+    def foto_mediana_url(self):
+        from .imagenes import url_variante
+        if not self.foto:
+            return ''
+        return url_variante(self.foto_variantes, 'mediana') or self.foto.url
+    
+    @property
+    def foto_srcset(self):
+        from .imagenes import srcset
+        return srcset(self.foto_variantes)
+    
     def __str__(self):
         return f"{self.nombre} - {self.get_categoria_display()}"
 class PrecioTemporada(models.Model):
@@ -193,11 +231,19 @@ class Reserva(models.Model):
         default='pendiente'
     )
     observaciones = models.TextField(blank=True, null=True)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     distancia_km = models.PositiveIntegerField(default=0, help_text="Kilómetros fuera de Osorno")
     precio_distancia = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Precio por distancia (km * precio por km)")
     horas_extra = models.PositiveIntegerField(default=0, help_text="Horas adicionales después de las 6 horas base")
     precio_horas_extra = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Precio por horas extra ($10.000 por hora)")
     total_reserva = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    saldo_pendiente = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        help_text="Total de la reserva menos los pagos pagados (se mantiene automáticamente)"
+    )
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
     
@@ -205,6 +251,14 @@ class Reserva(models.Model):
         verbose_name = 'Reserva'
         verbose_name_plural = 'Reservas'
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Índice parcial: solo reservas con deuda, ordenadas por antigüedad del evento
+            models.Index(
+                fields=['fecha_evento'],
+                name='reserva_con_saldo_idx',
+                condition=models.Q(saldo_pendiente__gt=0),
+            ),
+        ]
     
     def __str__(self):
         return f"Reserva #{self.id} - {self.cliente.usuario.get_full_name()} - {self.fecha_evento}"
@@ -262,10 +316,17 @@ class Instalacion(models.Model):
         default='programada'
     )
     observaciones_instalacion = models.TextField(blank=True, null=True)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     
     # Información de pago
     metodo_pago = models.CharField(max_length=20, choices=METODO_PAGO_CHOICES, blank=True, null=True)
-    comprobante_pago = models.ImageField(upload_to='comprobantes/', blank=True, null=True)
+    comprobante_pago = models.ImageField(upload_to='comprobantes/', storage=almacenamiento_privado, blank=True, null=True)
+    comprobante_variantes = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Versiones WebP del comprobante (las genera la cola de tareas)"
+    )
     
     class Meta:
         verbose_name = 'Instalación'
@@ -340,6 +401,397 @@ class Pago(models.Model):
         verbose_name = 'Pago'
         verbose_name_plural = 'Pagos'
         ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_pago'], name='pago_estado_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"Pago #{self.id} - {self.reserva} - ${self.monto}"
+
+
+class ResumenDiario(models.Model):
+    """
+    Resumen diario de ventas (rollup) usado por los reportes de estadísticas.
+    Considera solo reservas confirmadas o completadas, agrupadas por fecha_evento.
+    """
+    fecha = models.DateField(unique=True)
+    total_reservas = models.PositiveIntegerField(default=0)
+    total_ventas = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    clientes_distintos = models.PositiveIntegerField(default=0, help_text="Clientes distintos del día (exacto)")
+    clientes_hll = models.BinaryField(blank=True, null=True, help_text="Sketch HyperLogLog de los clientes del día")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Resumen Diario'
+        verbose_name_plural = 'Resúmenes Diarios'
+        ordering = ['fecha']
+    
+    def __str__(self):
+        return f"Resumen {self.fecha} - {self.total_reservas} reservas"
+
+
+class ResumenDiarioJuego(models.Model):
+    """
+    Resumen diario por juego (rollup) usado por el reporte de utilización de juegos.
+    Se mantiene desde DetalleReserva y considera solo reservas confirmadas o completadas.
+    """
+    juego = models.ForeignKey(Juego, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    fecha = models.DateField()
+    reservas = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Resumen Diario por Juego'
+        verbose_name_plural = 'Resúmenes Diarios por Juego'
+        unique_together = ['juego', 'fecha']
+        ordering = ['fecha', 'juego']
+        indexes = [
+            models.Index(fields=['fecha', 'juego']),
+        ]
+    
+    def __str__(self):
+        return f"{self.juego.nombre} {self.fecha} - {self.reservas} reservas"
+
+
+class Egreso(models.Model):
+    """
+    Egresos del negocio (combustible, reparaciones, personal, etc.)
+    """
+    CATEGORIA_CHOICES = [
+        ('combustible', 'Combustible'),
+        ('reparaciones', 'Reparaciones'),
+        ('personal', 'Personal'),
+        ('mantencion', 'Mantención'),
+        ('insumos', 'Insumos'),
+        ('otros', 'Otros'),
+    ]
+    
+    categoria = models.CharField(max_length=20, choices=CATEGORIA_CHOICES)
+    monto = models.DecimalField(max_digits=10, decimal_places=2)
+    fecha = models.DateField()
+    descripcion = models.CharField(max_length=300, blank=True)
+    registrado_por = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='egresos_registrados'
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Egreso'
+        verbose_name_plural = 'Egresos'
+        ordering = ['-fecha', '-fecha_creacion']
+        indexes = [
+            models.Index(fields=['fecha'], name='egreso_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Egreso {self.get_categoria_display()} {self.fecha} - ${self.monto}"
+
+
+class BalanceMensual(models.Model):
+    """
+    Cierre contable de un mes (inmutable): saldo inicial, ingresos, egresos y saldo final.
+    Los reportes de varios meses suman estos registros en lugar de recorrer pagos y egresos.
+    """
+    año = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField()
+    saldo_inicial = models.DecimalField(max_digits=14, decimal_places=2)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2)
+    egresos = models.DecimalField(max_digits=14, decimal_places=2)
+    saldo_final = models.DecimalField(max_digits=14, decimal_places=2)
+    cantidad_pagos = models.PositiveIntegerField(default=0)
+    cantidad_egresos = models.PositiveIntegerField(default=0)
+    fecha_cierre = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Balance Mensual'
+        verbose_name_plural = 'Balances Mensuales'
+        unique_together = ['año', 'mes']
+        ordering = ['año', 'mes']
+    
+    def __str__(self):
+        return f"Balance {self.mes:02d}/{self.año} - saldo ${self.saldo_final}"
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Los balances mensuales cerrados no se pueden modificar')
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError('Los balances mensuales cerrados no se pueden eliminar')
+
+
+class TareaProgramada(models.Model):
+    """
+    Estado de cada tarea periódica del programador (run_scheduler). La fila funciona como
+    bloqueo entre nodos: solo quien logra marcar bloqueado_hasta ejecuta la tarea.
+    """
+    nombre = models.CharField(max_length=100, unique=True)
+    bloqueado_hasta = models.DateTimeField(blank=True, null=True)
+    nodo = models.CharField(max_length=150, blank=True, help_text="Nodo que tiene o tuvo el bloqueo")
+    ultima_programacion = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Minuto programado de la última ejecución (evita ejecutarlo dos veces)"
+    )
+    ultima_ejecucion = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name = 'Tarea Programada'
+        verbose_name_plural = 'Tareas Programadas'
+        ordering = ['nombre']
+    
+    def __str__(self):
+        return self.nombre
+
+
+class EjecucionTarea(models.Model):
+    """
+    Historial de ejecuciones de las tareas programadas
+    """
+    tarea = models.CharField(max_length=100)
+    nodo = models.CharField(max_length=150, blank=True)
+    inicio = models.DateTimeField()
+    duracion = models.DurationField(blank=True, null=True)
+    exito = models.BooleanField(default=False)
+    resultado = models.TextField(blank=True)
+    
+    class Meta:
+        verbose_name = 'Ejecución de Tarea'
+        verbose_name_plural = 'Ejecuciones de Tareas'
+        ordering = ['-inicio']
+        indexes = [
+            models.Index(fields=['tarea', '-inicio'], name='ejecucion_tarea_inicio_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tarea} - {self.inicio:%d/%m/%Y %H:%M}"
+
+
+class TareaEnCola(models.Model):
+    """
+    Trabajo en segundo plano pendiente o ejecutado por los workers (comando run_workers).
+    Los workers toman las tareas con SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+    
+    nombre = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=5)
+    disponible_desde = models.DateTimeField(default=timezone.now, help_text="No se ejecuta antes de esta fecha (reintentos con espera)")
+    trabajador = models.CharField(max_length=150, blank=True)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(blank=True, null=True)
+    fecha_fin = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name = 'Tarea en Cola'
+        verbose_name_plural = 'Cola de Tareas'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(
+                fields=['disponible_desde', 'id'],
+                name='cola_pendientes_idx',
+                condition=models.Q(estado='pendiente'),
+            ),
+            models.Index(fields=['estado', 'fecha_fin'], name='cola_estado_fin_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.nombre} #{self.id} ({self.estado})"
+
+
+class DireccionGeocodificada(models.Model):
+    """
+    Caché de geocodificación: una fila por dirección normalizada, de modo que una
+    dirección repetida nunca se consulta dos veces al proveedor. También se guardan
+    las direcciones no encontradas (sin coordenadas).
+    """
+    direccion_normalizada = models.CharField(max_length=300, unique=True)
+    direccion_original = models.CharField(max_length=300)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    proveedor = models.CharField(max_length=50)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Dirección Geocodificada'
+        verbose_name_plural = 'Direcciones Geocodificadas'
+        ordering = ['direccion_normalizada']
+    
+    def __str__(self):
+        return self.direccion_original
+    
+    @property
+    def encontrada(self):
+        return self.latitud is not None and self.longitud is not None
+
+
+class EventoTiempoReal(models.Model):
+    """
+    Bandeja de salida (outbox) de eventos de repartos para los paneles en vivo (SSE).
+    Se inserta en la misma transacción que el cambio y se avisa a los streams con
+    NOTIFY, que PostgreSQL entrega al confirmar. Las filas antiguas se borran.
+    """
+    TIPO_CHOICES = [
+        ('asignado', 'Asignado'),
+        ('desasignado', 'Desasignado'),
+        ('estado', 'Cambio de estado'),
+        ('incidente', 'Incidente'),
+        ('modificado', 'Cambio de fecha, hora o dirección'),
+    ]
+    
+    TIPO_REPARTO_CHOICES = [
+        ('instalacion', 'Instalación'),
+        ('retiro', 'Retiro'),
+    ]
+    
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    tipo_reparto = models.CharField(max_length=20, choices=TIPO_REPARTO_CHOICES)
+    reparto_id = models.PositiveIntegerField()
+    repartidor = models.ForeignKey(
+        Repartidor,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='eventos_tiempo_real',
+        db_index=False,
+        help_text="Repartidor que recibe el evento (los administradores reciben todos)"
+    )
+    datos = models.JSONField(default=dict, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Evento en Tiempo Real'
+        verbose_name_plural = 'Eventos en Tiempo Real'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['repartidor', 'id'], name='evento_tr_repartidor_idx'),
+            models.Index(fields=['fecha_creacion'], name='evento_tr_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.tipo_reparto} #{self.reparto_id}"
+
+
+class AccionSincronizada(models.Model):
+    """
+    Acción enviada por la aplicación de un repartidor al sincronizar después de trabajar
+    sin conexión. El id lo genera el dispositivo: si la misma acción llega de nuevo (un
+    reintento tras perder la respuesta) se devuelve el resultado guardado sin aplicarla otra vez.
+    """
+    repartidor = models.ForeignKey(
+        Repartidor,
+        on_delete=models.CASCADE,
+        related_name='acciones_sincronizadas',
+        db_index=False
+    )
+    id_accion = models.CharField(max_length=64, help_text="Identificador generado por el dispositivo")
+    tipo = models.CharField(max_length=30)
+    fecha_accion = models.DateTimeField(help_text="Momento en que se realizó la acción en el dispositivo")
+    resultado = models.JSONField(default=dict, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Acción Sincronizada'
+        verbose_name_plural = 'Acciones Sincronizadas'
+        ordering = ['-fecha_creacion']
+        constraints = [
+            models.UniqueConstraint(fields=['repartidor', 'id_accion'], name='accion_sincronizada_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha_creacion'], name='accion_sync_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} {self.id_accion} - {self.repartidor}"
+
+
+class SubidaComprobante(models.Model):
+    """
+    Subida por partes de un comprobante de pago desde el teléfono de un repartidor. Los
+    bloques se escriben directo a un archivo temporal; si la conexión se corta, el
+    dispositivo consulta cuántos bytes llegaron y sigue desde ahí. Al confirmar, el
+    archivo se adjunta a la instalación.
+    """
+    ESTADO_CHOICES = [
+        ('en_curso', 'En curso'),
+        ('completada', 'Completada'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    instalacion = models.ForeignKey(Instalacion, on_delete=models.CASCADE, related_name='subidas_comprobante')
+    repartidor = models.ForeignKey(Repartidor, on_delete=models.CASCADE, related_name='subidas_comprobante')
+    nombre_archivo = models.CharField(max_length=255)
+    tipo_contenido = models.CharField(max_length=100)
+    tamano = models.PositiveBigIntegerField(help_text="Tamaño total del archivo en bytes")
+    recibidos = models.PositiveBigIntegerField(default=0, help_text="Bytes recibidos de forma continua desde el inicio")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='en_curso')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Subida de Comprobante'
+        verbose_name_plural = 'Subidas de Comprobantes'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['fecha_actualizacion'], name='subida_comprobante_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.recibidos}/{self.tamano}) - Instalación #{self.instalacion_id}"
+
+
+class EventoReparto(models.Model):
+    """
+    Historial de una instalación o retiro: asignaciones, cambios de estado, entregas e
+    incidentes. Solo se agregan filas (una por cambio) en vez de concatenar líneas con
+    fecha en las observaciones, y a diferencia de EventoTiempoReal no se borra.
+    """
+    TIPO_CHOICES = [
+        ('asignado', 'Asignación'),
+        ('estado', 'Cambio de estado'),
+        ('realizado', 'Realizado'),
+        ('incidente', 'Incidente'),
+    ]
+    
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    tipo_reparto = models.CharField(max_length=20, choices=EventoTiempoReal.TIPO_REPARTO_CHOICES)
+    reparto_id = models.PositiveIntegerField()
+    actor = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='eventos_reparto',
+        help_text="Usuario que hizo el cambio (vacío si lo hizo el sistema)"
+    )
+    fecha = models.DateTimeField(
+        default=timezone.now,
+        help_text="Cuándo ocurrió (la hora del dispositivo si se registró sin conexión)"
+    )
+    datos = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        verbose_name = 'Evento de Reparto'
+        verbose_name_plural = 'Eventos de Repartos'
+        ordering = ['-fecha', '-id']
+        indexes = [
+            models.Index(fields=['tipo_reparto', 'reparto_id', 'fecha'], name='evento_reparto_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.get_tipo_reparto_display()} #{self.reparto_id}"
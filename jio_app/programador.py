@@ -0,0 +1,262 @@
+"""
+Programador de tareas periódicas (comando run_scheduler).
+
+Cada tarea tiene una expresión tipo cron de 5 campos (minuto hora día mes día_semana) en
+la zona horaria local. El bloqueo entre nodos usa solo la base de datos: un UPDATE
+condicional sobre la fila TareaProgramada de la tarea, que solo tiene éxito si nadie la
+tiene bloqueada y si ese minuto programado no se ejecutó todavía.
+"""
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EjecucionTarea, TareaProgramada
+
+# Rangos válidos de cada campo cron: minuto, hora, día del mes, mes, día de la semana (0 y 7 = domingo)
+RANGOS_CRON = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+# Si el programador estuvo detenido, no se recuperan más minutos que estos
+MAX_MINUTOS_ATRASO = 60
+
+DIAS_HISTORIAL = 90
+
+
+def _parsear_campo(campo, minimo, maximo):
+    valores = set()
+    for parte in campo.split(','):
+        rango, _, paso = parte.partition('/')
+        paso = int(paso) if paso else 1
+        if rango == '*':
+            inicio, fin = minimo, maximo
+        elif '-' in rango:
+            inicio, fin = (int(valor) for valor in rango.split('-'))
+        else:
+            inicio = int(rango)
+            fin = maximo if paso > 1 else inicio
+        if paso < 1 or inicio < minimo or fin > maximo or inicio > fin:
+            raise ValueError(f'Campo cron fuera de rango: {parte}')
+        valores.update(range(inicio, fin + 1, paso))
+    return valores
+
+
+class ExpresionCron:
+    """
+    Expresión cron de 5 campos. Soporta '*', listas (1,15), rangos (1-5) y pasos (*/10).
+    Como en cron, si se restringen día del mes y día de la semana basta con que coincida uno.
+    """
+
+    def __init__(self, expresion):
+        campos = expresion.split()
+        if len(campos) != 5:
+            raise ValueError(f'La expresión cron debe tener 5 campos: {expresion!r}')
+        self.expresion = expresion
+        (self.minutos, self.horas, self.dias, self.meses, dias_semana) = (
+            _parsear_campo(campo, minimo, maximo)
+            for campo, (minimo, maximo) in zip(campos, RANGOS_CRON)
+        )
+        self.dias_semana = {dia % 7 for dia in dias_semana}
+        self._dia_libre = campos[2] == '*'
+        self._dia_semana_libre = campos[4] == '*'
+
+    def coincide(self, momento):
+        if momento.minute not in self.minutos or momento.hour not in self.horas:
+            return False
+        if momento.month not in self.meses:
+            return False
+        coincide_dia = momento.day in self.dias
+        coincide_dia_semana = (momento.weekday() + 1) % 7 in self.dias_semana
+        if self._dia_libre or self._dia_semana_libre:
+            return coincide_dia and coincide_dia_semana
+        return coincide_dia or coincide_dia_semana
+
+    def siguiente(self, desde):
+        """Próximo minuto (posterior a desde) que coincide con la expresión"""
+        momento = desde.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(60 * 24 * 366):
+            if self.coincide(momento):
+                return momento
+            momento += timedelta(minutes=1)
+        return None
+
+
+# ========== TAREAS ==========
+
+def _cancelar_repartos_vencidos():
+    from .repartos import cancelar_repartos_vencidos
+    instalaciones, retiros = cancelar_repartos_vencidos()
+    return f'{instalaciones} instalaciones y {retiros} retiros cancelados'
+
+
+def _cerrar_balances_mensuales():
+    from .finanzas import cerrar_meses_pendientes
+    return f'{len(cerrar_meses_pendientes())} meses cerrados'
+
+
+def _refrescar_resumenes():
+    """Reconstruye los resúmenes del último mes y del año siguiente (respaldo de las señales)"""
+    from .reportes import reconstruir_resumenes_diarios, reconstruir_resumenes_juegos
+    hoy = timezone.localdate()
+    desde, hasta = hoy - timedelta(days=31), hoy + timedelta(days=366)
+    dias = reconstruir_resumenes_diarios(desde, hasta)
+    filas = reconstruir_resumenes_juegos(desde, hasta)
+    return f'{dias} días y {filas} filas por juego reconstruidos'
+
+
+def _precalentar_cache():
+    """
+    Precalcula los reportes cacheados más pesados en el caché compartido (CACHES usa la
+    base de datos), de modo que los workers web los encuentran listos.
+    """
+    from .reportes import matriz_retencion_cohortes, ocupacion_anual
+    año = timezone.localdate().year
+    ocupacion_anual(año)
+    ocupacion_anual(año, por_juego=True)
+    matriz_retencion_cohortes()
+    return 'Ocupación anual y retención por cohortes precalculadas'
+
+
+def _limpiar_sesiones():
+    call_command('clearsessions')
+    return 'Sesiones expiradas eliminadas'
+
+
+def _limpiar_historial_programador():
+    limite = timezone.now() - timedelta(days=DIAS_HISTORIAL)
+    eliminadas, _ = EjecucionTarea.objects.filter(inicio__lt=limite).delete()
+    return f'{eliminadas} ejecuciones antiguas borradas del historial'
+
+
+def _limpiar_cola():
+    from .cola import limpiar_tareas_completadas
+    return f'{limpiar_tareas_completadas()} tareas completadas borradas de la cola'
+
+
+def _limpiar_eventos_tiempo_real():
+    from .tiempo_real import limpiar_eventos_antiguos
+    return f'{limpiar_eventos_antiguos()} eventos en tiempo real borrados'
+
+
+def _limpiar_acciones_sincronizadas():
+    from .sincronizacion import limpiar_acciones_antiguas
+    return f'{limpiar_acciones_antiguas()} acciones sincronizadas borradas'
+
+
+def _limpiar_subidas_abandonadas():
+    from .subidas import limpiar_subidas_abandonadas
+    return f'{limpiar_subidas_abandonadas()} subidas de comprobantes borradas'
+
+
+# nombre: (expresión cron, función, duración máxima antes de liberar el bloqueo)
+TAREAS = {
+    'cancelar_repartos_vencidos': ('5 0 * * *', _cancelar_repartos_vencidos, timedelta(minutes=30)),
+    'cerrar_balances_mensuales': ('15 0 1 * *', _cerrar_balances_mensuales, timedelta(hours=1)),
+    'refrescar_resumenes': ('30 3 * * *', _refrescar_resumenes, timedelta(hours=1)),
+    'precalentar_cache': ('*/5 * * * *', _precalentar_cache, timedelta(minutes=10)),
+    # Una limpieza por política de retención, para que el historial muestre cuál falló
+    'limpiar_sesiones': ('0 4 * * 0', _limpiar_sesiones, timedelta(hours=1)),
+    'limpiar_historial_programador': ('10 4 * * 0', _limpiar_historial_programador, timedelta(minutes=30)),
+    'limpiar_cola': ('20 4 * * 0', _limpiar_cola, timedelta(minutes=30)),
+    'limpiar_eventos_tiempo_real': ('30 4 * * *', _limpiar_eventos_tiempo_real, timedelta(minutes=30)),
+    'limpiar_acciones_sincronizadas': ('40 4 * * 0', _limpiar_acciones_sincronizadas, timedelta(minutes=30)),
+    'limpiar_subidas_abandonadas': ('50 4 * * *', _limpiar_subidas_abandonadas, timedelta(minutes=30)),
+}
+
+EXPRESIONES = {nombre: ExpresionCron(cron) for nombre, (cron, _, _) in TAREAS.items()}
+
+
+def identificador_nodo():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def registrar_tareas():
+    """Crea las filas de estado de las tareas que aún no existen"""
+    existentes = set(TareaProgramada.objects.values_list('nombre', flat=True))
+    TareaProgramada.objects.bulk_create([
+        TareaProgramada(nombre=nombre) for nombre in TAREAS if nombre not in existentes
+    ], ignore_conflicts=True)
+
+
+def _reclamar(nombre, programado, nodo, duracion_maxima):
+    """
+    Intenta tomar el bloqueo de la tarea con un UPDATE condicional.
+    Con programado=None (ejecución manual) no se verifica el minuto programado.
+    """
+    ahora = timezone.now()
+    tareas = TareaProgramada.objects.filter(nombre=nombre).filter(
+        Q(bloqueado_hasta__isnull=True) | Q(bloqueado_hasta__lt=ahora)
+    )
+    cambios = {'bloqueado_hasta': ahora + duracion_maxima, 'nodo': nodo}
+    if programado is not None:
+        tareas = tareas.filter(Q(ultima_programacion__isnull=True) | Q(ultima_programacion__lt=programado))
+        cambios['ultima_programacion'] = programado
+    return tareas.update(**cambios) == 1
+
+
+def ejecutar_tarea(nombre, programado=None, nodo=None):
+    """
+    Ejecuta una tarea si se obtiene su bloqueo y registra la ejecución en el historial.
+    Retorna la EjecucionTarea creada o None si otro nodo la tiene (o ya la ejecutó).
+    """
+    _, funcion, duracion_maxima = TAREAS[nombre]
+    nodo = nodo or identificador_nodo()
+    if not _reclamar(nombre, programado, nodo, duracion_maxima):
+        return None
+
+    inicio = timezone.now()
+    try:
+        resultado = funcion() or ''
+        exito = True
+    except Exception:
+        resultado = traceback.format_exc()
+        exito = False
+    fin = timezone.now()
+
+    TareaProgramada.objects.filter(nombre=nombre, nodo=nodo).update(
+        bloqueado_hasta=None,
+        ultima_ejecucion=fin
+    )
+    return EjecucionTarea.objects.create(
+        tarea=nombre,
+        nodo=nodo,
+        inicio=inicio,
+        duracion=fin - inicio,
+        exito=exito,
+        resultado=resultado[:5000],
+    )
+
+
+def tareas_pendientes(desde, hasta):
+    """Pares (nombre, minuto) programados en el intervalo (desde, hasta], en orden"""
+    pendientes = []
+    momento = desde.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    while momento <= hasta:
+        for nombre, expresion in EXPRESIONES.items():
+            if expresion.coincide(momento):
+                pendientes.append((nombre, momento))
+        momento += timedelta(minutes=1)
+    return pendientes
+
+
+def ciclo_programador(ultimo_minuto, nodo, al_ejecutar=None):
+    """
+    Ejecuta las tareas programadas desde ultimo_minuto (exclusive) hasta el minuto actual.
+    Retorna el minuto actual, que se usa como ultimo_minuto del siguiente ciclo.
+    """
+    actual = timezone.localtime().replace(second=0, microsecond=0)
+    ultimo_minuto = max(ultimo_minuto, actual - timedelta(minutes=MAX_MINUTOS_ATRASO))
+    for nombre, programado in tareas_pendientes(ultimo_minuto, actual):
+        ejecucion = ejecutar_tarea(nombre, programado, nodo)
+        if ejecucion and al_ejecutar:
+            al_ejecutar(ejecucion)
+    return actual
+
+
+def esperar_siguiente_minuto():
+    ahora = timezone.localtime()
+    time.sleep(60 - ahora.second - ahora.microsecond / 1_000_000 + 0.5)
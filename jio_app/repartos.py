@@ -0,0 +1,209 @@
+"""
+Operaciones en bloque sobre repartos (instalaciones y retiros)
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cola import encolar_al_confirmar
+from .historial import evento_estado, evento_historial, registrar
+from .models import Instalacion, Retiro
+from .tiempo_real import datos_reparto, evento_reparto, eventos_asignacion, publicar
+
+# tipo de reparto: (modelo, campo de estado, campo de observaciones, campo de fecha)
+MODELOS_REPARTO = {
+    'instalacion': (Instalacion, 'estado_instalacion', 'observaciones_instalacion', 'fecha_instalacion'),
+    'retiro': (Retiro, 'estado_retiro', 'observaciones_retiro', 'fecha_retiro'),
+}
+
+# Los estados de instalación van en femenino y los de retiro en masculino
+ESTADOS_RETIRO_EQUIVALENTES = {
+    'programada': 'programado',
+    'realizada': 'realizado',
+    'cancelada': 'cancelado',
+}
+ESTADOS_INSTALACION_EQUIVALENTES = {v: k for k, v in ESTADOS_RETIRO_EQUIVALENTES.items()}
+
+
+def cancelar_repartos_vencidos(hoy=None):
+    """
+    Cancela las instalaciones y retiros de días anteriores que quedaron programados o
+    pendientes, dejando constancia en su historial. Por tipo son un UPDATE en bloque y
+    un INSERT de los eventos.
+    Retorna la tupla (instalaciones_canceladas, retiros_cancelados).
+    """
+    hoy = hoy or timezone.localdate()
+    cancelados = {}
+
+    with transaction.atomic():
+        eventos = []
+        for tipo, (modelo, campo_estado, _, campo_fecha) in MODELOS_REPARTO.items():
+            estado = _estado_para_tipo(tipo, 'cancelada')
+            nombres = dict(modelo._meta.get_field(campo_estado).choices)
+            vencidos = list(modelo.objects.select_for_update().filter(**{
+                f'{campo_fecha}__lt': hoy,
+                f'{campo_estado}__in': [_estado_para_tipo(tipo, 'programada'), 'pendiente'],
+            }).values_list('id', campo_estado))
+            cancelados[tipo] = modelo.objects.filter(id__in=[pk for pk, _ in vencidos]).update(
+                **{campo_estado: estado}
+            )
+            eventos += [
+                evento_historial(
+                    'estado', tipo, pk,
+                    estado_anterior=anterior,
+                    estado_anterior_display=nombres[anterior],
+                    estado=estado,
+                    estado_display=nombres[estado],
+                    automatico=True,
+                )
+                for pk, anterior in vencidos
+            ]
+        registrar(eventos)
+    return cancelados['instalacion'], cancelados['retiro']
+
+
+def _estado_para_tipo(tipo, estado):
+    if tipo == 'retiro':
+        return ESTADOS_RETIRO_EQUIVALENTES.get(estado, estado)
+    return ESTADOS_INSTALACION_EQUIVALENTES.get(estado, estado)
+
+
+def _procesar_en_lote(items, modificar, campos, eventos, historial):
+    """
+    Aplica modificar(tipo, objeto) a cada reparto (tipo, id) de items y guarda los que no
+    tuvieron error con un bulk_update por tipo, todo en una transacción. Los repartos se
+    leen con SELECT ... FOR UPDATE para no pisar cambios concurrentes.
+    modificar retorna None si el cambio es válido o el mensaje de error; eventos(tipo,
+    objeto) retorna los eventos en tiempo real del cambio, que se publican juntos, e
+    historial(tipo, objeto) su evento del historial, que se guardan con un solo INSERT.
+    Retorna una lista con el resultado de cada ítem en el orden recibido.
+    """
+    ids_por_tipo = defaultdict(set)
+    for tipo, pk in items:
+        if tipo in MODELOS_REPARTO:
+            ids_por_tipo[tipo].add(pk)
+
+    resultados = []
+    with transaction.atomic():
+        objetos = {
+            tipo: MODELOS_REPARTO[tipo][0].objects.select_for_update().in_bulk(ids)
+            for tipo, ids in ids_por_tipo.items()
+        }
+        modificados = defaultdict(dict)
+        for tipo, pk in items:
+            resultado = {'tipo': tipo, 'id': pk, 'success': False}
+            objeto = objetos.get(tipo, {}).get(pk)
+            if tipo not in MODELOS_REPARTO:
+                resultado['error'] = 'Tipo de reparto inválido'
+            elif objeto is None:
+                resultado['error'] = 'Reparto no encontrado'
+            else:
+                error = modificar(tipo, objeto)
+                if error:
+                    resultado['error'] = error
+                else:
+                    resultado['success'] = True
+                    modificados[tipo][pk] = objeto
+            resultados.append(resultado)
+
+        for tipo, por_id in modificados.items():
+            MODELOS_REPARTO[tipo][0].objects.bulk_update(por_id.values(), campos(tipo))
+        registrar(
+            historial(tipo, objeto)
+            for tipo, por_id in modificados.items()
+            for objeto in por_id.values()
+        )
+        publicar(
+            evento
+            for tipo, por_id in modificados.items()
+            for objeto in por_id.values()
+            for evento in eventos(tipo, objeto)
+        )
+    return resultados
+
+
+def asignar_repartidor_en_lote(items, repartidor, observaciones='', actor=None):
+    """
+    Asigna el repartidor a varios repartos (lista de pares (tipo, id)) en una transacción.
+    Los repartos realizados o cancelados no se reasignan. Las observaciones quedan en el
+    evento de asignación del historial, hecho por actor (el usuario que asigna).
+    Retorna el resultado de cada ítem ('tipo', 'id', 'success' y 'error' si falló).
+    """
+    anteriores = {}
+
+    def modificar(tipo, objeto):
+        _, campo_estado, _, _ = MODELOS_REPARTO[tipo]
+        if getattr(objeto, campo_estado) in ('realizada', 'realizado', 'cancelada', 'cancelado'):
+            return f'No se puede asignar un reparto en estado {getattr(objeto, f"get_{campo_estado}_display")().lower()}'
+        anteriores[(tipo, objeto.id)] = objeto.repartidor_id
+        objeto.repartidor = repartidor
+        return None
+
+    nombre = repartidor.usuario.get_full_name()
+    return _procesar_en_lote(
+        items,
+        modificar,
+        lambda tipo: ['repartidor'],
+        lambda tipo, objeto: eventos_asignacion(tipo, objeto, anteriores[(tipo, objeto.id)], nombre),
+        lambda tipo, objeto: evento_historial(
+            'asignado', tipo, objeto.id, actor, repartidor=nombre, observaciones=observaciones
+        )
+    )
+
+
+def cambiar_estado_en_lote(items, nuevo_estado, observaciones='', hoy=None, repartidor=None,
+                           actor=None, fecha=None, sin_conexion=False):
+    """
+    Cambia el estado de varios repartos (lista de pares (tipo, id)) en una transacción.
+    nuevo_estado puede venir en el vocabulario de instalaciones o de retiros ('realizada'
+    o 'realizado'); se traduce al de cada tipo. Como en el cambio individual, solo se
+    puede marcar como realizado el día agendado.
+    Si se indica repartidor, solo se cambian los repartos asignados a él.
+    Cada cambio queda en el historial con las observaciones, el actor y la fecha (la del
+    dispositivo si la acción se hizo sin conexión).
+    Retorna el resultado de cada ítem ('tipo', 'id', 'success' y 'error' si falló).
+    """
+    hoy = hoy or timezone.localdate()
+    anteriores = {}
+
+    def modificar(tipo, objeto):
+        modelo, campo_estado, _, campo_fecha = MODELOS_REPARTO[tipo]
+        if repartidor is not None and objeto.repartidor_id != repartidor.id:
+            return 'No autorizado para actualizar este reparto'
+        estado = _estado_para_tipo(tipo, nuevo_estado)
+        if estado not in dict(modelo._meta.get_field(campo_estado).choices):
+            return 'Estado inválido'
+        fecha = getattr(objeto, campo_fecha)
+        if estado in ('realizada', 'realizado') and fecha != hoy:
+            return (
+                f'Solo se puede marcar como realizado el día agendado ({fecha.strftime("%d/%m/%Y")}). '
+                f'Hoy es {hoy.strftime("%d/%m/%Y")}'
+            )
+        anteriores[(tipo, objeto.id)] = getattr(objeto, campo_estado)
+        setattr(objeto, campo_estado, estado)
+        return None
+
+    extra = {'observaciones': observaciones} if observaciones else {}
+    if sin_conexion:
+        extra['sin_conexion'] = True
+    resultados = _procesar_en_lote(
+        items,
+        modificar,
+        lambda tipo: [MODELOS_REPARTO[tipo][1]],
+        lambda tipo, objeto: [
+            evento_reparto('estado', tipo, objeto.id, objeto.repartidor_id, **datos_reparto(tipo, objeto))
+        ],
+        lambda tipo, objeto: evento_estado(tipo, objeto, anteriores[(tipo, objeto.id)], actor, fecha, **extra)
+    )
+    # bulk_update no dispara señales: una instalación cobrada que sale (o vuelve a) de
+    # realizada cambia el saldo de su reserva, que se recalcula en segundo plano
+    instalaciones = [r['id'] for r in resultados if r['success'] and r['tipo'] == 'instalacion']
+    reservas = sorted(set(
+        Instalacion.objects.filter(id__in=instalaciones, metodo_pago__isnull=False).values_list(
+            'reserva_id', flat=True
+        )
+    )) if instalaciones else []
+    if reservas:
+        encolar_al_confirmar('actualizar_saldos_reservas', reserva_ids=reservas)
+    return resultados
@@ -0,0 +1,637 @@
+"""
+Utilidades de cálculo para los reportes y estadísticas del panel administrativo
+"""
+import base64
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+
+from .hyperloglog import ERROR_ESTANDAR, HyperLogLog, combinar_sketches
+from .models import Cliente, DetalleReserva, Juego, Reserva, ResumenDiario, ResumenDiarioJuego
+
+# Límites para la cantidad de puntos que se envían a los gráficos
+PUNTOS_SERIE_DEFAULT = 180
+PUNTOS_SERIE_MINIMO = 10
+PUNTOS_SERIE_MAXIMO = 500
+
+
+def normalizar_puntos_objetivo(valor, default=PUNTOS_SERIE_DEFAULT):
+    """
+    Convierte el parámetro de puntos objetivo a entero dentro de los límites permitidos
+    """
+    try:
+        puntos = int(valor)
+    except (ValueError, TypeError):
+        return default
+    return max(PUNTOS_SERIE_MINIMO, min(PUNTOS_SERIE_MAXIMO, puntos))
+
+
+def reducir_serie_lttb(etiquetas, valores, puntos_objetivo):
+    """
+    Reduce una serie al número de puntos objetivo usando Largest-Triangle-Three-Buckets.
+    Conserva el primer y último punto y, en cada bucket, el punto que forma el
+    triángulo de mayor área con sus vecinos, por lo que los peaks se mantienen visibles.
+    Retorna una tupla (etiquetas, valores) reducida.
+    """
+    total = len(valores)
+    if puntos_objetivo >= total or puntos_objetivo < 3:
+        return list(etiquetas), list(valores)
+
+    indices = [0]
+    tamaño_bucket = (total - 2) / (puntos_objetivo - 2)
+    a = 0
+
+    for i in range(puntos_objetivo - 2):
+        # Promedio del bucket siguiente (punto C del triángulo)
+        inicio_siguiente = int((i + 1) * tamaño_bucket) + 1
+        fin_siguiente = min(int((i + 2) * tamaño_bucket) + 1, total)
+        largo_siguiente = max(fin_siguiente - inicio_siguiente, 1)
+        x_promedio = sum(range(inicio_siguiente, fin_siguiente)) / largo_siguiente
+        y_promedio = sum(valores[inicio_siguiente:fin_siguiente]) / largo_siguiente
+
+        # Punto del bucket actual que maximiza el área con A y C
+        inicio_actual = int(i * tamaño_bucket) + 1
+        fin_actual = int((i + 1) * tamaño_bucket) + 1
+        x_a, y_a = a, valores[a]
+        mayor_area = -1.0
+        elegido = inicio_actual
+        for j in range(inicio_actual, fin_actual):
+            area = abs(
+                (x_a - x_promedio) * (valores[j] - y_a)
+                - (x_a - j) * (y_promedio - y_a)
+            )
+            if area > mayor_area:
+                mayor_area = area
+                elegido = j
+
+        indices.append(elegido)
+        a = elegido
+
+    indices.append(total - 1)
+    return [etiquetas[i] for i in indices], [valores[i] for i in indices]
+
+
+def reducir_serie_minmax(etiquetas, valores, puntos_objetivo):
+    """
+    Reduce una serie conservando el mínimo y el máximo de cada bucket.
+    Produce como máximo puntos_objetivo puntos, en orden cronológico.
+    """
+    total = len(valores)
+    if puntos_objetivo >= total or puntos_objetivo < 2:
+        return list(etiquetas), list(valores)
+
+    cantidad_buckets = max(puntos_objetivo // 2, 1)
+    tamaño_bucket = total / cantidad_buckets
+    indices = []
+
+    for i in range(cantidad_buckets):
+        inicio = int(i * tamaño_bucket)
+        fin = min(int((i + 1) * tamaño_bucket), total)
+        if inicio >= fin:
+            continue
+        bucket = range(inicio, fin)
+        idx_min = min(bucket, key=lambda j: valores[j])
+        idx_max = max(bucket, key=lambda j: valores[j])
+        indices.extend(sorted({idx_min, idx_max}))
+
+    return [etiquetas[i] for i in indices], [valores[i] for i in indices]
+
+
+METODOS_REDUCCION = {
+    'lttb': reducir_serie_lttb,
+    'minmax': reducir_serie_minmax,
+}
+
+
+def reducir_serie(etiquetas, valores, puntos_objetivo, metodo='lttb'):
+    """
+    Aplica el método de reducción indicado ('lttb' o 'minmax') a una serie
+    """
+    funcion = METODOS_REDUCCION.get(metodo, reducir_serie_lttb)
+    return funcion(etiquetas, valores, puntos_objetivo)
+
+
+# ========== RESÚMENES DIARIOS (ROLLUPS) ==========
+
+def filtro_reservas_vendidas(prefijo=''):
+    """
+    Filtro de reservas que cuentan como venta (confirmadas o completadas).
+    prefijo permite aplicarlo desde modelos relacionados (por ejemplo 'reserva__').
+    """
+    return Q(**{f'{prefijo}estado__iexact': 'Confirmada'}) | Q(**{f'{prefijo}estado__iexact': 'completada'})
+
+
+def _datos_resumen(filas):
+    total_reservas = 0
+    total_ventas = Decimal('0')
+    clientes = set()
+    for cliente_id, total_reserva in filas:
+        total_reservas += 1
+        total_ventas += total_reserva or 0
+        clientes.add(cliente_id)
+    return {
+        'total_reservas': total_reservas,
+        'total_ventas': total_ventas,
+        'clientes_distintos': len(clientes),
+        'clientes_hll': HyperLogLog.desde_valores(clientes).to_bytes(),
+    }
+
+
+def actualizar_resumen_diario(fecha):
+    """
+    Recalcula el resumen de un día a partir de sus reservas.
+    Solo lee las reservas de esa fecha, por lo que el costo no depende del historial.
+    """
+    filas = Reserva.objects.filter(
+        filtro_reservas_vendidas(),
+        fecha_evento=fecha
+    ).values_list('cliente_id', 'total_reserva')
+    datos = _datos_resumen(filas)
+    if datos['total_reservas'] == 0:
+        ResumenDiario.objects.filter(fecha=fecha).delete()
+        return None
+    resumen, _ = ResumenDiario.objects.update_or_create(fecha=fecha, defaults=datos)
+    return resumen
+
+
+def reconstruir_resumenes_diarios(desde=None, hasta=None):
+    """
+    Reconstruye en bloque los resúmenes diarios del rango indicado (o de todo el historial).
+    Retorna la cantidad de días escritos.
+    """
+    reservas = Reserva.objects.filter(filtro_reservas_vendidas())
+    existentes = ResumenDiario.objects.all()
+    if desde:
+        reservas = reservas.filter(fecha_evento__gte=desde)
+        existentes = existentes.filter(fecha__gte=desde)
+    if hasta:
+        reservas = reservas.filter(fecha_evento__lte=hasta)
+        existentes = existentes.filter(fecha__lte=hasta)
+
+    filas_por_dia = defaultdict(list)
+    for fecha, cliente_id, total_reserva in reservas.values_list(
+        'fecha_evento', 'cliente_id', 'total_reserva'
+    ).order_by().iterator(chunk_size=5000):
+        filas_por_dia[fecha].append((cliente_id, total_reserva))
+
+    resumenes = [
+        ResumenDiario(fecha=fecha, **_datos_resumen(filas))
+        for fecha, filas in filas_por_dia.items()
+    ]
+    with transaction.atomic():
+        existentes.delete()
+        ResumenDiario.objects.bulk_create(resumenes, batch_size=1000)
+    return len(resumenes)
+
+
+def contar_clientes_distintos(desde, hasta, exacto=False):
+    """
+    Cuenta los clientes distintos con reservas vendidas entre desde y hasta (inclusive).
+    Por defecto une los sketches HyperLogLog de los resúmenes diarios: el costo depende
+    solo de la cantidad de días del rango y el error estándar relativo es ERROR_ESTANDAR.
+    Con exacto=True ejecuta COUNT(DISTINCT cliente_id) sobre las reservas.
+    Retorna una tupla (cantidad, error_relativo).
+    """
+    if exacto:
+        cantidad = Reserva.objects.filter(
+            filtro_reservas_vendidas(),
+            fecha_evento__gte=desde,
+            fecha_evento__lte=hasta
+        ).values('cliente_id').distinct().count()
+        return cantidad, 0.0
+
+    sketches = ResumenDiario.objects.filter(
+        fecha__gte=desde,
+        fecha__lte=hasta
+    ).values_list('clientes_hll', flat=True)
+    return combinar_sketches(sketches).estimar(), ERROR_ESTANDAR
+
+
+# ========== RESÚMENES DIARIOS POR JUEGO ==========
+
+def actualizar_resumen_juego(juego_id, fecha):
+    """
+    Recalcula el resumen de un juego en un día a partir de sus detalles de reserva vendidos.
+    Solo lee los detalles de ese juego y fecha.
+    """
+    datos = DetalleReserva.objects.filter(
+        filtro_reservas_vendidas('reserva__'),
+        juego_id=juego_id,
+        reserva__fecha_evento=fecha,
+    ).aggregate(reservas=Count('id'), unidades=Sum('cantidad'), ingresos=Sum('subtotal'))
+    if not datos['reservas']:
+        ResumenDiarioJuego.objects.filter(juego_id=juego_id, fecha=fecha).delete()
+        return None
+    resumen, _ = ResumenDiarioJuego.objects.update_or_create(
+        juego_id=juego_id,
+        fecha=fecha,
+        defaults={
+            'reservas': datos['reservas'],
+            'unidades': datos['unidades'] or 0,
+            'ingresos': datos['ingresos'] or Decimal('0'),
+        }
+    )
+    return resumen
+
+
+def reconstruir_resumenes_juegos(desde=None, hasta=None):
+    """
+    Reconstruye en bloque los resúmenes por juego del rango indicado (o de todo el historial)
+    con una sola consulta agrupada. Retorna la cantidad de filas escritas.
+    """
+    detalles = DetalleReserva.objects.filter(filtro_reservas_vendidas('reserva__'))
+    existentes = ResumenDiarioJuego.objects.all()
+    if desde:
+        detalles = detalles.filter(reserva__fecha_evento__gte=desde)
+        existentes = existentes.filter(fecha__gte=desde)
+    if hasta:
+        detalles = detalles.filter(reserva__fecha_evento__lte=hasta)
+        existentes = existentes.filter(fecha__lte=hasta)
+
+    filas = detalles.values('juego_id', 'reserva__fecha_evento').annotate(
+        total=Count('id'), total_unidades=Sum('cantidad'), total_ingresos=Sum('subtotal')
+    ).order_by()
+    resumenes = [
+        ResumenDiarioJuego(
+            juego_id=fila['juego_id'],
+            fecha=fila['reserva__fecha_evento'],
+            reservas=fila['total'],
+            unidades=fila['total_unidades'] or 0,
+            ingresos=fila['total_ingresos'] or Decimal('0'),
+        )
+        for fila in filas.iterator(chunk_size=5000)
+    ]
+    with transaction.atomic():
+        existentes.delete()
+        ResumenDiarioJuego.objects.bulk_create(resumenes, batch_size=1000)
+    return len(resumenes)
+
+
+def reporte_utilizacion_juegos(desde, hasta, orden='utilizacion'):
+    """
+    Ranking de juegos por utilización (días reservados / días del período) e ingresos
+    entre desde y hasta, leído desde los resúmenes diarios por juego en una sola consulta.
+    orden puede ser 'utilizacion' o 'ingresos'.
+    """
+    dias_periodo = (hasta - desde).days + 1
+    en_rango = Q(resumenes_diarios__fecha__gte=desde, resumenes_diarios__fecha__lte=hasta)
+    juegos = Juego.objects.annotate(
+        dias_reservados=Count('resumenes_diarios', filter=en_rango),
+        unidades=Sum('resumenes_diarios__unidades', filter=en_rango),
+        ingresos=Sum('resumenes_diarios__ingresos', filter=en_rango),
+    ).values('id', 'nombre', 'categoria', 'estado', 'dias_reservados', 'unidades', 'ingresos')
+
+    filas = []
+    for juego in juegos:
+        ingresos = juego['ingresos'] or Decimal('0')
+        filas.append({
+            **juego,
+            'unidades': juego['unidades'] or 0,
+            'ingresos': ingresos,
+            'dias_periodo': dias_periodo,
+            'utilizacion': round(juego['dias_reservados'] * 100.0 / dias_periodo, 1),
+            'ingreso_por_dia': ingresos / juego['dias_reservados'] if juego['dias_reservados'] else Decimal('0'),
+        })
+
+    clave = 'ingresos' if orden == 'ingresos' else 'utilizacion'
+    filas.sort(key=lambda fila: (fila[clave], fila['ingresos']), reverse=True)
+    return filas
+
+
+# ========== CONTADORES POR CLIENTE ==========
+
+def _agregados_cliente():
+    return {
+        'primera_reserva': Min('fecha_evento'),
+        'ultima_reserva': Max('fecha_evento'),
+        'total_reservas': Count('id'),
+        'gasto_total': Sum('total_reserva'),
+    }
+
+
+def actualizar_contadores_cliente(cliente_id):
+    """
+    Recalcula los contadores desnormalizados de un cliente (primera y última reserva,
+    cantidad de reservas y gasto total) considerando solo sus reservas no canceladas.
+    """
+    datos = Reserva.objects.filter(
+        cliente_id=cliente_id
+    ).exclude(estado__iexact='cancelada').aggregate(**_agregados_cliente())
+    datos['gasto_total'] = datos['gasto_total'] or Decimal('0')
+    Cliente.objects.filter(pk=cliente_id).update(**datos)
+
+
+def reconstruir_contadores_clientes():
+    """
+    Recalcula en bloque los contadores de todos los clientes con una sola consulta agrupada.
+    Retorna la cantidad de clientes actualizados.
+    """
+    agregados = {
+        fila.pop('cliente_id'): fila
+        for fila in Reserva.objects.exclude(estado__iexact='cancelada').values(
+            'cliente_id'
+        ).annotate(**_agregados_cliente()).order_by()
+    }
+    vacio = {
+        'primera_reserva': None,
+        'ultima_reserva': None,
+        'total_reservas': 0,
+        'gasto_total': Decimal('0'),
+    }
+    clientes = []
+    for cliente in Cliente.objects.only('id').iterator(chunk_size=2000):
+        for campo, valor in agregados.get(cliente.id, vacio).items():
+            setattr(cliente, campo, valor or vacio[campo])
+        clientes.append(cliente)
+
+    with transaction.atomic():
+        Cliente.objects.bulk_update(clientes, list(vacio.keys()), batch_size=1000)
+    return len(clientes)
+
+
+# ========== RETENCIÓN POR COHORTES ==========
+
+# Las filas de cohortes cerradas no cambian hasta que se cierra otro mes
+CACHE_COHORTES_SEGUNDOS = 60 * 60 * 24
+
+SQL_RETENCION_COHORTES = """
+    WITH meses AS (
+        SELECT DISTINCT cliente_id, date_trunc('month', fecha_evento)::date AS mes
+        FROM {tabla}
+        WHERE LOWER(estado) IN ('confirmada', 'completada')
+          AND fecha_evento < %s
+    ),
+    cohortes AS (
+        SELECT cliente_id, mes, MIN(mes) OVER (PARTITION BY cliente_id) AS cohorte
+        FROM meses
+    )
+    SELECT cohorte,
+           ((EXTRACT(YEAR FROM mes) - EXTRACT(YEAR FROM cohorte)) * 12
+             + EXTRACT(MONTH FROM mes) - EXTRACT(MONTH FROM cohorte))::int AS desplazamiento,
+           COUNT(*) AS clientes
+    FROM cohortes
+    WHERE cohorte >= %s
+    GROUP BY cohorte, desplazamiento
+    ORDER BY cohorte, desplazamiento
+"""
+
+
+def _sumar_meses(fecha, meses):
+    total = fecha.year * 12 + (fecha.month - 1) + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _clave_cohorte(cohorte, hasta):
+    return f"jio:cohorte:{cohorte.isoformat()}:{hasta.isoformat()}"
+
+
+def matriz_retencion_cohortes(cantidad_meses=12, hoy=None):
+    """
+    Matriz de retención: agrupa a los clientes por el mes de su primera reserva vendida
+    y calcula el porcentaje que vuelve a reservar en cada mes posterior.
+    Solo considera meses cerrados. Cada cohorte se guarda en caché por separado y la
+    consulta (una sola, con funciones de ventana) se ejecuta únicamente si falta alguna.
+    Retorna una lista de diccionarios {'cohorte', 'clientes', 'retencion'} donde
+    retencion[i] es el porcentaje de la cohorte activo i+1 meses después.
+    """
+    hoy = hoy or date.today()
+    hasta = hoy.replace(day=1)
+    cohortes = [_sumar_meses(hasta, -i) for i in range(cantidad_meses, 0, -1)]
+    claves = {cohorte: _clave_cohorte(cohorte, hasta) for cohorte in cohortes}
+
+    en_cache = cache.get_many(list(claves.values()))
+    faltantes = [cohorte for cohorte in cohortes if claves[cohorte] not in en_cache]
+
+    if faltantes:
+        conteos = defaultdict(dict)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SQL_RETENCION_COHORTES.format(tabla=Reserva._meta.db_table),
+                [hasta, min(faltantes)]
+            )
+            for cohorte, desplazamiento, clientes in cursor.fetchall():
+                conteos[cohorte][desplazamiento] = clientes
+
+        nuevas = {}
+        for cohorte in faltantes:
+            por_mes = conteos.get(cohorte, {})
+            meses_transcurridos = (hasta.year - cohorte.year) * 12 + hasta.month - cohorte.month
+            nuevas[claves[cohorte]] = {
+                'clientes': por_mes.get(0, 0),
+                'activos': [por_mes.get(i, 0) for i in range(1, meses_transcurridos)],
+            }
+        cache.set_many(nuevas, CACHE_COHORTES_SEGUNDOS)
+        en_cache.update(nuevas)
+
+    matriz = []
+    for cohorte in cohortes:
+        fila = en_cache[claves[cohorte]]
+        base = fila['clientes']
+        matriz.append({
+            'cohorte': cohorte,
+            'clientes': base,
+            'retencion': [round(activos * 100.0 / base, 1) if base else 0.0 for activos in fila['activos']],
+        })
+    return matriz
+
+
+# ========== HISTOGRAMAS CON PERCENTILES ==========
+
+CACHE_HISTOGRAMAS_SEGUNDOS = 60 * 15
+PERCENTILES_HISTOGRAMA = (0.25, 0.5, 0.75, 0.9)
+
+# Anticipación: tramos de 10 días entre 0 y 120; el último tramo agrupa 120 o más
+ANTICIPACION_MAXIMA_DIAS = 120
+ANTICIPACION_TRAMO_DIAS = 10
+
+SQL_HISTOGRAMA_PERCENTILES = """
+    WITH datos AS (
+        SELECT ({valor})::float8 AS valor
+        FROM {tabla}
+        WHERE LOWER(estado) <> 'cancelada'
+          AND fecha_evento BETWEEN %s AND %s
+    ),
+    resumen AS (
+        SELECT COUNT(*) AS total,
+               percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY valor) AS percentiles
+        FROM datos
+    )
+    SELECT buckets.bucket, buckets.cantidad, resumen.total, resumen.percentiles
+    FROM resumen
+    LEFT JOIN (
+        SELECT width_bucket(valor, %s, %s, %s) AS bucket, COUNT(*) AS cantidad
+        FROM datos
+        GROUP BY 1
+    ) buckets ON TRUE
+    ORDER BY buckets.bucket
+"""
+
+
+def _histograma_percentiles(clave, valor_sql, parametros_valor, desde, hasta, minimo, maximo, cantidad_buckets):
+    """
+    Ejecuta una sola consulta que devuelve el histograma (width_bucket) y los percentiles
+    (percentile_cont) del valor indicado sobre las reservas no canceladas del rango.
+    conteos[0] son los valores bajo el mínimo y conteos[-1] los que igualan o superan el máximo.
+    """
+    resultado = cache.get(clave)
+    if resultado is not None:
+        return resultado
+
+    conteos = [0] * (cantidad_buckets + 2)
+    total = 0
+    percentiles = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SQL_HISTOGRAMA_PERCENTILES.format(valor=valor_sql, tabla=Reserva._meta.db_table),
+            parametros_valor + [desde, hasta, list(PERCENTILES_HISTOGRAMA), minimo, maximo, cantidad_buckets]
+        )
+        for bucket, cantidad, total, valores in cursor.fetchall():
+            if bucket is not None:
+                conteos[bucket] = cantidad
+            percentiles = valores or []
+
+    resultado = {
+        'conteos': conteos,
+        'total': total,
+        'percentiles': {
+            f'p{int(p * 100)}': valor
+            for p, valor in zip(PERCENTILES_HISTOGRAMA, percentiles)
+        },
+    }
+    cache.set(clave, resultado, CACHE_HISTOGRAMAS_SEGUNDOS)
+    return resultado
+
+
+def histograma_anticipacion(desde, hasta):
+    """
+    Distribución de días entre la creación de la reserva y la fecha del evento,
+    para eventos entre desde y hasta. Retorna etiquetas, cantidades, total y percentiles (días).
+    """
+    cantidad_buckets = ANTICIPACION_MAXIMA_DIAS // ANTICIPACION_TRAMO_DIAS
+    datos = _histograma_percentiles(
+        f"jio:hist:anticipacion:{desde.isoformat()}:{hasta.isoformat()}",
+        "GREATEST(fecha_evento - (fecha_creacion AT TIME ZONE %s)::date, 0)",
+        [settings.TIME_ZONE],
+        desde, hasta, 0, ANTICIPACION_MAXIMA_DIAS, cantidad_buckets
+    )
+    etiquetas = [
+        f"{i * ANTICIPACION_TRAMO_DIAS}-{(i + 1) * ANTICIPACION_TRAMO_DIAS - 1}"
+        for i in range(cantidad_buckets)
+    ] + [f"{ANTICIPACION_MAXIMA_DIAS}+"]
+    return {
+        'etiquetas': etiquetas,
+        'cantidades': datos['conteos'][1:],
+        'total': datos['total'],
+        'percentiles': {
+            clave: round(valor, 1) if valor is not None else None
+            for clave, valor in datos['percentiles'].items()
+        },
+    }
+
+
+def _formatear_hora_decimal(horas):
+    if horas is None:
+        return None
+    minutos = int(round(horas * 60))
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def histograma_hora_instalacion(desde, hasta):
+    """
+    Demanda por hora de instalación (tramos de una hora) para eventos entre desde y hasta.
+    Retorna etiquetas, cantidades, total y percentiles formateados como HH:MM.
+    """
+    datos = _histograma_percentiles(
+        f"jio:hist:hora_instalacion:{desde.isoformat()}:{hasta.isoformat()}",
+        "EXTRACT(EPOCH FROM hora_instalacion) / 3600.0",
+        [],
+        desde, hasta, 0, 24, 24
+    )
+    return {
+        'etiquetas': [f"{hora:02d}:00" for hora in range(24)],
+        'cantidades': datos['conteos'][1:25],
+        'total': datos['total'],
+        'percentiles': {
+            clave: _formatear_hora_decimal(valor)
+            for clave, valor in datos['percentiles'].items()
+        },
+    }
+
+
+# ========== OCUPACIÓN ANUAL (MAPA DE CALOR) ==========
+
+CACHE_OCUPACION_SEGUNDOS = 60 * 5
+CACHE_OCUPACION_PASADO_SEGUNDOS = 60 * 60 * 24
+
+
+def _mascara_dias(indices, cantidad_dias):
+    """
+    Codifica en base64 un bitmask de cantidad_dias bits (bit i = día i del año,
+    bit menos significativo primero dentro de cada byte)
+    """
+    mascara = bytearray((cantidad_dias + 7) // 8)
+    for indice in indices:
+        mascara[indice // 8] |= 1 << (indice % 8)
+    return base64.b64encode(bytes(mascara)).decode('ascii')
+
+
+def ocupacion_anual(año, por_juego=False):
+    """
+    Ocupación de cada día del año: juegos distintos reservados (reservas no canceladas)
+    dividido por los juegos habilitados. Se calcula con un solo GROUP BY; con por_juego=True
+    se agrupa por (juego, día) y se agrega, por cada juego, un bitmask de los días ocupados.
+    """
+    clave = f"jio:ocupacion:{año}:{int(por_juego)}"
+    resultado = cache.get(clave)
+    if resultado is not None:
+        return resultado
+
+    inicio = date(año, 1, 1)
+    cantidad_dias = (date(año + 1, 1, 1) - inicio).days
+    total_juegos = Juego.objects.filter(estado='Habilitado').count()
+    detalles = DetalleReserva.objects.filter(
+        reserva__fecha_evento__year=año
+    ).exclude(reserva__estado__iexact='cancelada').order_by()
+
+    ocupados = [0] * cantidad_dias
+    juegos = []
+    if por_juego:
+        dias_por_juego = defaultdict(list)
+        for juego_id, fecha in detalles.values_list('juego_id', 'reserva__fecha_evento').distinct():
+            indice = (fecha - inicio).days
+            ocupados[indice] += 1
+            dias_por_juego[juego_id].append(indice)
+        for juego_id, nombre in Juego.objects.filter(id__in=dias_por_juego).order_by('nombre').values_list('id', 'nombre'):
+            juegos.append({
+                'id': juego_id,
+                'nombre': nombre,
+                'dias': len(dias_por_juego[juego_id]),
+                'mascara': _mascara_dias(dias_por_juego[juego_id], cantidad_dias),
+            })
+    else:
+        for fecha, cantidad in detalles.values('reserva__fecha_evento').annotate(
+            cantidad=Count('juego_id', distinct=True)
+        ).values_list('reserva__fecha_evento', 'cantidad'):
+            ocupados[(fecha - inicio).days] = cantidad
+
+    resultado = {
+        'año': año,
+        'inicio': inicio.isoformat(),
+        'dias': cantidad_dias,
+        'total_juegos': total_juegos,
+        'ocupacion': [
+            round(min(cantidad / total_juegos, 1), 3) if total_juegos else 0
+            for cantidad in ocupados
+        ],
+    }
+    if por_juego:
+        resultado['juegos'] = juegos
+
+    tiempo = CACHE_OCUPACION_PASADO_SEGUNDOS if año < date.today().year else CACHE_OCUPACION_SEGUNDOS
+    cache.set(clave, resultado, tiempo)
+    return resultado
@@ -0,0 +1,248 @@
+"""
+Planificación de rutas diarias de los repartidores (instalaciones y retiros).
+
+Se arma una matriz de distancias Haversine entre la bodega y las paradas, se construye
+una ruta inicial por vecino más cercano respetando las ventanas horarias y se mejora
+con 2-opt. El costo de una ruta prioriza no llegar tarde y luego los kilómetros.
+datos_paradas, simular_ruta, costo_ruta y mejorar_dos_opt son públicas porque la
+asignación automática (asignacion.py) evalúa las rutas con el mismo modelo de costo.
+"""
+import math
+
+# Punto de partida y regreso de las rutas (centro de Osorno)
+ORIGEN_RUTAS = (-40.5739, -73.1317)
+
+VELOCIDAD_PROMEDIO_KMH = 35
+MINUTOS_SERVICIO = {'instalacion': 30, 'retiro': 20}
+# Ventanas horarias: se puede llegar a instalar hasta 90 minutos antes de la hora pactada
+# y a retirar hasta 90 minutos después
+VENTANA_MINUTOS = 90
+# Un minuto de atraso pesa como este número de kilómetros extra
+PENALIZACION_ATRASO_KM = 10
+MAX_PASADAS_2OPT = 20
+
+
+def calcular_distancia_km(lat1, lon1, lat2, lon2):
+    """
+    Calcula la distancia entre dos puntos geográficos usando la fórmula de Haversine
+    Retorna la distancia en kilómetros
+    """
+    # Radio de la Tierra en kilómetros
+    R = 6371.0
+
+    # Convertir a radianes
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    # Diferencias
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    # Fórmula de Haversine
+    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    distancia = R * c
+    return round(distancia, 1)
+
+
+def matriz_distancias(puntos):
+    """Matriz simétrica de distancias (km) entre todos los puntos (lat, lng)"""
+    n = len(puntos)
+    matriz = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            distancia = calcular_distancia_km(*puntos[i], *puntos[j])
+            matriz[i][j] = matriz[j][i] = distancia
+    return matriz
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def _ventana(parada):
+    hora = _minutos(parada['hora'])
+    if parada['tipo'] == 'instalacion':
+        return hora - VENTANA_MINUTOS, hora
+    return hora, hora + VENTANA_MINUTOS
+
+
+def _viaje_minutos(km):
+    return km / VELOCIDAD_PROMEDIO_KMH * 60
+
+
+def datos_paradas(paradas):
+    """(apertura, cierre, minutos de servicio) de cada parada; el índice 0 es el origen"""
+    return [None] + [(*_ventana(p), MINUTOS_SERVICIO[p['tipo']]) for p in paradas]
+
+
+def simular_ruta(secuencia, datos, matriz):
+    """
+    Recorre la secuencia (índices de paradas; 0 es el origen en la matriz) y retorna
+    (km_total, minutos_atraso, llegadas). La salida de la bodega se ajusta para llegar
+    a la primera parada justo cuando abre su ventana.
+    """
+    if not secuencia:
+        return 0.0, 0, []
+    minutos_por_km = 60 / VELOCIDAD_PROMEDIO_KMH
+    km = 0.0
+    atraso = 0
+    llegadas = []
+    anterior = 0
+    tiempo = None
+    for indice in secuencia:
+        apertura, cierre, servicio = datos[indice]
+        distancia = matriz[anterior][indice]
+        inicio = apertura if tiempo is None else max(tiempo + distancia * minutos_por_km, apertura)
+        if inicio > cierre:
+            atraso += inicio - cierre
+        llegadas.append((inicio, distancia))
+        tiempo = inicio + servicio
+        km += distancia
+        anterior = indice
+    km += matriz[anterior][0]
+    return km, atraso, llegadas
+
+
+def costo_ruta(secuencia, datos, matriz):
+    """Kilómetros de la ruta más los minutos de atraso convertidos a km (PENALIZACION_ATRASO_KM)"""
+    km, atraso, _ = simular_ruta(secuencia, datos, matriz)
+    return km + atraso * PENALIZACION_ATRASO_KM
+
+
+def _vecino_mas_cercano(datos, matriz):
+    """Ruta inicial: desde la posición actual, la parada de menor costo (distancia + atraso)"""
+    pendientes = set(range(1, len(datos)))
+    secuencia = []
+    actual, tiempo = 0, None
+    while pendientes:
+        mejor, mejor_costo, mejor_inicio = None, None, None
+        for indice in sorted(pendientes):
+            apertura, cierre, _ = datos[indice]
+            distancia = matriz[actual][indice]
+            if tiempo is None:
+                # Primera parada: la ventana que cierra más temprano
+                inicio, costo = apertura, cierre
+            else:
+                llegada = tiempo + _viaje_minutos(distancia)
+                inicio = max(llegada, apertura)
+                # Preferir paradas cercanas, penalizando atrasos y esperas largas
+                costo = distancia + max(0, inicio - cierre) * PENALIZACION_ATRASO_KM + (inicio - llegada) / 60
+            if mejor_costo is None or costo < mejor_costo:
+                mejor, mejor_costo, mejor_inicio = indice, costo, inicio
+        secuencia.append(mejor)
+        pendientes.discard(mejor)
+        tiempo = mejor_inicio + datos[mejor][2]
+        actual = mejor
+    return secuencia
+
+
+def mejorar_dos_opt(secuencia, datos, matriz):
+    """Invierte tramos de la ruta mientras alguna inversión reduzca el costo"""
+    mejor_costo = costo_ruta(secuencia, datos, matriz)
+    for _ in range(MAX_PASADAS_2OPT):
+        mejoro = False
+        for i in range(len(secuencia) - 1):
+            for j in range(i + 1, len(secuencia)):
+                candidata = secuencia[:i] + secuencia[i:j + 1][::-1] + secuencia[j + 1:]
+                costo = costo_ruta(candidata, datos, matriz)
+                if costo < mejor_costo - 1e-9:
+                    secuencia, mejor_costo, mejoro = candidata, costo, True
+        if not mejoro:
+            break
+    return secuencia
+
+
+def planificar_ruta(paradas, origen=ORIGEN_RUTAS):
+    """
+    Ordena las paradas de un repartidor en un día. Cada parada es un diccionario con
+    'tipo' ('instalacion' o 'retiro'), 'hora' (time), 'lat' y 'lng' (None si no tiene
+    coordenadas) y cualquier otro dato que se quiera conservar.
+    Retorna un diccionario con la secuencia ordenada ('paradas', cada una con 'llegada'
+    y 'km_desde_anterior'), 'km_total' (incluye el regreso), 'minutos_atraso' y las
+    paradas 'sin_ubicacion' ordenadas por hora.
+    """
+    con_ubicacion = [p for p in paradas if p.get('lat') is not None and p.get('lng') is not None]
+    sin_ubicacion = sorted(
+        (p for p in paradas if p.get('lat') is None or p.get('lng') is None),
+        key=lambda p: p['hora']
+    )
+    puntos = [origen] + [(float(p['lat']), float(p['lng'])) for p in con_ubicacion]
+    matriz = matriz_distancias(puntos)
+
+    datos = datos_paradas(con_ubicacion)
+
+    secuencia = _vecino_mas_cercano(datos, matriz)
+    secuencia = mejorar_dos_opt(secuencia, datos, matriz)
+    km, atraso, llegadas = simular_ruta(secuencia, datos, matriz)
+
+    ordenadas = []
+    for indice, (inicio, distancia) in zip(secuencia, llegadas):
+        parada = dict(con_ubicacion[indice - 1])
+        minutos = int(round(inicio))
+        parada['llegada'] = f'{minutos // 60 % 24:02d}:{minutos % 60:02d}'
+        parada['km_desde_anterior'] = round(distancia, 1)
+        ordenadas.append(parada)
+
+    return {
+        'paradas': ordenadas,
+        'km_total': round(km, 1),
+        'minutos_atraso': int(round(atraso)),
+        'sin_ubicacion': sin_ubicacion,
+    }
+
+
+def parada_instalacion(instalacion):
+    """Parada de ruta de una instalación (usa las coordenadas de la reserva si no tiene propias)"""
+    return {
+        'tipo': 'instalacion',
+        'id': instalacion.id,
+        'fecha': instalacion.fecha_instalacion,
+        'hora': instalacion.hora_instalacion,
+        'lat': instalacion.latitud if instalacion.latitud is not None else instalacion.reserva.latitud,
+        'lng': instalacion.longitud if instalacion.longitud is not None else instalacion.reserva.longitud,
+        'cliente': instalacion.reserva.cliente.usuario.get_full_name(),
+        'direccion': instalacion.direccion_instalacion,
+    }
+
+
+def parada_retiro(retiro):
+    """Parada de ruta de un retiro (en la dirección del evento)"""
+    return {
+        'tipo': 'retiro',
+        'id': retiro.id,
+        'fecha': retiro.fecha_retiro,
+        'hora': retiro.hora_retiro,
+        'lat': retiro.reserva.latitud,
+        'lng': retiro.reserva.longitud,
+        'cliente': retiro.reserva.cliente.usuario.get_full_name(),
+        'direccion': retiro.reserva.direccion_evento,
+    }
+
+
+def ruta_del_dia(repartidor, fecha):
+    """
+    Ruta sugerida de un repartidor para sus instalaciones y retiros aún no realizados
+    ni cancelados de la fecha indicada.
+    """
+    from .models import Instalacion, Retiro
+
+    paradas = [
+        parada_instalacion(instalacion)
+        for instalacion in Instalacion.objects.filter(
+            repartidor=repartidor,
+            fecha_instalacion=fecha,
+            estado_instalacion__in=['programada', 'pendiente']
+        ).select_related('reserva__cliente__usuario')
+    ] + [
+        parada_retiro(retiro)
+        for retiro in Retiro.objects.filter(
+            repartidor=repartidor,
+            fecha_retiro=fecha,
+            estado_retiro__in=['programado', 'pendiente']
+        ).select_related('reserva__cliente__usuario')
+    ]
+    return planificar_ruta(paradas)
@@ -0,0 +1,342 @@
+"""
+Señales que mantienen actualizados los datos derivados (resúmenes, contadores, saldos,
+coordenadas, versiones de imágenes y eventos para los repartidores) cuando cambian las
+reservas, instalaciones, retiros, juegos y pagos.
+
+Los recálculos (resúmenes por día y por juego, contadores del cliente y saldos) no se
+hacen en la petición: se encolan al confirmar la transacción, una sola vez por día,
+juego, cliente o reserva aunque se guarden muchas filas (encolar_unica_al_confirmar).
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cola import encolar_al_confirmar, encolar_unica_al_confirmar
+from .models import DetalleReserva, Instalacion, Juego, Pago, Reserva, Retiro
+from .tiempo_real import datos_reparto, evento_reparto, eventos_asignacion, publicar
+
+
+def _actualizar_resumen_diario(fecha):
+    encolar_unica_al_confirmar('actualizar_resumen_diario', fecha=str(fecha))
+
+
+def _actualizar_resumen_juego(juego_id, fecha):
+    encolar_unica_al_confirmar('actualizar_resumen_juego', juego_id=juego_id, fecha=str(fecha))
+
+
+def _actualizar_contadores_cliente(cliente_id):
+    encolar_unica_al_confirmar('actualizar_contadores_cliente', cliente_id=cliente_id)
+
+
+def _actualizar_saldo(reserva_id):
+    encolar_unica_al_confirmar('actualizar_saldos_reservas', reserva_ids=[reserva_id])
+
+
+@receiver(pre_save, sender=Reserva)
+def guardar_valores_previos_reserva(sender, instance, **kwargs):
+    """Guarda los valores anteriores de la reserva para detectar cambios de fecha, estado, cliente o dirección"""
+    instance._valores_previos = None
+    if instance.pk:
+        instance._valores_previos = Reserva.objects.filter(pk=instance.pk).values(
+            'fecha_evento', 'estado', 'cliente_id', 'direccion_evento'
+        ).first()
+
+
+@receiver(post_save, sender=Reserva)
+def actualizar_resumenes_reserva(sender, instance, raw=False, **kwargs):
+    """Encola el recálculo de los resúmenes diarios afectados por la reserva guardada"""
+    if raw:
+        return
+    fechas = {instance.fecha_evento}
+    previos = getattr(instance, '_valores_previos', None)
+    if previos:
+        fechas.add(previos['fecha_evento'])
+    for fecha in fechas:
+        _actualizar_resumen_diario(fecha)
+
+
+@receiver(post_delete, sender=Reserva)
+def actualizar_resumenes_reserva_eliminada(sender, instance, **kwargs):
+    """Encola el recálculo del resumen diario del día de la reserva eliminada"""
+    _actualizar_resumen_diario(instance.fecha_evento)
+
+
+@receiver(post_save, sender=Reserva)
+def actualizar_contadores_cliente_reserva(sender, instance, raw=False, **kwargs):
+    """Encola el recálculo de los contadores del cliente (y del anterior si la reserva cambió de cliente)"""
+    if raw:
+        return
+    clientes = {instance.cliente_id}
+    previos = getattr(instance, '_valores_previos', None)
+    if previos:
+        clientes.add(previos['cliente_id'])
+    for cliente_id in clientes:
+        _actualizar_contadores_cliente(cliente_id)
+
+
+@receiver(post_delete, sender=Reserva)
+def actualizar_contadores_cliente_reserva_eliminada(sender, instance, **kwargs):
+    """Encola el recálculo de los contadores del cliente de la reserva eliminada"""
+    _actualizar_contadores_cliente(instance.cliente_id)
+
+
+@receiver(post_save, sender=Reserva)
+def actualizar_resumenes_juegos_reserva_guardada(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Encola el recálculo de los resúmenes por juego si cambió la fecha o el estado de la
+    reserva. Al crearla aún no tiene detalles: esos casos los cubren las señales de DetalleReserva.
+    """
+    previos = getattr(instance, '_valores_previos', None)
+    if raw or created or not previos:
+        return
+    if previos['fecha_evento'] == instance.fecha_evento and previos['estado'] == instance.estado:
+        return
+    juegos = DetalleReserva.objects.filter(reserva_id=instance.pk).values_list('juego_id', flat=True)
+    for juego_id in set(juegos):
+        for fecha in {instance.fecha_evento, previos['fecha_evento']}:
+            _actualizar_resumen_juego(juego_id, fecha)
+
+
+@receiver(pre_save, sender=DetalleReserva)
+def guardar_juego_previo_detalle(sender, instance, **kwargs):
+    """Guarda el juego anterior del detalle para detectar cambios de juego"""
+    instance._juego_previo_id = None
+    if instance.pk:
+        instance._juego_previo_id = DetalleReserva.objects.filter(pk=instance.pk).values_list(
+            'juego_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=DetalleReserva)
+def actualizar_resumen_juego_detalle(sender, instance, raw=False, **kwargs):
+    """Encola el recálculo del resumen del juego (y del anterior, si cambió) en la fecha de la reserva"""
+    if raw:
+        return
+    fecha = Reserva.objects.filter(pk=instance.reserva_id).values_list('fecha_evento', flat=True).first()
+    if fecha is None:
+        return
+    juegos = {instance.juego_id, getattr(instance, '_juego_previo_id', None)} - {None}
+    for juego_id in juegos:
+        _actualizar_resumen_juego(juego_id, fecha)
+
+
+@receiver(post_delete, sender=DetalleReserva)
+def actualizar_resumen_juego_detalle_eliminado(sender, instance, **kwargs):
+    """
+    Encola el recálculo del resumen del juego del detalle eliminado. Cuando se elimina la reserva
+    completa, los detalles se borran antes que ella, por lo que la fecha aún existe.
+    """
+    fecha = Reserva.objects.filter(pk=instance.reserva_id).values_list('fecha_evento', flat=True).first()
+    if fecha is not None:
+        _actualizar_resumen_juego(instance.juego_id, fecha)
+
+
+@receiver(post_save, sender=Reserva)
+def actualizar_saldo_reserva_guardada(sender, instance, raw=False, **kwargs):
+    """Encola el recálculo del saldo pendiente (puede haber cambiado el total o el estado)"""
+    if raw:
+        return
+    _actualizar_saldo(instance.pk)
+
+
+@receiver(pre_save, sender=Pago)
+def guardar_reserva_previa_pago(sender, instance, **kwargs):
+    """Guarda la reserva anterior del pago para recalcular su saldo si el pago se movió"""
+    instance._reserva_previa_id = None
+    if instance.pk:
+        instance._reserva_previa_id = Pago.objects.filter(pk=instance.pk).values_list(
+            'reserva_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Pago)
+def actualizar_saldo_pago_guardado(sender, instance, raw=False, **kwargs):
+    """Encola el recálculo del saldo de la reserva del pago (y de la anterior, si cambió)"""
+    if raw:
+        return
+    for reserva_id in {instance.reserva_id, getattr(instance, '_reserva_previa_id', None)} - {None}:
+        _actualizar_saldo(reserva_id)
+
+
+@receiver(post_delete, sender=Pago)
+def actualizar_saldo_pago_eliminado(sender, instance, **kwargs):
+    """Encola el recálculo del saldo de la reserva del pago eliminado"""
+    _actualizar_saldo(instance.reserva_id)
+
+
+def _geocodificar_si_corresponde(modelo, instance, direccion_previa, direccion, tarea, campo_id):
+    """
+    Encola la geocodificación si la fila no tiene coordenadas o si cambió su dirección
+    (en ese caso se borran las coordenadas anteriores para no usar una ubicación vieja).
+    """
+    cambio = direccion_previa is not None and direccion_previa != direccion
+    if cambio and instance.latitud is not None:
+        modelo.objects.filter(pk=instance.pk).update(latitud=None, longitud=None)
+    if (instance.latitud is None or cambio) and direccion:
+        encolar_al_confirmar(tarea, **{campo_id: instance.pk})
+
+
+@receiver(post_save, sender=Reserva)
+def geocodificar_reserva_guardada(sender, instance, raw=False, **kwargs):
+    """Geocodifica en segundo plano la dirección del evento"""
+    if raw:
+        return
+    previos = getattr(instance, '_valores_previos', None)
+    _geocodificar_si_corresponde(
+        Reserva, instance, previos['direccion_evento'] if previos else None,
+        instance.direccion_evento, 'geocodificar_reserva', 'reserva_id'
+    )
+
+
+@receiver(pre_save, sender=Instalacion)
+def guardar_valores_previos_instalacion(sender, instance, **kwargs):
+    """Guarda la fecha, hora, dirección y repartidor anteriores para detectar cambios"""
+    instance._valores_previos = None
+    if instance.pk:
+        instance._valores_previos = Instalacion.objects.filter(pk=instance.pk).values(
+            'fecha_instalacion', 'hora_instalacion', 'direccion_instalacion', 'repartidor_id',
+            'comprobante_pago', 'comprobante_variantes', 'estado_instalacion', 'metodo_pago'
+        ).first()
+    _descartar_variantes_si_cambio(instance, 'comprobante_pago', 'comprobante_variantes')
+
+
+@receiver(post_save, sender=Instalacion)
+def geocodificar_instalacion_guardada(sender, instance, raw=False, **kwargs):
+    """Geocodifica en segundo plano la dirección de instalación"""
+    if raw:
+        return
+    previos = getattr(instance, '_valores_previos', None)
+    _geocodificar_si_corresponde(
+        Instalacion, instance, previos['direccion_instalacion'] if previos else None,
+        instance.direccion_instalacion, 'geocodificar_instalacion', 'instalacion_id'
+    )
+
+
+def _descartar_variantes_si_cambio(instance, campo, campo_variantes):
+    """
+    Si cambió la imagen, las versiones guardadas ya no le corresponden: se vacían y se
+    recuerdan para borrarlas al confirmar
+    """
+    previos = instance._valores_previos
+    instance._variantes_reemplazadas = None
+    if previos and previos[campo] != getattr(instance, campo).name and previos[campo_variantes]:
+        instance._variantes_reemplazadas = previos[campo_variantes]
+        setattr(instance, campo_variantes, {})
+
+
+def _procesar_imagen_si_cambio(instance, tipo, campo):
+    """Encola la generación de versiones de una imagen nueva y el borrado de las anteriores"""
+    previos = instance._valores_previos
+    imagen = getattr(instance, campo)
+    if imagen and (previos is None or previos[campo] != imagen.name):
+        encolar_al_confirmar('procesar_imagen', tipo=tipo, objeto_id=instance.pk)
+    if getattr(instance, '_variantes_reemplazadas', None):
+        encolar_al_confirmar('eliminar_variantes', variantes=instance._variantes_reemplazadas, tipo=tipo)
+
+
+@receiver(post_save, sender=Instalacion)
+def procesar_comprobante_instalacion(sender, instance, raw=False, **kwargs):
+    """Genera en segundo plano las versiones del comprobante de pago subido"""
+    if raw:
+        return
+    _procesar_imagen_si_cambio(instance, 'comprobante', 'comprobante_pago')
+
+
+@receiver(post_save, sender=Instalacion)
+def actualizar_saldo_instalacion_guardada(sender, instance, raw=False, **kwargs):
+    """Encola el recálculo del saldo si la instalación se cobró (o dejó de estar realizada)"""
+    if raw:
+        return
+    previos = getattr(instance, '_valores_previos', None) or {}
+    if (
+        previos.get('estado_instalacion') != instance.estado_instalacion
+        or previos.get('metodo_pago') != instance.metodo_pago
+    ):
+        _actualizar_saldo(instance.reserva_id)
+
+
+@receiver(pre_save, sender=Juego)
+def guardar_valores_previos_juego(sender, instance, **kwargs):
+    """Guarda la foto anterior del juego para detectar si se reemplazó"""
+    instance._valores_previos = None
+    if instance.pk:
+        instance._valores_previos = Juego.objects.filter(pk=instance.pk).values(
+            'foto', 'foto_variantes'
+        ).first()
+    _descartar_variantes_si_cambio(instance, 'foto', 'foto_variantes')
+
+
+@receiver(post_save, sender=Juego)
+def procesar_foto_juego(sender, instance, raw=False, **kwargs):
+    """Genera en segundo plano las versiones de la foto subida"""
+    if raw:
+        return
+    _procesar_imagen_si_cambio(instance, 'juego', 'foto')
+
+
+@receiver(pre_save, sender=Retiro)
+def guardar_valores_previos_retiro(sender, instance, **kwargs):
+    """Guarda la fecha, hora y repartidor anteriores del retiro para detectar cambios"""
+    instance._valores_previos = None
+    if instance.pk:
+        instance._valores_previos = Retiro.objects.filter(pk=instance.pk).values(
+            'fecha_retiro', 'hora_retiro', 'repartidor_id'
+        ).first()
+
+
+def _publicar_si_corresponde(tipo_reparto, instance, campos):
+    """
+    Avisa al repartidor asignado cuando un reparto se crea ya asignado o cuando cambian
+    su fecha, hora o dirección. Las asignaciones y cambios de estado los publican las
+    vistas que los hacen.
+    """
+    if not instance.repartidor_id:
+        return
+    previos = getattr(instance, '_valores_previos', None)
+    if previos is None:
+        publicar(eventos_asignacion(tipo_reparto, instance, None, instance.repartidor.usuario.get_full_name()))
+    elif previos['repartidor_id'] == instance.repartidor_id and any(
+        previos[campo] != getattr(instance, campo) for campo in campos
+    ):
+        publicar([evento_reparto(
+            'modificado', tipo_reparto, instance.pk, instance.repartidor_id,
+            **datos_reparto(tipo_reparto, instance)
+        )])
+
+
+@receiver(post_save, sender=Instalacion)
+def publicar_instalacion_modificada(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _publicar_si_corresponde('instalacion', instance, ['fecha_instalacion', 'hora_instalacion', 'direccion_instalacion'])
+
+
+@receiver(post_save, sender=Retiro)
+def publicar_retiro_modificado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _publicar_si_corresponde('retiro', instance, ['fecha_retiro', 'hora_retiro'])
+
+
+@receiver(post_save, sender=Reserva)
+def publicar_direccion_retiro(sender, instance, raw=False, **kwargs):
+    """El retiro se hace en la dirección del evento: si cambia, se avisa a su repartidor"""
+    previos = getattr(instance, '_valores_previos', None)
+    if raw or not previos or previos['direccion_evento'] == instance.direccion_evento:
+        return
+    retiro = Retiro.objects.filter(reserva_id=instance.pk, repartidor__isnull=False).first()
+    if retiro:
+        publicar([evento_reparto(
+            'modificado', 'retiro', retiro.pk, retiro.repartidor_id, **datos_reparto('retiro', retiro)
+        )])
+
+
+@receiver(post_delete, sender=Instalacion)
+@receiver(post_delete, sender=Retiro)
+def publicar_reparto_eliminado(sender, instance, **kwargs):
+    """Un reparto eliminado desaparece del panel y del dispositivo de su repartidor"""
+    if instance.repartidor_id:
+        tipo_reparto = 'instalacion' if sender is Instalacion else 'retiro'
+        publicar([evento_reparto(
+            'desasignado', tipo_reparto, instance.pk, instance.repartidor_id,
+            **datos_reparto(tipo_reparto, instance)
+        )])
@@ -0,0 +1,341 @@
+"""
+Sincronización de la aplicación de los repartidores cuando trabajan sin conexión.
+
+Bajada: los eventos de EventoTiempoReal son el registro de cambios de cada repartidor y
+su id es el cursor. El dispositivo envía el último cursor y recibe solo los repartos que
+cambiaron desde entonces (en su estado actual) y los que dejaron de ser suyos. Sin
+cursor, o si los eventos intermedios ya se borraron, recibe la lista completa.
+
+Subida: el dispositivo guarda sus acciones mientras no tiene señal y las envía juntas.
+Cada acción trae un id generado en el dispositivo; las ya procesadas (AccionSincronizada)
+no se vuelven a aplicar y se responde con el resultado guardado.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .historial import evento_historial, registrar
+from .models import AccionSincronizada, EventoTiempoReal, Instalacion, Retiro
+from .repartos import MODELOS_REPARTO, cambiar_estado_en_lote
+from .rutas import parada_instalacion, parada_retiro
+from .tiempo_real import MARGEN_CURSOR, datos_reparto, evento_reparto, publicar
+
+MAX_EVENTOS_SINCRONIZACION = 500
+MAX_ACCIONES_POR_LOTE = 200
+# Antigüedad máxima de una acción hecha sin conexión
+DIAS_MAXIMOS_SIN_CONEXION = 3
+TOLERANCIA_RELOJ = timedelta(minutes=5)
+DIAS_RETENCION_ACCIONES = 30
+
+
+# ========== BAJADA ==========
+
+def _serializar(parada, estado, estado_display, observaciones):
+    return {
+        'tipo': parada['tipo'],
+        'id': parada['id'],
+        'fecha': parada['fecha'].isoformat(),
+        'hora': parada['hora'].strftime('%H:%M'),
+        'estado': estado,
+        'estado_display': estado_display,
+        'cliente': parada['cliente'],
+        'direccion': parada['direccion'],
+        'lat': float(parada['lat']) if parada['lat'] is not None else None,
+        'lng': float(parada['lng']) if parada['lng'] is not None else None,
+        'observaciones': observaciones or '',
+    }
+
+
+def serializar_instalacion(instalacion):
+    reserva = instalacion.reserva
+    return {
+        **_serializar(
+            parada_instalacion(instalacion), instalacion.estado_instalacion,
+            instalacion.get_estado_instalacion_display(), instalacion.observaciones_instalacion
+        ),
+        'telefono': instalacion.telefono_cliente,
+        'juegos': [
+            {'nombre': detalle.juego.nombre, 'cantidad': detalle.cantidad}
+            for detalle in reserva.detalles.all()
+        ],
+        'total': int(reserva.total_reserva),
+        'saldo_pendiente': int(reserva.saldo_pendiente),
+    }
+
+
+def serializar_retiro(retiro):
+    return {
+        **_serializar(
+            parada_retiro(retiro), retiro.estado_retiro,
+            retiro.get_estado_retiro_display(), retiro.observaciones_retiro
+        ),
+        'telefono': retiro.reserva.cliente.usuario.telefono or '',
+    }
+
+
+def _instalaciones(**filtros):
+    return Instalacion.objects.filter(**filtros).select_related(
+        'reserva__cliente__usuario'
+    ).prefetch_related('reserva__detalles__juego').order_by('fecha_instalacion', 'hora_instalacion')
+
+
+def _retiros(**filtros):
+    return Retiro.objects.filter(**filtros).select_related(
+        'reserva__cliente__usuario'
+    ).order_by('fecha_retiro', 'hora_retiro')
+
+
+def sincronizar(repartidor, cursor=None, ahora=None):
+    """
+    Cambios de los repartos del repartidor desde el cursor. Solo se sincronizan los
+    repartos desde hoy en adelante; el dispositivo descarta los de días anteriores.
+    Retorna un diccionario con 'repartos' (estado actual de los que cambiaron),
+    'eliminados' (tipo e id de los que ya no le corresponden), 'cursor' para la próxima
+    llamada, 'mas' si quedan cambios por bajar y 'completo' si es la lista completa.
+    """
+    ahora = ahora or timezone.now()
+    hoy = timezone.localdate(ahora)
+    limites = EventoTiempoReal.objects.aggregate(primero=Min('id'), ultimo=Max('id'))
+    seguro = EventoTiempoReal.objects.filter(
+        fecha_creacion__lt=ahora - MARGEN_CURSOR
+    ).order_by('-fecha_creacion').values_list('id', flat=True).first() or 0
+
+    completo = (
+        cursor is None
+        or cursor > (limites['ultimo'] or 0)
+        or cursor < (limites['primero'] or cursor + 1) - 1
+    )
+    if completo:
+        return {
+            'completo': True,
+            'cursor': seguro,
+            'mas': False,
+            'repartos': (
+                [serializar_instalacion(i) for i in _instalaciones(repartidor=repartidor, fecha_instalacion__gte=hoy)]
+                + [serializar_retiro(r) for r in _retiros(repartidor=repartidor, fecha_retiro__gte=hoy)]
+            ),
+            'eliminados': [],
+        }
+
+    filas = list(EventoTiempoReal.objects.filter(
+        repartidor=repartidor,
+        id__gt=cursor
+    ).order_by('id').values_list('id', 'tipo_reparto', 'reparto_id')[:MAX_EVENTOS_SINCRONIZACION])
+    mas = len(filas) == MAX_EVENTOS_SINCRONIZACION
+    ids = defaultdict(set)
+    for _, tipo_reparto, reparto_id in filas:
+        ids[tipo_reparto].add(reparto_id)
+
+    repartos, eliminados = [], []
+    actuales = {
+        'instalacion': (_instalaciones(id__in=ids['instalacion']), 'fecha_instalacion', serializar_instalacion),
+        'retiro': (_retiros(id__in=ids['retiro']), 'fecha_retiro', serializar_retiro),
+    }
+    for tipo_reparto, (consulta, campo_fecha, serializar_reparto) in actuales.items():
+        if not ids[tipo_reparto]:
+            continue
+        encontrados = set()
+        for reparto in consulta:
+            encontrados.add(reparto.id)
+            if reparto.repartidor_id == repartidor.id and getattr(reparto, campo_fecha) >= hoy:
+                repartos.append(serializar_reparto(reparto))
+            else:
+                eliminados.append({'tipo': tipo_reparto, 'id': reparto.id})
+        eliminados += [{'tipo': tipo_reparto, 'id': pk} for pk in ids[tipo_reparto] - encontrados]
+
+    return {
+        'completo': False,
+        # Sin más páginas se leyeron todos los eventos del repartidor: el cursor avanza hasta
+        # el último evento seguro y los más recientes se vuelven a enviar la próxima vez
+        'cursor': filas[-1][0] if mas else max(cursor, seguro),
+        'mas': mas,
+        'repartos': repartos,
+        'eliminados': eliminados,
+    }
+
+
+# ========== SUBIDA ==========
+
+def _fecha_accion(valor, ahora):
+    """Momento de la acción según el dispositivo (ahora si no viene o viene del futuro)"""
+    try:
+        fecha = parse_datetime(valor) if isinstance(valor, str) else None
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        return ahora
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return min(fecha, ahora) if fecha <= ahora + TOLERANCIA_RELOJ else ahora
+
+
+def _reparto_de_accion(accion):
+    tipo_reparto = accion.get('tipo_reparto')
+    try:
+        reparto_id = int(accion.get('reparto_id'))
+    except (TypeError, ValueError):
+        reparto_id = None
+    return tipo_reparto, reparto_id
+
+
+def _accion_estado(repartidor, accion, fecha):
+    tipo_reparto, reparto_id = _reparto_de_accion(accion)
+    if not accion.get('estado'):
+        return {'success': False, 'error': 'Debe seleccionar un estado'}
+    resultado = cambiar_estado_en_lote(
+        [(tipo_reparto, reparto_id)],
+        accion['estado'],
+        str(accion.get('observaciones') or ''),
+        hoy=timezone.localdate(fecha),
+        repartidor=repartidor,
+        actor=repartidor.usuario,
+        fecha=fecha,
+        sin_conexion=True
+    )[0]
+    if not resultado['success']:
+        return {'success': False, 'error': resultado['error']}
+    return {'success': True, 'message': 'Estado actualizado'}
+
+
+def _accion_realizado(repartidor, accion, fecha):
+    """Equivalente sin conexión de marcar_reparto_realizado"""
+    tipo_reparto, reparto_id = _reparto_de_accion(accion)
+    if tipo_reparto not in MODELOS_REPARTO:
+        return {'success': False, 'error': 'Tipo de reparto inválido'}
+    modelo, campo_estado, _, campo_fecha = MODELOS_REPARTO[tipo_reparto]
+    reparto = modelo.objects.select_for_update().filter(id=reparto_id).first()
+    if reparto is None:
+        return {'success': False, 'error': 'Reparto no encontrado'}
+    if reparto.repartidor_id != repartidor.id:
+        return {'success': False, 'error': 'No autorizado para actualizar este reparto'}
+
+    dia = timezone.localdate(fecha)
+    fecha_reparto = getattr(reparto, campo_fecha)
+    if fecha_reparto != dia:
+        return {
+            'success': False,
+            'error': (
+                f'Solo se puede marcar como realizado el día agendado ({fecha_reparto.strftime("%d/%m/%Y")}). '
+                f'La acción se registró el {dia.strftime("%d/%m/%Y")}'
+            )
+        }
+
+    datos = {'sin_conexion': True}
+    if tipo_reparto == 'instalacion':
+        metodo_pago = accion.get('metodo_pago')
+        if metodo_pago not in dict(Instalacion.METODO_PAGO_CHOICES):
+            return {'success': False, 'error': 'Debe seleccionar un método de pago'}
+        reparto.metodo_pago = metodo_pago
+        datos['metodo_pago'] = metodo_pago
+        datos['metodo_pago_display'] = reparto.get_metodo_pago_display()
+        if metodo_pago == 'transferencia' and not reparto.comprobante_pago:
+            datos['comprobante_pendiente'] = True
+        hora_retiro = accion.get('hora_retiro')
+        if hora_retiro:
+            try:
+                hora = datetime.strptime(hora_retiro, '%H:%M').time()
+            except (TypeError, ValueError):
+                return {'success': False, 'error': 'Hora de retiro inválida'}
+            retiro = Retiro.objects.filter(reserva_id=reparto.reserva_id).first()
+            if retiro:
+                retiro.hora_retiro = hora
+                retiro.save()
+                datos['hora_retiro'] = hora_retiro
+
+    if accion.get('observaciones'):
+        datos['observaciones'] = str(accion['observaciones'])
+    setattr(reparto, campo_estado, 'realizada' if tipo_reparto == 'instalacion' else 'realizado')
+    reparto.save()
+    registrar([evento_historial('realizado', tipo_reparto, reparto.id, repartidor.usuario, fecha, **datos)])
+    publicar([evento_reparto(
+        'estado', tipo_reparto, reparto.id, reparto.repartidor_id, **datos_reparto(tipo_reparto, reparto)
+    )])
+    return {'success': True, 'message': 'Reparto marcado como realizado'}
+
+
+def _accion_estado_repartidor(repartidor, accion, fecha):
+    """Equivalente sin conexión de cambiar_estado_repartidor"""
+    estado = accion.get('estado')
+    if estado not in dict(repartidor._meta.get_field('estado').choices):
+        return {'success': False, 'error': 'Estado inválido'}
+    repartidor.estado = estado
+    repartidor.save(update_fields=['estado'])
+    return {'success': True, 'message': f'Estado actualizado a: {repartidor.get_estado_display()}'}
+
+
+ACCIONES = {
+    'estado': _accion_estado,
+    'realizado': _accion_realizado,
+    'estado_repartidor': _accion_estado_repartidor,
+}
+
+
+def aplicar_acciones(repartidor, acciones, ahora=None):
+    """
+    Aplica en orden las acciones guardadas por el dispositivo. Cada una es un diccionario
+    con 'id' (único por dispositivo), 'tipo' (ver ACCIONES), 'fecha' (ISO, cuándo se hizo)
+    y sus datos. Cada acción va en su propia transacción junto con su registro, así que
+    una que falla no afecta a las demás y una repetida no se aplica dos veces.
+    Retorna el resultado de cada acción ('id', 'success', 'message' o 'error' y
+    'duplicada' si ya se había procesado).
+    """
+    ahora = ahora or timezone.now()
+    limite = ahora - timedelta(days=DIAS_MAXIMOS_SIN_CONEXION)
+    ids = [str(a.get('id')) for a in acciones if isinstance(a, dict) and a.get('id')]
+    procesadas = {
+        accion.id_accion: accion.resultado
+        for accion in AccionSincronizada.objects.filter(repartidor=repartidor, id_accion__in=ids)
+    }
+
+    resultados = []
+    for accion in acciones:
+        accion = accion if isinstance(accion, dict) else {}
+        id_accion = str(accion.get('id') or '')[:64]
+        tipo = accion.get('tipo')
+        if not id_accion:
+            resultados.append({'id': None, 'success': False, 'error': 'La acción no tiene id'})
+            continue
+        if id_accion in procesadas:
+            resultados.append({**procesadas[id_accion], 'duplicada': True})
+            continue
+
+        fecha = _fecha_accion(accion.get('fecha'), ahora)
+        try:
+            with transaction.atomic():
+                registro = AccionSincronizada.objects.create(
+                    repartidor=repartidor,
+                    id_accion=id_accion,
+                    tipo=str(tipo or '')[:30],
+                    fecha_accion=fecha,
+                )
+                if tipo not in ACCIONES:
+                    resultado = {'success': False, 'error': 'Tipo de acción inválido'}
+                elif fecha < limite:
+                    resultado = {
+                        'success': False,
+                        'error': f'La acción tiene más de {DIAS_MAXIMOS_SIN_CONEXION} días y no se aplicó'
+                    }
+                else:
+                    resultado = ACCIONES[tipo](repartidor, accion, fecha)
+                registro.resultado = {'id': id_accion, **resultado}
+                registro.save(update_fields=['resultado'])
+        except IntegrityError:
+            # La misma acción llegó al mismo tiempo en otra petición (reintento del dispositivo)
+            registro = AccionSincronizada.objects.filter(repartidor=repartidor, id_accion=id_accion).first()
+            if registro is None:
+                raise
+            resultados.append({**registro.resultado, 'duplicada': True})
+            continue
+        procesadas[id_accion] = registro.resultado
+        resultados.append(registro.resultado)
+    return resultados
+
+
+def limpiar_acciones_antiguas():
+    limite = timezone.now() - timedelta(days=DIAS_RETENCION_ACCIONES)
+    eliminadas, _ = AccionSincronizada.objects.filter(fecha_creacion__lt=limite).delete()
+    return eliminadas
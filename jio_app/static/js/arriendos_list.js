@@ -1455,6 +1455,13 @@
                                    (arriendo.cliente_tipo || ''));
             document.getElementById('editClienteTipo').value = tipoClienteValue;
             
+            // Historial del cliente (contadores precalculados en el servidor)
+            const formatearFecha = (valor) => valor ? valor.split('-').reverse().join('/') : '-';
+            document.getElementById('editClienteTotalReservas').textContent = arriendo.cliente_total_reservas || 0;
+            document.getElementById('editClientePrimeraReserva').textContent = formatearFecha(arriendo.cliente_primera_reserva);
+            document.getElementById('editClienteUltimaReserva').textContent = formatearFecha(arriendo.cliente_ultima_reserva);
+            document.getElementById('editClienteGastoTotal').textContent = Math.round(arriendo.cliente_gasto_total || 0).toLocaleString('es-CL');
+            
             const editFechaInput = document.getElementById('editFechaEvento');
             const today = new Date().toISOString().split('T')[0];
             // Calcular fecha máxima (1 año desde hoy)
@@ -109,7 +109,7 @@
             ${data.juegos.map(j => `
               <div style="background:#f5f5f5; padding:1rem; border-radius:8px; margin-bottom:0.75rem;">
                 ${j.imagen_url ? `
-                  <img src="${j.imagen_url}" alt="${j.nombre}" style="width:100%; height:150px; object-fit:cover; border-radius:8px; margin-bottom:0.75rem;">
+                  <img src="${j.imagen_url}" ${j.imagen_srcset ? `srcset="${j.imagen_srcset}" sizes="(max-width: 600px) 100vw, 480px"` : ''} alt="${j.nombre}" loading="lazy" style="width:100%; height:150px; object-fit:cover; border-radius:8px; margin-bottom:0.75rem;">
                 ` : ''}
                 <div style="font-weight:600; font-size:1rem; margin-bottom:0.25rem;">${j.nombre}</div>
                 <div style="color:#666; font-size:0.875rem;">Cantidad: ${j.cantidad}</div>
@@ -147,6 +147,8 @@
           </div>
           ` : ''}
 
+          ${htmlHistorial('instalacion', data.id, data.historial)}
+
         </div>
       `;
 
@@ -158,6 +160,61 @@
     }
   }
 
+  // ===== HISTORIAL DEL REPARTO =====
+  function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+  }
+
+  function filasHistorial(eventos) {
+    return eventos.map(ev => `
+      <li style="padding:0.5rem 0; border-bottom:1px solid #eee; font-size:0.875rem; line-height:1.4;">
+        <div style="color:#666; font-size:0.75rem;">${escaparHtml(ev.fecha)} · ${escaparHtml(ev.actor)}${ev.sin_conexion ? ' · sin conexión' : ''}</div>
+        <div><strong>${escaparHtml(ev.tipo_display)}:</strong> ${escaparHtml(ev.descripcion)}</div>
+        ${ev.observaciones ? `<div style="color:#444; white-space:pre-wrap;">${escaparHtml(ev.observaciones)}</div>` : ''}
+      </li>
+    `).join('');
+  }
+
+  function botonMasHistorial(tipoReparto, repartoId, siguiente) {
+    if (!siguiente) return '';
+    return `<button type="button" class="btn btn-secondary btn-sm" style="margin-top:0.5rem;" data-historial-mas data-tipo="${tipoReparto}" data-id="${repartoId}" data-antes="${siguiente}">Ver más</button>`;
+  }
+
+  function htmlHistorial(tipoReparto, repartoId, historial) {
+    if (!historial || historial.eventos.length === 0) return '';
+    return `
+      <div>
+        <div style="font-size:0.875rem; color:#2E7D32; font-weight:600; margin-bottom:0.5rem;">🕑 HISTORIAL</div>
+        <ul data-historial-lista style="list-style:none; margin:0; padding:0;">${filasHistorial(historial.eventos)}</ul>
+        ${botonMasHistorial(tipoReparto, repartoId, historial.siguiente)}
+      </div>
+    `;
+  }
+
+  // Trae la página siguiente del historial y la agrega bajo la actual
+  async function cargarMasHistorial(boton) {
+    const lista = boton.parentElement.querySelector('[data-historial-lista]');
+    const { tipo, id, antes } = boton.dataset;
+    boton.disabled = true;
+    try {
+      const res = await fetch(`/delivery/${tipo}/${id}/historial/?antes=${encodeURIComponent(antes)}`);
+      const data = await res.json();
+      if (!res.ok) throw new Error(data.error || 'Error al cargar historial');
+      lista.insertAdjacentHTML('beforeend', filasHistorial(data.eventos));
+      if (data.siguiente) {
+        boton.dataset.antes = data.siguiente;
+        boton.disabled = false;
+      } else {
+        boton.remove();
+      }
+    } catch (error) {
+      boton.disabled = false;
+      console.error('Error al cargar historial:', error);
+    }
+  }
+
   // ===== VER DETALLE DE RETIRO =====
   async function verDetalleRetiro(retiroId) {
     const modal = document.getElementById('modalDetalleRetiro');
@@ -199,6 +256,8 @@
             <pre style="white-space:pre-wrap; font-family:inherit; margin:0;">${data.observaciones}</pre>
           </div>
           ` : ''}
+
+          ${htmlHistorial('retiro', data.id, data.historial)}
         </div>
       `;
 
@@ -237,8 +296,9 @@
       comprobantePago.removeAttribute('required');
     }
 
-    // Limpiar preview
+    // Limpiar preview y progreso de subida
     document.getElementById('previewComprobante').innerHTML = '';
+    document.getElementById('progresoComprobante').style.display = 'none';
     
     // Resetear form
     const form = document.getElementById('formMarcarRealizado');
@@ -287,6 +347,90 @@
     }
   }
 
+  // ===== SUBIDA POR PARTES DEL COMPROBANTE =====
+  // El comprobante se sube en bloques: si la señal se corta, se consulta cuántos bytes
+  // llegaron y se continúa desde ahí en vez de empezar de cero
+  const REINTENTOS_BLOQUE = 5;
+
+  function esperar(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+  }
+
+  async function pedirJSON(url, opciones) {
+    const res = await fetch(url, opciones);
+    const data = await res.json();
+    return { res, data };
+  }
+
+  function mostrarProgresoComprobante(recibidos, tamano) {
+    const progreso = document.getElementById('progresoComprobante');
+    if (!progreso) return;
+    progreso.style.display = '';
+    progreso.textContent = `Subiendo comprobante: ${Math.floor(recibidos * 100 / tamano)}%`;
+  }
+
+  async function subirComprobantePorPartes(instalacionId, archivo) {
+    const csrf = getCookie('csrftoken');
+    const inicio = await pedirJSON(`/delivery/instalacion/${instalacionId}/comprobante/subidas/`, {
+      method: 'POST',
+      headers: { 'X-CSRFToken': csrf, 'Content-Type': 'application/json' },
+      body: JSON.stringify({ nombre: archivo.name, tamano: archivo.size, tipo: archivo.type })
+    });
+    if (!inicio.res.ok || !inicio.data.success) {
+      throw inicio.data.errors || ['No se pudo iniciar la subida del comprobante'];
+    }
+
+    // Si la subida se retoma, el servidor indica cuántos bytes ya tiene
+    let subida = inicio.data.subida;
+    const url = `/delivery/subidas/${subida.id}/`;
+    let fallos = 0;
+    while (subida.recibidos < subida.tamano) {
+      mostrarProgresoComprobante(subida.recibidos, subida.tamano);
+      const desde = subida.recibidos;
+      const hasta = Math.min(desde + subida.tamano_bloque, subida.tamano) - 1;
+      let respuesta;
+      try {
+        respuesta = await pedirJSON(url, {
+          method: 'POST',
+          headers: {
+            'X-CSRFToken': csrf,
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': `bytes ${desde}-${hasta}/${subida.tamano}`
+          },
+          body: archivo.slice(desde, hasta + 1)
+        });
+      } catch (error) {
+        fallos += 1;
+        if (fallos > REINTENTOS_BLOQUE) {
+          throw ['Se perdió la conexión al subir el comprobante. Intente de nuevo para continuar desde donde quedó.'];
+        }
+        await esperar(1000 * 2 ** fallos);
+        try {
+          const estado = await pedirJSON(url, { headers: { 'X-CSRFToken': csrf } });
+          if (estado.data.subida) subida = estado.data.subida;
+        } catch (errorEstado) {
+          // Sigue sin conexión: se reintenta el mismo bloque
+        }
+        continue;
+      }
+      // En un 409 (bloque fuera de orden) la respuesta trae desde dónde seguir
+      if (respuesta.data.subida) subida = respuesta.data.subida;
+      if (!respuesta.res.ok && respuesta.res.status !== 409) {
+        throw respuesta.data.errors || ['Error al subir el comprobante'];
+      }
+      fallos = 0;
+    }
+
+    mostrarProgresoComprobante(subida.tamano, subida.tamano);
+    const confirmacion = await pedirJSON(`${url}confirmar/`, {
+      method: 'POST',
+      headers: { 'X-CSRFToken': csrf }
+    });
+    if (!confirmacion.res.ok || !confirmacion.data.success) {
+      throw confirmacion.data.errors || ['No se pudo adjuntar el comprobante'];
+    }
+  }
+
   async function submitMarcarRealizado(e) {
     e.preventDefault();
     const form = e.target;
@@ -315,6 +459,18 @@
     const csrf = getCookie('csrftoken');
     const url = `/delivery/${tipoReparto}/${repartoId}/marcar-realizado/`;
 
+    const comprobante = tipoReparto === 'instalacion' ? form.comprobante_pago.files[0] : null;
+    if (comprobante) {
+      try {
+        await subirComprobantePorPartes(repartoId, comprobante);
+      } catch (errores) {
+        mostrarErroresValidacion(Array.isArray(errores) ? errores : ['Error al subir el comprobante']);
+        return;
+      }
+      // El comprobante ya quedó adjunto a la instalación: no se envía de nuevo
+      formData.delete('comprobante_pago');
+    }
+
     try {
       const res = await fetch(url, {
         method: 'POST',
@@ -338,6 +494,35 @@
     }
   }
 
+  // ===== ACTUALIZACIONES EN VIVO =====
+  function mostrarAvisoRepartos(texto) {
+    const aviso = document.getElementById('avisoRepartosNuevos');
+    if (!aviso) return;
+    aviso.querySelector('[data-aviso-texto]').textContent = texto;
+    aviso.style.display = '';
+  }
+
+  function actualizarRepartoEnVivo(evento) {
+    const nombre = evento.tipo_reparto === 'instalacion' ? 'Instalación' : 'Retiro';
+    const tarjeta = document.querySelector(`[data-reparto="${evento.tipo_reparto}-${evento.id}"]`);
+    const hoy = new Date();
+    const fechaHoy = `${hoy.getFullYear()}-${String(hoy.getMonth() + 1).padStart(2, '0')}-${String(hoy.getDate()).padStart(2, '0')}`;
+
+    if (evento.tipo === 'desasignado') {
+      if (tarjeta) tarjeta.remove();
+      mostrarAvisoRepartos(`${nombre} #${evento.id} fue reasignado a otro repartidor.`);
+    } else if (evento.tipo === 'asignado') {
+      if (!tarjeta && evento.fecha === fechaHoy) {
+        mostrarAvisoRepartos(`Nuevo reparto asignado: ${nombre} #${evento.id} a las ${evento.hora}.`);
+      }
+    } else if (evento.tipo === 'incidente') {
+      mostrarAvisoRepartos(`Incidente en ${nombre} #${evento.id}: ${evento.descripcion}`);
+    } else if (tarjeta) {
+      const estado = tarjeta.querySelector('[data-campo="estado"]');
+      if (estado) estado.textContent = evento.estado_display;
+    }
+  }
+
   // ===== CERRAR MODALES =====
   function closeModal(modalId) {
     const modal = document.getElementById(modalId);
@@ -349,6 +534,10 @@
 
   // ===== INICIALIZACIÓN =====
   document.addEventListener('DOMContentLoaded', function() {
+    if (typeof escucharEventosRepartos === 'function') {
+      escucharEventosRepartos(actualizarRepartoEnVivo);
+    }
+
     // Botón cambiar estado del repartidor
     const btnCambiarEstado = document.getElementById('btnCambiarEstado');
     if (btnCambiarEstado) {
@@ -357,6 +546,14 @@
 
     // Event delegation para botones
     document.addEventListener('click', function(e) {
+      // Página siguiente del historial en los detalles
+      const btnMasHistorial = e.target.closest('[data-historial-mas]');
+      if (btnMasHistorial) {
+        e.preventDefault();
+        cargarMasHistorial(btnMasHistorial);
+        return;
+      }
+
       // Ver detalle instalación
       const btnDetalleInst = e.target.closest('[data-ver-detalle-instalacion]');
       if (btnDetalleInst) {
@@ -4,6 +4,8 @@
 let moneyChart = null;
 let categoryChart = null;
 let daysChart = null;
+let leadTimeChart = null;
+let hourChart = null;
 let currentViewMode = 'medium'; // 'small', 'medium', 'large'
 
 // Función para obtener datos de elementos ocultos
@@ -53,6 +55,10 @@ function initMoneyChart() {
             labels = getDataFromElement('ventas-anuales-labels');
             data = getDataFromElement('ventas-anuales-data');
             break;
+        case 'range':
+            labels = getDataFromElement('ventas-rango-labels');
+            data = getDataFromElement('ventas-rango-data');
+            break;
         default: // weekly
             labels = getDataFromElement('ventas-semanales-labels');
             data = getDataFromElement('ventas-semanales-data');
@@ -147,6 +153,10 @@ function updateMoneyChart(period, buttonElement) {
             labels = getDataFromElement('ventas-anuales-labels');
             data = getDataFromElement('ventas-anuales-data');
             break;
+        case 'range':
+            labels = getDataFromElement('ventas-rango-labels');
+            data = getDataFromElement('ventas-rango-data');
+            break;
         default:
             labels = getDataFromElement('ventas-semanales-labels');
             data = getDataFromElement('ventas-semanales-data');
@@ -196,7 +206,8 @@ function updateMoneyChart(period, buttonElement) {
             const btnText = btn.textContent.trim().toLowerCase();
             if ((period === 'weekly' && btnText === 'semanal') ||
                 (period === 'monthly' && btnText === 'mensual') ||
-                (period === 'yearly' && btnText === 'anual')) {
+                (period === 'yearly' && btnText === 'anual') ||
+                (period === 'range' && btnText === 'rango')) {
                 btn.classList.add('active');
             }
         });
@@ -508,6 +519,124 @@ function updateDaysChart(period, buttonElement) {
     }
 }
 
+// Inicializar un histograma de barras a partir de datos ocultos
+function initHistogramChart(canvasId, labelsId, dataId, label) {
+    const ctx = document.getElementById(canvasId);
+    if (!ctx) return null;
+
+    return new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels: getDataFromElement(labelsId),
+            datasets: [{
+                label: label,
+                data: getDataFromElement(dataId),
+                backgroundColor: 'rgba(46, 125, 50, 0.8)',
+                borderColor: 'rgba(46, 125, 50, 1)',
+                borderWidth: 1
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: {
+                    display: true,
+                    position: 'top'
+                }
+            },
+            scales: {
+                y: {
+                    beginAtZero: true,
+                    ticks: {
+                        stepSize: 1
+                    }
+                }
+            }
+        }
+    });
+}
+
+// Decodificar un bitmask base64 de días (bit menos significativo primero)
+function decodificarMascaraDias(mascara, dias) {
+    const bytes = atob(mascara);
+    const ocupados = new Array(dias).fill(false);
+    for (let i = 0; i < dias; i++) {
+        ocupados[i] = (bytes.charCodeAt(i >> 3) & (1 << (i & 7))) !== 0;
+    }
+    return ocupados;
+}
+
+// Dibujar el mapa de calor de ocupación (una celda por día, columnas por semana)
+function renderOccupancyHeatmap(container, datos, juegoId) {
+    const inicio = new Date(datos.inicio + 'T00:00:00');
+    const juego = juegoId ? datos.juegos.find(j => String(j.id) === String(juegoId)) : null;
+    const valores = juego
+        ? decodificarMascaraDias(juego.mascara, datos.dias).map(ocupado => ocupado ? 1 : 0)
+        : datos.ocupacion;
+
+    container.innerHTML = '';
+    // Celdas vacías para alinear el primer día con su día de la semana (lunes primero)
+    const desplazamiento = (inicio.getDay() + 6) % 7;
+    for (let i = 0; i < desplazamiento; i++) {
+        const vacia = document.createElement('div');
+        vacia.style.visibility = 'hidden';
+        container.appendChild(vacia);
+    }
+
+    valores.forEach((valor, indice) => {
+        const fecha = new Date(inicio);
+        fecha.setDate(inicio.getDate() + indice);
+        const celda = document.createElement('div');
+        celda.className = 'occupancy-cell';
+        if (valor > 0) {
+            celda.style.background = `rgba(46, 125, 50, ${0.15 + valor * 0.85})`;
+        }
+        celda.title = juego
+            ? `${fecha.toLocaleDateString('es-CL')}: ${valor ? 'reservado' : 'libre'}`
+            : `${fecha.toLocaleDateString('es-CL')}: ${Math.round(valor * 100)}% ocupado`;
+        container.appendChild(celda);
+    });
+
+    const resumen = document.getElementById('occupancyHeatmapResumen');
+    if (resumen) {
+        if (juego) {
+            resumen.textContent = `${juego.dias} días reservados de ${datos.dias}`;
+        } else {
+            const promedio = valores.reduce((a, b) => a + b, 0) / (valores.length || 1);
+            resumen.textContent = `Ocupación promedio: ${(promedio * 100).toFixed(1)}% (${datos.total_juegos} juegos habilitados)`;
+        }
+    }
+}
+
+// Cargar la ocupación anual (una sola petición, incluye el detalle por juego)
+function initOccupancyHeatmap() {
+    const container = document.getElementById('occupancyHeatmap');
+    if (!container) return;
+
+    const url = `${container.dataset.endpoint}?year=${container.dataset.year}&por_juego=1`;
+    fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+        .then(response => response.json())
+        .then(datos => {
+            if (datos.error) {
+                console.error('Error al cargar ocupación:', datos.error);
+                return;
+            }
+            const select = document.getElementById('selectOcupacionJuego');
+            if (select) {
+                datos.juegos.forEach(juego => {
+                    const option = document.createElement('option');
+                    option.value = juego.id;
+                    option.textContent = juego.nombre;
+                    select.appendChild(option);
+                });
+                select.addEventListener('change', () => renderOccupancyHeatmap(container, datos, select.value));
+            }
+            renderOccupancyHeatmap(container, datos, '');
+        })
+        .catch(error => console.error('Error al cargar ocupación:', error));
+}
+
 // Cambiar tamaño de vista de gráficos
 function setViewMode(mode) {
     currentViewMode = mode;
@@ -545,6 +674,12 @@ function setViewMode(mode) {
         if (daysChart) {
             daysChart.resize();
         }
+        if (leadTimeChart) {
+            leadTimeChart.resize();
+        }
+        if (hourChart) {
+            hourChart.resize();
+        }
     }, 100);
 }
 
@@ -568,6 +703,9 @@ document.addEventListener('DOMContentLoaded', function() {
     initMoneyChart();
     initCategoryChart();
     initDaysChart();
+    leadTimeChart = initHistogramChart('leadTimeChart', 'anticipacion-labels', 'anticipacion-data', 'Reservas por días de anticipación');
+    hourChart = initHistogramChart('hourChart', 'hora-instalacion-labels', 'hora-instalacion-data', 'Reservas por hora de instalación');
+    initOccupancyHeatmap();
 
     // Inicializar contenedores con clase medium por defecto
     const chartContainers = document.querySelectorAll('.chart-container');
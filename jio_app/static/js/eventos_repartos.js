@@ -0,0 +1,25 @@
+// Eventos de repartos en vivo (Server-Sent Events)
+// escucharEventosRepartos(callback) llama a callback con cada evento recibido:
+// { tipo, tipo_reparto, id, estado, estado_display, fecha, hora, ... }
+// El navegador reconecta solo y envía Last-Event-ID (un cursor que puede quedar algo
+// atrás), así que no se pierden eventos; los que llegan repetidos se descartan por evento_id.
+function escucharEventosRepartos(callback) {
+  if (typeof EventSource === 'undefined') return null;
+
+  const recibidos = new Set();
+  const fuente = new EventSource('/panel/repartos/eventos/');
+  ['asignado', 'desasignado', 'estado', 'incidente'].forEach(tipo => {
+    fuente.addEventListener(tipo, e => {
+      try {
+        const evento = JSON.parse(e.data);
+        if (recibidos.has(evento.evento_id)) return;
+        recibidos.add(evento.evento_id);
+        callback(evento);
+      } catch (error) {
+        console.error('Error procesando evento de reparto:', error);
+      }
+    });
+  });
+  window.addEventListener('beforeunload', () => fuente.close());
+  return fuente;
+}
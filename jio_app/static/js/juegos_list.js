@@ -141,7 +141,7 @@
             if (juego.foto) {
                 previewDiv.innerHTML = `
                     <div style="position: relative; display: inline-block;">
-                        <img src="${juego.foto}" alt="Imagen actual" style="max-width: 300px; max-height: 200px; border-radius: 8px; border: 2px solid #e0e0e0;">
+                        <img src="${juego.foto_miniatura || juego.foto}" alt="Imagen actual" style="max-width: 300px; max-height: 200px; border-radius: 8px; border: 2px solid #e0e0e0;">
                         <p style="margin-top: 0.5rem; color: #666; font-size: 0.9rem;">Imagen actual</p>
                     </div>
                 `;
@@ -34,6 +34,11 @@
       return;
     }
 
+    if (tipoReparto === 'lote') {
+      enviarLote('/panel/repartos/lote/asignar/', { repartidor_id: repartidorId, observaciones }, 'modalAsignarRepartidor');
+      return;
+    }
+
     const formData = new FormData();
     formData.append('repartidor_id', repartidorId);
     formData.append('observaciones', observaciones);
@@ -76,7 +81,8 @@
     const selectEstado = document.getElementById('nuevoEstadoSelect');
     selectEstado.innerHTML = '<option value="">Seleccione un estado</option>';
 
-    const estados = tipoReparto === 'instalacion' 
+    // En lote se usan los estados de instalación; el servidor los traduce para los retiros
+    const estados = tipoReparto !== 'retiro' 
       ? [
           { value: 'programada', label: 'Programada' },
           { value: 'realizada', label: 'Realizada' },
@@ -114,6 +120,11 @@
       return;
     }
 
+    if (tipoReparto === 'lote') {
+      enviarLote('/panel/repartos/lote/cambiar-estado/', { nuevo_estado: nuevoEstado, observaciones }, 'modalCambiarEstado');
+      return;
+    }
+
     const formData = new FormData();
     formData.append('nuevo_estado', nuevoEstado);
     formData.append('observaciones', observaciones);
@@ -354,6 +365,9 @@
         `;
       }
       
+      // Historial (más reciente primero; "Ver más" trae los anteriores)
+      html += htmlHistorial(tipoReparto, repartoId, data.historial);
+      
       html += '</div>';
       content.innerHTML = html;
       
@@ -370,6 +384,294 @@
     }
   }
 
+  // ===== HISTORIAL DEL REPARTO =====
+  function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+  }
+
+  function filasHistorial(eventos) {
+    return eventos.map(ev => `
+      <li style="padding:0.5rem 0; border-bottom:1px solid #eee; font-size:0.875rem; line-height:1.4;">
+        <div style="color:#666; font-size:0.75rem;">${escaparHtml(ev.fecha)} · ${escaparHtml(ev.actor)}${ev.sin_conexion ? ' · sin conexión' : ''}</div>
+        <div><strong>${escaparHtml(ev.tipo_display)}:</strong> ${escaparHtml(ev.descripcion)}</div>
+        ${ev.observaciones ? `<div style="color:#444; white-space:pre-wrap;">${escaparHtml(ev.observaciones)}</div>` : ''}
+      </li>
+    `).join('');
+  }
+
+  function botonMasHistorial(tipoReparto, repartoId, siguiente) {
+    if (!siguiente) return '';
+    return `<button type="button" class="btn btn-secondary btn-sm" style="margin-top:0.5rem;" data-historial-mas data-tipo="${tipoReparto}" data-id="${repartoId}" data-antes="${siguiente}">Ver más</button>`;
+  }
+
+  function htmlHistorial(tipoReparto, repartoId, historial) {
+    if (!historial || historial.eventos.length === 0) return '';
+    return `
+      <div>
+        <h4 style="margin:0 0 0.75rem 0; color:#2E7D32; font-size:1.1rem; border-bottom:2px solid #2E7D32; padding-bottom:0.5rem;">
+          <i class="fas fa-history"></i> Historial
+        </h4>
+        <ul data-historial-lista style="list-style:none; margin:0; padding-left:1rem;">${filasHistorial(historial.eventos)}</ul>
+        ${botonMasHistorial(tipoReparto, repartoId, historial.siguiente)}
+      </div>
+    `;
+  }
+
+  // Trae la página siguiente del historial y la agrega bajo la actual
+  async function cargarMasHistorial(boton) {
+    const lista = boton.parentElement.querySelector('[data-historial-lista]');
+    const { tipo, id, antes } = boton.dataset;
+    boton.disabled = true;
+    try {
+      const res = await fetch(`/delivery/${tipo}/${id}/historial/?antes=${encodeURIComponent(antes)}`);
+      const data = await res.json();
+      if (!res.ok) throw new Error(data.error || 'Error al cargar historial');
+      lista.insertAdjacentHTML('beforeend', filasHistorial(data.eventos));
+      if (data.siguiente) {
+        boton.dataset.antes = data.siguiente;
+        boton.disabled = false;
+      } else {
+        boton.remove();
+      }
+    } catch (error) {
+      boton.disabled = false;
+      console.error('Error al cargar historial:', error);
+    }
+  }
+
+  // ===== ASIGNACIÓN AUTOMÁTICA =====
+  let propuestaAsignacion = [];
+
+  function openModalAsignacionAutomatica() {
+    const modal = document.getElementById('modalAsignacionAutomatica');
+    if (!modal) return;
+
+    propuestaAsignacion = [];
+    document.getElementById('asignacionPropuesta').innerHTML = '';
+    document.getElementById('btnAplicarAsignacion').disabled = true;
+
+    modal.classList.add('show');
+    modal.setAttribute('aria-hidden', 'false');
+  }
+
+  async function previsualizarAsignacion() {
+    const desde = document.getElementById('asignacionDesde').value;
+    const hasta = document.getElementById('asignacionHasta').value;
+    const contenedor = document.getElementById('asignacionPropuesta');
+    const btnAplicar = document.getElementById('btnAplicarAsignacion');
+
+    propuestaAsignacion = [];
+    btnAplicar.disabled = true;
+    contenedor.innerHTML = '<p style="text-align:center;padding:1rem;">Calculando propuesta...</p>';
+
+    try {
+      const params = new URLSearchParams({ desde, hasta });
+      const res = await fetch(`/panel/repartos/asignacion-automatica/?${params.toString()}`);
+      const data = await res.json();
+
+      if (!res.ok || !data.success) {
+        contenedor.innerHTML = '';
+        mostrarErroresValidacion(data && data.errors ? data.errors : ['Error al calcular la propuesta']);
+        return;
+      }
+
+      if (data.asignaciones.length === 0) {
+        contenedor.innerHTML = '<p style="text-align:center;padding:1rem;color:#666;">No hay repartos sin asignar en el rango seleccionado.</p>';
+        return;
+      }
+
+      let html = `
+        <h4 style="margin:0 0 0.5rem 0; color:#2E7D32;">Carga por repartidor</h4>
+        <table class="table">
+          <thead>
+            <tr><th>Fecha</th><th>Repartidor</th><th>Paradas</th><th>Nuevas</th><th>Km</th><th>Atraso (min)</th></tr>
+          </thead>
+          <tbody>
+      `;
+      data.resumen.forEach(r => {
+        html += `
+          <tr>
+            <td>${r.fecha}</td>
+            <td>${r.repartidor}</td>
+            <td>${r.paradas}</td>
+            <td>${r.nuevas}</td>
+            <td>${r.km}</td>
+            <td>${r.minutos_atraso > 0 ? `<span class="badge badge-warning">${r.minutos_atraso}</span>` : '0'}</td>
+          </tr>
+        `;
+      });
+      html += `
+          </tbody>
+        </table>
+        <h4 style="margin:1rem 0 0.5rem 0; color:#2E7D32;">Asignaciones propuestas (${data.asignaciones.length})</h4>
+        <table class="table">
+          <thead>
+            <tr><th>Fecha</th><th>Hora</th><th>Tipo</th><th>Cliente</th><th>Dirección</th><th>Repartidor</th></tr>
+          </thead>
+          <tbody>
+      `;
+      data.asignaciones.forEach(a => {
+        html += `
+          <tr>
+            <td>${a.fecha}</td>
+            <td>${a.hora}</td>
+            <td>${a.tipo === 'instalacion' ? 'Instalación' : 'Retiro'}</td>
+            <td>${a.cliente}</td>
+            <td>${a.direccion}</td>
+            <td>${a.repartidor}</td>
+          </tr>
+        `;
+      });
+      html += '</tbody></table>';
+
+      contenedor.innerHTML = html;
+      propuestaAsignacion = data.asignaciones;
+      btnAplicar.disabled = false;
+    } catch (error) {
+      contenedor.innerHTML = '';
+      mostrarErroresValidacion(['Error de conexión al calcular la propuesta']);
+    }
+  }
+
+  async function aplicarAsignacion() {
+    if (propuestaAsignacion.length === 0) return;
+
+    const csrf = getCookie('csrftoken');
+    const btnAplicar = document.getElementById('btnAplicarAsignacion');
+    btnAplicar.disabled = true;
+
+    try {
+      const res = await fetch('/panel/repartos/asignacion-automatica/', {
+        method: 'POST',
+        headers: { 'X-CSRFToken': csrf, 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          asignaciones: propuestaAsignacion.map(a => ({ tipo: a.tipo, id: a.id, repartidor_id: a.repartidor_id }))
+        })
+      });
+      const data = await res.json();
+
+      if (!res.ok || !data.success) {
+        btnAplicar.disabled = false;
+        mostrarErroresValidacion(data && data.errors ? data.errors : ['Error al aplicar la asignación']);
+        return;
+      }
+
+      closeModal('modalAsignacionAutomatica');
+      mostrarExitoValidacion(data.message || 'Asignación aplicada correctamente');
+      setTimeout(() => location.reload(), 1000);
+    } catch (error) {
+      btnAplicar.disabled = false;
+      mostrarErroresValidacion(['Error de conexión al aplicar la asignación']);
+    }
+  }
+
+  // ===== SELECCIÓN MÚLTIPLE Y ACCIONES EN LOTE =====
+  function repartosSeleccionados() {
+    return Array.from(document.querySelectorAll('.reparto-check:checked')).map(chk => ({
+      tipo: chk.dataset.tipo,
+      id: parseInt(chk.value, 10)
+    }));
+  }
+
+  function actualizarBarraSeleccion() {
+    const cantidad = repartosSeleccionados().length;
+    const barra = document.getElementById('barraSeleccion');
+    if (!barra) return;
+    barra.style.display = cantidad > 0 ? 'block' : 'none';
+    document.getElementById('cantidadSeleccionados').textContent = cantidad;
+
+    document.querySelectorAll('[data-seleccionar-todos]').forEach(chkTodos => {
+      const checks = document.querySelectorAll(`.reparto-check[data-tipo="${chkTodos.dataset.seleccionarTodos}"]`);
+      const marcados = Array.from(checks).filter(chk => chk.checked).length;
+      chkTodos.checked = checks.length > 0 && marcados === checks.length;
+      chkTodos.indeterminate = marcados > 0 && marcados < checks.length;
+    });
+  }
+
+  function limpiarSeleccion() {
+    document.querySelectorAll('.reparto-check, [data-seleccionar-todos]').forEach(chk => {
+      chk.checked = false;
+      chk.indeterminate = false;
+    });
+    actualizarBarraSeleccion();
+  }
+
+  async function enviarLote(url, datos, modalId) {
+    const repartos = repartosSeleccionados();
+    if (repartos.length === 0) {
+      mostrarErroresValidacion(['Debe seleccionar al menos un reparto']);
+      return;
+    }
+
+    const csrf = getCookie('csrftoken');
+    try {
+      const res = await fetch(url, {
+        method: 'POST',
+        headers: { 'X-CSRFToken': csrf, 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...datos, repartos })
+      });
+      const data = await res.json();
+
+      const fallidos = (data.resultados || []).filter(r => !r.success).map(r =>
+        `${r.tipo === 'instalacion' ? 'Instalación' : 'Retiro'} #${r.id}: ${r.error}`
+      );
+
+      if (!res.ok || !data.success) {
+        mostrarErroresValidacion(fallidos.length ? fallidos : (data.errors || ['Error al procesar los repartos']));
+        return;
+      }
+
+      closeModal(modalId);
+      if (fallidos.length) {
+        mostrarErroresValidacion(fallidos, data.message);
+        setTimeout(() => location.reload(), 3000);
+      } else {
+        mostrarExitoValidacion(data.message || 'Repartos actualizados correctamente');
+        setTimeout(() => location.reload(), 1000);
+      }
+    } catch (error) {
+      mostrarErroresValidacion(['Error de conexión al procesar los repartos']);
+    }
+  }
+
+  // ===== ACTUALIZACIONES EN VIVO =====
+  const CLASES_ESTADO = {
+    programada: 'badge-info', programado: 'badge-info',
+    realizada: 'badge-success', realizado: 'badge-success',
+    cancelada: 'badge-danger', cancelado: 'badge-danger'
+  };
+
+  function actualizarRepartoEnVivo(evento) {
+    const elementos = document.querySelectorAll(`[data-reparto="${evento.tipo_reparto}-${evento.id}"]`);
+    const nombre = evento.tipo_reparto === 'instalacion' ? 'Instalación' : 'Retiro';
+
+    if (evento.tipo === 'incidente') {
+      mostrarErroresValidacion([`${nombre} #${evento.id}: ${evento.descripcion}`], 'Incidente reportado');
+      return;
+    }
+
+    elementos.forEach(el => {
+      el.querySelectorAll('[data-campo="estado"]').forEach(campo => {
+        campo.innerHTML = `<span class="badge ${CLASES_ESTADO[evento.estado] || 'badge-warning'}"></span>`;
+        campo.firstElementChild.textContent = evento.estado_display;
+      });
+      // 'desasignado' llega solo al repartidor anterior; el panel recibe el 'asignado' del nuevo
+      if (evento.tipo === 'asignado') {
+        el.querySelectorAll('[data-campo="repartidor"]').forEach(campo => {
+          if (campo.tagName === 'TD') {
+            campo.innerHTML = '<span class="badge badge-success"></span>';
+            campo.firstElementChild.textContent = evento.repartidor;
+          } else {
+            campo.innerHTML = '<i class="fas fa-user"></i> ';
+            campo.append(evento.repartidor);
+          }
+        });
+      }
+    });
+  }
+
   // ===== CERRAR MODALES =====
   function closeModal(modalId) {
     const modal = document.getElementById(modalId);
@@ -381,8 +683,19 @@
 
   // ===== INICIALIZACIÓN =====
   document.addEventListener('DOMContentLoaded', function() {
+    if (typeof escucharEventosRepartos === 'function') {
+      escucharEventosRepartos(actualizarRepartoEnVivo);
+    }
+
     // Event delegation para botones de asignar
     document.addEventListener('click', function(e) {
+      const btnMasHistorial = e.target.closest('[data-historial-mas]');
+      if (btnMasHistorial) {
+        e.preventDefault();
+        cargarMasHistorial(btnMasHistorial);
+        return;
+      }
+
       const btnAsignarInst = e.target.closest('[data-asignar-instalacion]');
       if (btnAsignarInst) {
         e.preventDefault();
@@ -438,6 +751,7 @@
       // Cerrar modales
       if (e.target.closest('[data-modal-close]')) {
         closeModal('modalAsignarRepartidor');
+        closeModal('modalAsignacionAutomatica');
         closeModal('modalCambiarEstado');
         closeModal('modalRegistrarIncidente');
         closeModal('modalVerDetalle');
@@ -450,6 +764,32 @@
       formAsignar.addEventListener('submit', submitAsignarRepartidor);
     }
 
+    // Selección múltiple
+    document.addEventListener('change', function(e) {
+      const chkTodos = e.target.closest('[data-seleccionar-todos]');
+      if (chkTodos) {
+        document.querySelectorAll(`.reparto-check[data-tipo="${chkTodos.dataset.seleccionarTodos}"]`)
+          .forEach(chk => { chk.checked = chkTodos.checked; });
+      }
+      if (chkTodos || e.target.closest('.reparto-check')) {
+        actualizarBarraSeleccion();
+      }
+    });
+
+    const btnAsignarSeleccionados = document.getElementById('btnAsignarSeleccionados');
+    if (btnAsignarSeleccionados) {
+      btnAsignarSeleccionados.addEventListener('click', () => openModalAsignarRepartidor('', 'lote'));
+      document.getElementById('btnEstadoSeleccionados').addEventListener('click', () => openModalCambiarEstado('', 'lote'));
+      document.getElementById('btnLimpiarSeleccion').addEventListener('click', limpiarSeleccion);
+    }
+
+    const btnAsignacionAutomatica = document.getElementById('btnAsignacionAutomatica');
+    if (btnAsignacionAutomatica) {
+      btnAsignacionAutomatica.addEventListener('click', openModalAsignacionAutomatica);
+      document.getElementById('btnPrevisualizarAsignacion').addEventListener('click', previsualizarAsignacion);
+      document.getElementById('btnAplicarAsignacion').addEventListener('click', aplicarAsignacion);
+    }
+
     const formEstado = document.getElementById('formCambiarEstado');
     if (formEstado) {
       formEstado.addEventListener('submit', submitCambiarEstado);
@@ -509,14 +849,14 @@
         instalacionesContainer.innerHTML = data.instalaciones.map(inst => {
           const fechaFormato = new Date(inst.fecha + 'T00:00:00').toLocaleDateString('es-ES', { day: '2-digit', month: '2-digit' });
           return `
-            <div class="agenda-card agenda-instalacion">
+            <div class="agenda-card agenda-instalacion" data-reparto="instalacion-${inst.id}">
               <div class="agenda-time">
                 ${fechaFormato}<br>${inst.hora}
               </div>
               <div class="agenda-info">
                 <strong>${inst.cliente}</strong>
                 <p>${inst.direccion}</p>
-                <span class="agenda-repartidor">
+                <span class="agenda-repartidor" data-campo="repartidor">
                   ${inst.repartidor ? `<i class="fas fa-user"></i> ${inst.repartidor}` : '<i class="fas fa-exclamation-triangle"></i> Sin asignar'}
                 </span>
               </div>
@@ -540,14 +880,14 @@
         retirosContainer.innerHTML = data.retiros.map(ret => {
           const fechaFormato = new Date(ret.fecha + 'T00:00:00').toLocaleDateString('es-ES', { day: '2-digit', month: '2-digit' });
           return `
-            <div class="agenda-card agenda-retiro">
+            <div class="agenda-card agenda-retiro" data-reparto="retiro-${ret.id}">
               <div class="agenda-time">
                 ${fechaFormato}<br>${ret.hora}
               </div>
               <div class="agenda-info">
                 <strong>${ret.cliente}</strong>
                 <p>${ret.direccion}</p>
-                <span class="agenda-repartidor">
+                <span class="agenda-repartidor" data-campo="repartidor">
                   ${ret.repartidor ? `<i class="fas fa-user"></i> ${ret.repartidor}` : '<i class="fas fa-exclamation-triangle"></i> Sin asignar'}
                 </span>
               </div>
@@ -0,0 +1,216 @@
+"""
+Subidas por partes (reanudables) de comprobantes de pago desde el panel del repartidor.
+
+El dispositivo abre una sesión con el nombre y tamaño del archivo y envía bloques con
+la cabecera Content-Range ("bytes inicio-fin/total"). Cada bloque se escribe directo
+en un archivo temporal del almacenamiento privado, sin cargar el archivo completo en
+memoria. Si la conexión se corta, el dispositivo consulta cuántos bytes llegaron
+('recibidos') y reenvía solo lo que falta. Al confirmar se revisa que el contenido sea
+una imagen JPEG, PNG o WebP (el tipo y el nombre que informa el cliente no cuentan) y el
+archivo temporal se mueve (sin copiarlo) a comprobantes/ con la extensión del formato
+detectado; las señales encolan la generación de sus versiones como con cualquier
+comprobante.
+"""
+import os
+import re
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db import transaction
+from django.utils import timezone
+
+from .imagenes import extension_comprobante, nombre_comprobante
+from .models import Instalacion, SubidaComprobante
+
+# Tamaño de bloque sugerido al dispositivo y máximo aceptado por petición
+TAMANO_BLOQUE = 256 * 1024
+TAMANO_BLOQUE_MAXIMO = 1024 * 1024
+TAMANO_MAXIMO = 20 * 1024 * 1024
+LECTURA = 64 * 1024
+CARPETA_TEMPORAL = 'subidas'
+# Sesiones sin actividad que se borran con sus archivos temporales
+HORAS_RETENCION = 48
+
+_RANGO = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class ErrorSubida(Exception):
+    """Error de una subida; estado_http es el código con que responde la vista"""
+
+    def __init__(self, mensaje, estado_http=400, subida=None):
+        super().__init__(mensaje)
+        self.estado_http = estado_http
+        self.subida = subida
+
+
+class _ArchivoTemporal(File):
+    """Archivo ya escrito en disco: FileSystemStorage lo mueve en vez de copiarlo"""
+
+    def __init__(self, ruta, nombre):
+        super().__init__(open(ruta, 'rb'), nombre)
+        self.ruta = ruta
+
+    def temporary_file_path(self):
+        return self.ruta
+
+
+def ruta_temporal(subida):
+    return storages['privado'].path(f'{CARPETA_TEMPORAL}/{subida.id}.part')
+
+
+def datos_subida(subida):
+    return {
+        'id': str(subida.id),
+        'estado': subida.estado,
+        'tamano': subida.tamano,
+        'recibidos': subida.recibidos,
+        'tamano_bloque': TAMANO_BLOQUE,
+    }
+
+
+def obtener_subida(subida_id, repartidor, bloquear=False):
+    subidas = SubidaComprobante.objects.filter(id=subida_id, repartidor=repartidor)
+    if bloquear:
+        subidas = subidas.select_for_update()
+    subida = subidas.first()
+    if subida is None:
+        raise ErrorSubida('Subida no encontrada', 404)
+    return subida
+
+
+def iniciar_subida(instalacion, repartidor, nombre_archivo, tamano, tipo_contenido):
+    """
+    Crea la sesión de subida. Si ya hay una en curso para el mismo archivo (por ejemplo
+    después de recargar la página), la retorna para continuarla.
+    """
+    if not isinstance(tamano, int) or tamano <= 0:
+        raise ErrorSubida('Tamaño de archivo inválido')
+    if tamano > TAMANO_MAXIMO:
+        raise ErrorSubida(f'El comprobante no puede superar {TAMANO_MAXIMO // (1024 * 1024)} MB')
+    if not (tipo_contenido or '').startswith('image/'):
+        raise ErrorSubida('El comprobante debe ser una imagen')
+    nombre = os.path.basename(str(nombre_archivo or ''))[-100:] or 'comprobante.jpg'
+
+    existente = SubidaComprobante.objects.filter(
+        instalacion=instalacion, repartidor=repartidor, nombre_archivo=nombre,
+        tamano=tamano, estado='en_curso'
+    ).order_by('-fecha_creacion').first()
+    if existente and os.path.exists(ruta_temporal(existente)):
+        return existente
+
+    subida = SubidaComprobante.objects.create(
+        instalacion=instalacion,
+        repartidor=repartidor,
+        nombre_archivo=nombre,
+        tipo_contenido=tipo_contenido[:100],
+        tamano=tamano,
+    )
+    ruta = ruta_temporal(subida)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    open(ruta, 'wb').close()
+    return subida
+
+
+def escribir_bloque(subida_id, repartidor, rango, flujo):
+    """
+    Escribe en el archivo temporal el bloque leído de flujo (el cuerpo de la petición)
+    según el rango "bytes inicio-fin/total". Los bloques deben llegar en orden: uno que
+    empiece después de 'recibidos' se rechaza con 409 y uno ya recibido se ignora.
+
+    El cuerpo se lee sin bloquear la fila (en redes móviles puede tardar); solo la
+    revisión final de 'recibidos' y su actualización van con select_for_update. Dos
+    reintentos del mismo bloque escriben los mismos bytes en la misma posición.
+    """
+    coincidencia = _RANGO.match(rango or '')
+    if not coincidencia:
+        raise ErrorSubida('Cabecera Content-Range inválida')
+    inicio, fin, total = map(int, coincidencia.groups())
+
+    subida = obtener_subida(subida_id, repartidor)
+    _validar_bloque(subida, inicio, fin, total)
+    if fin < subida.recibidos:
+        return subida
+
+    ruta = ruta_temporal(subida)
+    esperados = fin - inicio + 1
+    escritos = 0
+    try:
+        with open(ruta, 'r+b') as archivo:
+            archivo.seek(inicio)
+            while escritos < esperados:
+                datos = flujo.read(min(LECTURA, esperados - escritos))
+                if not datos:
+                    break
+                archivo.write(datos)
+                escritos += len(datos)
+    except FileNotFoundError:
+        raise ErrorSubida('El archivo temporal ya no existe; inicie la subida de nuevo', 410, subida)
+    if escritos < esperados:
+        raise ErrorSubida('El bloque llegó incompleto', 400, subida)
+
+    with transaction.atomic():
+        subida = obtener_subida(subida_id, repartidor, bloquear=True)
+        # Otra petición pudo confirmar la subida o avanzar 'recibidos' mientras se leía
+        _validar_bloque(subida, inicio, fin, total)
+        if fin + 1 > subida.recibidos:
+            subida.recibidos = fin + 1
+            subida.save(update_fields=['recibidos', 'fecha_actualizacion'])
+    return subida
+
+
+def _validar_bloque(subida, inicio, fin, total):
+    if subida.estado != 'en_curso':
+        raise ErrorSubida('La subida ya fue confirmada', 409, subida)
+    if total != subida.tamano or fin < inicio or fin >= total:
+        raise ErrorSubida('Rango fuera del archivo', 400, subida)
+    if fin - inicio + 1 > TAMANO_BLOQUE_MAXIMO:
+        raise ErrorSubida(f'Los bloques no pueden superar {TAMANO_BLOQUE_MAXIMO} bytes', 400, subida)
+    if inicio > subida.recibidos:
+        raise ErrorSubida(f'Falta el bloque desde el byte {subida.recibidos}', 409, subida)
+
+
+def confirmar_subida(subida_id, repartidor):
+    """
+    Adjunta el archivo completo a la instalación y retorna la instalación. Confirmar
+    de nuevo una subida ya confirmada (reintento) no hace nada.
+    """
+    with transaction.atomic():
+        subida = obtener_subida(subida_id, repartidor, bloquear=True)
+        instalacion = Instalacion.objects.select_for_update().get(pk=subida.instalacion_id)
+        if subida.estado == 'completada':
+            return instalacion
+        if subida.recibidos < subida.tamano:
+            raise ErrorSubida(f'Faltan {subida.tamano - subida.recibidos} bytes por subir', 409, subida)
+        if instalacion.repartidor_id != subida.repartidor_id:
+            raise ErrorSubida('La instalación ya no está asignada a este repartidor', 403, subida)
+        ruta = ruta_temporal(subida)
+        if not os.path.exists(ruta):
+            raise ErrorSubida('El archivo temporal ya no existe; inicie la subida de nuevo', 410, subida)
+
+        archivo = _ArchivoTemporal(ruta, subida.nombre_archivo)
+        try:
+            extension = extension_comprobante(archivo)
+            if extension is None:
+                raise ErrorSubida('El comprobante debe ser una imagen JPEG, PNG o WebP', 400, subida)
+            instalacion.comprobante_pago.save(
+                nombre_comprobante(subida.nombre_archivo, extension), archivo, save=False
+            )
+        finally:
+            archivo.close()
+        instalacion.save(update_fields=['comprobante_pago', 'comprobante_variantes'])
+        subida.estado = 'completada'
+        subida.save(update_fields=['estado', 'fecha_actualizacion'])
+    return instalacion
+
+
+def limpiar_subidas_abandonadas():
+    """Borra las sesiones sin actividad reciente y sus archivos temporales"""
+    limite = timezone.now() - timedelta(hours=HORAS_RETENCION)
+    antiguas = SubidaComprobante.objects.filter(fecha_actualizacion__lt=limite)
+    for subida in antiguas.filter(estado='en_curso').iterator():
+        ruta = ruta_temporal(subida)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    eliminadas, _ = antiguas.delete()
+    return eliminadas
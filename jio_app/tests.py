@@ -0,0 +1,895 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .archivos_privados import puede_ver
+from .asignacion import aplicar_asignacion, proponer_asignacion
+from .cola import (
+    TIEMPO_MAXIMO_EJECUCION, encolar, encolar_unica_al_confirmar, ejecutar_tarea, rescatar_tareas_abandonadas,
+)
+from .conciliacion import conciliar_cartola, leer_cartola
+from .historial import EVENTOS_POR_PAGINA, evento_historial, registrar
+from .hyperloglog import ERROR_ESTANDAR, HyperLogLog, combinar_sketches
+from .models import (
+    AccionSincronizada, Cliente, DetalleReserva, EventoReparto, Instalacion, Juego, Pago, Repartidor, Reserva, ResumenDiario,
+    ResumenDiarioJuego, Retiro, SubidaComprobante, TareaEnCola, Usuario,
+)
+from .programador import ExpresionCron
+from .repartos import cambiar_estado_en_lote
+from .reportes import contar_clientes_distintos, reconstruir_resumenes_diarios, reconstruir_resumenes_juegos
+from .rutas import ORIGEN_RUTAS, calcular_distancia_km, planificar_ruta
+from .sincronizacion import aplicar_acciones
+from .subidas import TAMANO_BLOQUE_MAXIMO, ErrorSubida, escribir_bloque, iniciar_subida, ruta_temporal
+
+
+def _crear_cliente(username, nombre='Cliente', apellido='Prueba'):
+    usuario = Usuario.objects.create(username=username, first_name=nombre, last_name=apellido)
+    return Cliente.objects.create(usuario=usuario, rut=f'{usuario.id:08d}-0')
+
+
+def _crear_reserva(cliente, fecha_evento, total=0, estado='Confirmada'):
+    return Reserva.objects.create(
+        cliente=cliente, fecha_evento=fecha_evento, hora_instalacion=time(10), hora_retiro=time(18),
+        direccion_evento='Calle 1', estado=estado, total_reserva=Decimal(total)
+    )
+
+
+def _crear_repartidor(username):
+    return Repartidor.objects.create(usuario=Usuario.objects.create(
+        username=username, first_name=username.capitalize(), tipo_usuario='repartidor'
+    ))
+
+
+def _crear_instalacion(reserva, repartidor=None, **campos):
+    return Instalacion.objects.create(
+        reserva=reserva, repartidor=repartidor, fecha_instalacion=reserva.fecha_evento,
+        hora_instalacion=time(10), direccion_instalacion='Calle 1', telefono_cliente='1', **campos
+    )
+
+
+def _ejecutar_tareas(*nombres):
+    """Ejecuta las tareas pendientes con esos nombres, como lo harían los workers"""
+    for tarea in TareaEnCola.objects.filter(estado='pendiente', nombre__in=nombres).order_by('id'):
+        ejecutar_tarea(tarea)
+
+
+class HyperLogLogTests(SimpleTestCase):
+
+    def test_sketch_vacio_estima_cero(self):
+        self.assertEqual(HyperLogLog().estimar(), 0)
+
+    def test_repetidos_cuentan_una_vez(self):
+        sketch = HyperLogLog.desde_valores([7, 7, 7, '7'])
+        self.assertEqual(sketch.estimar(), 1)
+
+    def test_estimacion_dentro_del_error(self):
+        for cantidad in (50, 1000, 20000):
+            estimacion = HyperLogLog.desde_valores(range(cantidad)).estimar()
+            self.assertLessEqual(abs(estimacion - cantidad), 4 * ERROR_ESTANDAR * cantidad, cantidad)
+
+    def test_combinar_es_la_union(self):
+        a = HyperLogLog.desde_valores(range(0, 3000))
+        b = HyperLogLog.desde_valores(range(2000, 5000))
+        union = HyperLogLog.desde_valores(range(0, 5000))
+        self.assertEqual(HyperLogLog(a.to_bytes()).combinar(b).to_bytes(), union.to_bytes())
+        self.assertEqual(combinar_sketches([a.to_bytes(), None, b.to_bytes()]).to_bytes(), union.to_bytes())
+
+    def test_combinar_toma_el_maximo_por_registro(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        a.registros[0], b.registros[0] = 5, 3
+        a.registros[1], b.registros[1] = 2, 64
+        a.combinar(b)
+        self.assertEqual((a.registros[0], a.registros[1]), (5, 64))
+
+    def test_serializacion(self):
+        sketch = HyperLogLog.desde_valores(range(100))
+        self.assertEqual(HyperLogLog(sketch.to_bytes()).estimar(), sketch.estimar())
+        with self.assertRaises(ValueError):
+            HyperLogLog(b'\x00' * 10)
+
+
+class ExpresionCronTests(SimpleTestCase):
+
+    def test_campos(self):
+        cron = ExpresionCron('*/15 8-10,22 1 */3 *')
+        self.assertEqual(cron.minutos, {0, 15, 30, 45})
+        self.assertEqual(cron.horas, {8, 9, 10, 22})
+        self.assertEqual(cron.dias, {1})
+        self.assertEqual(cron.meses, {1, 4, 7, 10})
+        self.assertEqual(cron.dias_semana, set(range(7)))
+
+    def test_domingo_es_0_y_7(self):
+        self.assertEqual(ExpresionCron('0 0 * * 7').dias_semana, {0})
+        self.assertEqual(ExpresionCron('0 0 * * 5-7').dias_semana, {5, 6, 0})
+
+    def test_expresiones_invalidas(self):
+        for expresion in ('* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '* * * 13 *',
+                          '5-1 * * * *', '*/0 * * * *', 'x * * * *'):
+            with self.assertRaises(ValueError, msg=expresion):
+                ExpresionCron(expresion)
+
+    def test_coincide(self):
+        cron = ExpresionCron('5 0 * * *')
+        self.assertTrue(cron.coincide(datetime(2026, 3, 10, 0, 5)))
+        self.assertFalse(cron.coincide(datetime(2026, 3, 10, 0, 6)))
+        self.assertFalse(cron.coincide(datetime(2026, 3, 10, 1, 5)))
+
+    def test_dia_del_mes_o_dia_de_la_semana(self):
+        # Como en cron: con ambos campos restringidos basta que coincida uno
+        cron = ExpresionCron('0 12 1 * 1')
+        self.assertTrue(cron.coincide(datetime(2026, 10, 1, 12, 0)))   # jueves 1
+        self.assertTrue(cron.coincide(datetime(2026, 10, 5, 12, 0)))   # lunes 5
+        self.assertFalse(cron.coincide(datetime(2026, 10, 6, 12, 0)))  # martes 6
+        # Con uno libre deben coincidir los dos
+        solo_lunes = ExpresionCron('0 12 * * 1')
+        self.assertFalse(solo_lunes.coincide(datetime(2026, 10, 1, 12, 0)))
+
+    def test_siguiente(self):
+        cron = ExpresionCron('15 0 1 * *')
+        self.assertEqual(cron.siguiente(datetime(2026, 10, 19, 8, 30, 12)), datetime(2026, 11, 1, 0, 15))
+        self.assertEqual(cron.siguiente(datetime(2026, 12, 1, 0, 15)), datetime(2027, 1, 1, 0, 15))
+        self.assertIsNone(ExpresionCron('0 0 31 2 *').siguiente(datetime(2026, 1, 1)))
+
+
+def _parada(tipo, hora, km_al_norte, nombre):
+    """Parada a km_al_norte kilómetros al norte del origen (None sin ubicación)"""
+    lat = ORIGEN_RUTAS[0] + km_al_norte / 111.2 if km_al_norte is not None else None
+    return {'tipo': tipo, 'hora': hora, 'lat': lat, 'lng': ORIGEN_RUTAS[1], 'nombre': nombre}
+
+
+class PlanificarRutaTests(SimpleTestCase):
+
+    def test_sin_paradas(self):
+        ruta = planificar_ruta([])
+        self.assertEqual((ruta['paradas'], ruta['km_total'], ruta['minutos_atraso']), ([], 0.0, 0))
+
+    def test_paradas_sin_ubicacion_aparte_y_por_hora(self):
+        ruta = planificar_ruta([
+            _parada('retiro', time(18, 0), None, 'tarde'),
+            _parada('retiro', time(12, 0), 2, 'con ubicacion'),
+            _parada('instalacion', time(9, 0), None, 'manana'),
+        ])
+        self.assertEqual([p['nombre'] for p in ruta['paradas']], ['con ubicacion'])
+        self.assertEqual([p['nombre'] for p in ruta['sin_ubicacion']], ['manana', 'tarde'])
+
+    def test_instalacion_llega_al_abrir_la_ventana(self):
+        parada = _parada('instalacion', time(10, 0), 5, 'unica')
+        ruta = planificar_ruta([parada])
+        distancia = calcular_distancia_km(*ORIGEN_RUTAS, parada['lat'], parada['lng'])
+        self.assertEqual(ruta['paradas'][0]['llegada'], '08:30')
+        self.assertEqual(ruta['paradas'][0]['km_desde_anterior'], distancia)
+        self.assertEqual(ruta['km_total'], round(2 * distancia, 1))
+        self.assertEqual(ruta['minutos_atraso'], 0)
+
+    def test_misma_hora_no_zigzaguea(self):
+        ruta = planificar_ruta([
+            _parada('retiro', time(10, 0), 3, 'lejos'),
+            _parada('retiro', time(10, 0), 1, 'cerca'),
+            _parada('retiro', time(10, 0), 2, 'medio'),
+        ])
+        # Ida y vuelta cuestan lo mismo: basta que recorra la línea en un sentido
+        self.assertIn([p['nombre'] for p in ruta['paradas']], (['cerca', 'medio', 'lejos'], ['lejos', 'medio', 'cerca']))
+        self.assertEqual(ruta['minutos_atraso'], 0)
+        self.assertAlmostEqual(ruta['km_total'], 6, delta=0.3)
+
+    def test_ventanas_horarias_antes_que_distancia(self):
+        ruta = planificar_ruta([
+            _parada('retiro', time(16, 0), 1, 'cerca tarde'),
+            _parada('retiro', time(9, 0), 10, 'lejos temprano'),
+        ])
+        self.assertEqual([p['nombre'] for p in ruta['paradas']], ['lejos temprano', 'cerca tarde'])
+        self.assertEqual([p['llegada'] for p in ruta['paradas']], ['09:00', '16:00'])
+        self.assertEqual(ruta['minutos_atraso'], 0)
+
+    def test_atraso_inevitable(self):
+        # 60 km entre dos instalaciones a la misma hora: la segunda llega tarde
+        ruta = planificar_ruta([
+            _parada('instalacion', time(10, 0), 0, 'bodega'),
+            _parada('instalacion', time(10, 0), 60, 'lejos'),
+        ])
+        self.assertEqual(len(ruta['paradas']), 2)
+        self.assertGreater(ruta['minutos_atraso'], 0)
+
+
+class AplicarAccionesTests(TestCase):
+
+    def setUp(self):
+        usuario = Usuario.objects.create(username='repartidor', tipo_usuario='repartidor')
+        self.repartidor = Repartidor.objects.create(usuario=usuario)
+
+    def _accion(self, id_accion, estado='Deshabilitado', **datos):
+        return {'id': id_accion, 'tipo': 'estado_repartidor', 'estado': estado, **datos}
+
+    def _estado(self):
+        self.repartidor.refresh_from_db()
+        return self.repartidor.estado
+
+    def test_aplica_y_guarda_el_resultado(self):
+        resultados = aplicar_acciones(self.repartidor, [self._accion('a1')])
+        self.assertTrue(resultados[0]['success'])
+        self.assertEqual(resultados[0]['id'], 'a1')
+        self.assertNotIn('duplicada', resultados[0])
+        self.assertEqual(self._estado(), 'Deshabilitado')
+        self.assertEqual(AccionSincronizada.objects.get(id_accion='a1').resultado, resultados[0])
+
+    def test_repetida_en_otra_llamada_no_se_aplica(self):
+        primero = aplicar_acciones(self.repartidor, [self._accion('a1')])[0]
+        Repartidor.objects.filter(id=self.repartidor.id).update(estado='Habilitado')
+        repetida = aplicar_acciones(self.repartidor, [self._accion('a1')])[0]
+        self.assertEqual(repetida, {**primero, 'duplicada': True})
+        self.assertEqual(self._estado(), 'Habilitado')
+        self.assertEqual(AccionSincronizada.objects.filter(id_accion='a1').count(), 1)
+
+    def test_repetida_en_el_mismo_lote(self):
+        resultados = aplicar_acciones(self.repartidor, [
+            self._accion('a1'),
+            self._accion('a1', estado='Habilitado'),
+        ])
+        self.assertNotIn('duplicada', resultados[0])
+        self.assertEqual(resultados[1], {**resultados[0], 'duplicada': True})
+        self.assertEqual(self._estado(), 'Deshabilitado')
+
+    def test_el_id_es_por_repartidor(self):
+        otro = Repartidor.objects.create(usuario=Usuario.objects.create(username='otro', tipo_usuario='repartidor'))
+        aplicar_acciones(self.repartidor, [self._accion('a1')])
+        resultado = aplicar_acciones(otro, [self._accion('a1')])[0]
+        self.assertNotIn('duplicada', resultado)
+        otro.refresh_from_db()
+        self.assertEqual(otro.estado, 'Deshabilitado')
+
+    def test_fallidas_tambien_se_recuerdan(self):
+        resultados = aplicar_acciones(self.repartidor, [
+            {'id': 'x1', 'tipo': 'borrar_todo'},
+            self._accion('x2', estado='Vacaciones'),
+        ])
+        self.assertEqual(resultados[0]['error'], 'Tipo de acción inválido')
+        self.assertEqual(resultados[1]['error'], 'Estado inválido')
+        # Un reintento devuelve el mismo error sin evaluarlas otra vez
+        repetidas = aplicar_acciones(self.repartidor, [self._accion('x2')])
+        self.assertEqual(repetidas[0], {**resultados[1], 'duplicada': True})
+        self.assertEqual(self._estado(), 'Habilitado')
+
+    def test_sin_id(self):
+        resultados = aplicar_acciones(self.repartidor, [self._accion(None), 'no es un diccionario'])
+        self.assertEqual(resultados, [{'id': None, 'success': False, 'error': 'La acción no tiene id'}] * 2)
+        self.assertFalse(AccionSincronizada.objects.exists())
+        self.assertEqual(self._estado(), 'Habilitado')
+
+    def test_accion_demasiado_antigua(self):
+        ahora = timezone.now()
+        antigua = self._accion('v1', fecha=(ahora - timedelta(days=4)).isoformat())
+        resultado = aplicar_acciones(self.repartidor, [antigua], ahora=ahora)[0]
+        self.assertFalse(resultado['success'])
+        self.assertEqual(self._estado(), 'Habilitado')
+
+
+class EscribirBloqueTests(TestCase):
+
+    CONTENIDO = bytes(range(256)) * 4
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajustes = self.settings(STORAGES={
+            **settings.STORAGES,
+            'privado': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': directorio}},
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.repartidor = Repartidor.objects.create(
+            usuario=Usuario.objects.create(username='repartidor', tipo_usuario='repartidor')
+        )
+        cliente = Cliente.objects.create(usuario=Usuario.objects.create(username='cliente'), rut='11111111-1')
+        reserva = Reserva.objects.create(
+            cliente=cliente, fecha_evento=date(2026, 10, 19), hora_instalacion=time(10),
+            hora_retiro=time(18), direccion_evento='Calle 1'
+        )
+        instalacion = Instalacion.objects.create(
+            reserva=reserva, repartidor=self.repartidor, fecha_instalacion=date(2026, 10, 19),
+            hora_instalacion=time(10), direccion_instalacion='Calle 1', telefono_cliente='1'
+        )
+        self.subida = iniciar_subida(instalacion, self.repartidor, 'foto.jpg', len(self.CONTENIDO), 'image/jpeg')
+
+    def _enviar(self, inicio, fin, total=None, datos=None):
+        total = len(self.CONTENIDO) if total is None else total
+        datos = self.CONTENIDO[inicio:fin + 1] if datos is None else datos
+        return escribir_bloque(self.subida.id, self.repartidor, f'bytes {inicio}-{fin}/{total}', io.BytesIO(datos))
+
+    def _archivo(self):
+        with open(ruta_temporal(self.subida), 'rb') as archivo:
+            return archivo.read()
+
+    def _error(self, estado_http, *args, **kwargs):
+        with self.assertRaises(ErrorSubida) as contexto:
+            self._enviar(*args, **kwargs)
+        self.assertEqual(contexto.exception.estado_http, estado_http)
+
+    def test_bloques_en_orden(self):
+        self.assertEqual(self._enviar(0, 399).recibidos, 400)
+        self.assertEqual(self._enviar(400, 1023).recibidos, 1024)
+        self.assertEqual(self._archivo(), self.CONTENIDO)
+
+    def test_bloque_ya_recibido_se_ignora(self):
+        self._enviar(0, 511)
+        subida = self._enviar(0, 255, datos=b'x' * 256)
+        self.assertEqual(subida.recibidos, 512)
+        self.assertEqual(self._archivo(), self.CONTENIDO[:512])
+
+    def test_bloque_que_se_superpone_avanza(self):
+        self._enviar(0, 511)
+        self.assertEqual(self._enviar(256, 767).recibidos, 768)
+        self.assertEqual(self._archivo(), self.CONTENIDO[:768])
+
+    def test_bloque_salteado(self):
+        self._enviar(0, 255)
+        self._error(409, 512, 767)
+        self.subida.refresh_from_db()
+        self.assertEqual(self.subida.recibidos, 256)
+
+    def test_rangos_invalidos(self):
+        for rango in ('', 'bytes 0-10', 'bytes=0-10/1024', 'bytes -1-10/1024'):
+            with self.assertRaises(ErrorSubida, msg=rango) as contexto:
+                escribir_bloque(self.subida.id, self.repartidor, rango, io.BytesIO(b''))
+            self.assertEqual(contexto.exception.estado_http, 400)
+        self._error(400, 0, 99, total=2048)
+        self._error(400, 100, 99, datos=b'')
+        self._error(400, 1000, 1024, datos=b'x' * 25)
+
+    def test_bloque_demasiado_grande(self):
+        SubidaComprobante.objects.filter(id=self.subida.id).update(tamano=TAMANO_BLOQUE_MAXIMO * 2)
+        self._error(400, 0, TAMANO_BLOQUE_MAXIMO, total=TAMANO_BLOQUE_MAXIMO * 2, datos=b'')
+
+    def test_bloque_incompleto_no_avanza(self):
+        self._error(400, 0, 511, datos=self.CONTENIDO[:100])
+        self.subida.refresh_from_db()
+        self.assertEqual(self.subida.recibidos, 0)
+
+    def test_subida_confirmada(self):
+        SubidaComprobante.objects.filter(id=self.subida.id).update(estado='completada')
+        self._error(409, 0, 255)
+
+    def test_subida_de_otro_repartidor(self):
+        otro = Repartidor.objects.create(usuario=Usuario.objects.create(username='otro', tipo_usuario='repartidor'))
+        with self.assertRaises(ErrorSubida) as contexto:
+            escribir_bloque(self.subida.id, otro, 'bytes 0-255/1024', io.BytesIO(self.CONTENIDO[:256]))
+        self.assertEqual(contexto.exception.estado_http, 404)
+
+    def test_archivo_temporal_borrado(self):
+        os.remove(ruta_temporal(self.subida))
+        self._error(410, 0, 255)
+
+
+class ColaTests(TestCase):
+
+    def _en_proceso(self, nombre, minutos, intentos=1, max_intentos=5):
+        tarea = encolar(nombre, max_intentos=max_intentos, ruta='x')
+        TareaEnCola.objects.filter(id=tarea.id).update(
+            estado='en_proceso', intentos=intentos,
+            fecha_inicio=timezone.now() - timedelta(minutes=minutos)
+        )
+        return tarea
+
+    def _estado(self, tarea):
+        tarea.refresh_from_db()
+        return tarea.estado
+
+    def test_rescata_solo_las_vencidas(self):
+        vencida = self._en_proceso('eliminar_archivo', TIEMPO_MAXIMO_EJECUCION.total_seconds() / 60 + 1)
+        reciente = self._en_proceso('eliminar_archivo', 1)
+        self.assertEqual(rescatar_tareas_abandonadas(), (1, 0))
+        self.assertEqual(self._estado(vencida), 'pendiente')
+        self.assertEqual(self._estado(reciente), 'en_proceso')
+
+    def test_sin_intentos_restantes_queda_fallida(self):
+        agotada = self._en_proceso('eliminar_archivo', 60, intentos=5, max_intentos=5)
+        self.assertEqual(rescatar_tareas_abandonadas(), (0, 1))
+        self.assertEqual(self._estado(agotada), 'fallida')
+        self.assertEqual(agotada.intentos, 5)
+
+    def test_tiempo_maximo_por_tarea(self):
+        # procesar_imagen declara 10 minutos
+        imagen = self._en_proceso('procesar_imagen', 15)
+        archivo = self._en_proceso('eliminar_archivo', 15)
+        rescatar_tareas_abandonadas()
+        self.assertEqual(self._estado(imagen), 'pendiente')
+        self.assertEqual(self._estado(archivo), 'en_proceso')
+
+    def test_encolar_unica_no_repite_pendientes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                encolar_unica_al_confirmar('actualizar_contadores_cliente', cliente_id=1)
+            encolar_unica_al_confirmar('actualizar_contadores_cliente', cliente_id=2)
+        self.assertEqual(TareaEnCola.objects.filter(nombre='actualizar_contadores_cliente').count(), 2)
+
+        # Una en proceso pudo leer los datos antes del cambio: se encola otra
+        TareaEnCola.objects.update(estado='en_proceso')
+        with self.captureOnCommitCallbacks(execute=True):
+            encolar_unica_al_confirmar('actualizar_contadores_cliente', cliente_id=1)
+        self.assertEqual(TareaEnCola.objects.filter(estado='pendiente').count(), 1)
+
+
+class ConciliacionTests(TestCase):
+
+    def setUp(self):
+        self.hoy = timezone.localdate()
+        self.perez = _crear_cliente('perez', 'Juan', 'Pérez Soto')
+        self.rojas = _crear_cliente('rojas', 'Ana', 'Rojas')
+        reserva_perez = _crear_reserva(self.perez, self.hoy + timedelta(days=10), 25000)
+        reserva_rojas = _crear_reserva(self.rojas, self.hoy + timedelta(days=10), 25000)
+        self.pago_perez = Pago.objects.create(reserva=reserva_perez, monto=25000, metodo_pago='transferencia')
+        self.pago_rojas = Pago.objects.create(reserva=reserva_rojas, monto=25000, metodo_pago='transferencia')
+        self.sin_pagos = _crear_reserva(_crear_cliente('munoz', 'Luis', 'Muñoz'), self.hoy + timedelta(days=5), 40000)
+
+    def _cartola(self, *filas):
+        contenido = 'Fecha;Glosa;Abono\n' + ''.join(f'{self.hoy:%d/%m/%Y};{glosa};{monto}\n' for glosa, monto in filas)
+        lineas, errores = leer_cartola(contenido.encode('utf-8'))
+        self.assertEqual(errores, [])
+        return lineas
+
+    def _conciliar(self, lineas, **opciones):
+        with self.captureOnCommitCallbacks(execute=True):
+            return conciliar_cartola(lineas, **opciones)
+
+    def test_concilia_por_monto_y_apellido(self):
+        resultado = self._conciliar(self._cartola(
+            ('TRANSF DE JUAN PEREZ', '$25.000'),
+            ('TEF LUIS MUNOZ', '40000'),
+            ('DEPOSITO DESCONOCIDO', '25000'),
+        ))
+        self.assertEqual([c['id'] for _, c in resultado['pagos']], [self.pago_perez.id])
+        self.assertEqual([c['id'] for _, c in resultado['reservas']], [self.sin_pagos.id])
+        self.assertEqual([linea.numero for linea in resultado['sin_coincidencia']], [4])
+
+        self.pago_perez.refresh_from_db()
+        self.pago_rojas.refresh_from_db()
+        self.assertEqual((self.pago_perez.estado, self.pago_rojas.estado), ('pagado', 'pendiente'))
+        nuevo = Pago.objects.get(reserva=self.sin_pagos)
+        self.assertEqual((nuevo.estado, nuevo.monto), ('pagado', 40000))
+        saldos = TareaEnCola.objects.get(nombre='actualizar_saldos_reservas')
+        self.assertEqual(saldos.argumentos, {'reserva_ids': sorted([self.pago_perez.reserva_id, self.sin_pagos.id])})
+
+    def test_simular_no_modifica(self):
+        resultado = self._conciliar(self._cartola(('JUAN PEREZ', '25000')), aplicar=False)
+        self.assertEqual(len(resultado['pagos']), 1)
+        self.pago_perez.refresh_from_db()
+        self.assertEqual(self.pago_perez.estado, 'pendiente')
+
+    def test_reimportar_la_misma_cartola_no_duplica(self):
+        lineas = self._cartola(('JUAN PEREZ', '25000'), ('LUIS MUNOZ', '40000'))
+        self._conciliar(lineas)
+        pagos = Pago.objects.count()
+        resultado = self._conciliar(lineas)
+        self.assertEqual((resultado['pagos'], resultado['reservas']), ([], []))
+        self.assertEqual(len(resultado['sin_coincidencia']), 2)
+        self.assertEqual(Pago.objects.count(), pagos)
+
+    def test_candidatos_que_cambiaron_durante_la_conciliacion(self):
+        from . import conciliacion
+        # Candidatos leídos antes de que otro usuario cancelara el pago y registrara uno para la reserva
+        pagos, reservas = list(conciliacion._candidatos_pagos()), list(conciliacion._candidatos_reservas())
+        Pago.objects.filter(id=self.pago_perez.id).update(estado='reembolsado')
+        Pago.objects.create(reserva=self.sin_pagos, monto=40000, metodo_pago='efectivo', estado='pagado')
+
+        with mock.patch.object(conciliacion, '_candidatos_pagos', lambda: pagos), \
+                mock.patch.object(conciliacion, '_candidatos_reservas', lambda: reservas):
+            resultado = self._conciliar(self._cartola(('JUAN PEREZ', '25000'), ('LUIS MUNOZ', '40000')))
+        self.assertEqual((resultado['pagos'], resultado['reservas']), ([], []))
+        self.assertEqual([linea.numero for linea in resultado['sin_coincidencia']], [2, 3])
+        self.pago_perez.refresh_from_db()
+        self.assertEqual(self.pago_perez.estado, 'reembolsado')
+        self.assertEqual(Pago.objects.filter(reserva=self.sin_pagos).count(), 1)
+        self.assertFalse(TareaEnCola.objects.filter(nombre='actualizar_saldos_reservas').exists())
+
+
+class SaldoPendienteTests(TestCase):
+
+    def setUp(self):
+        self.cliente = _crear_cliente('cliente')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reserva = _crear_reserva(self.cliente, date(2026, 10, 19), 30000)
+
+    def _saldo(self, reserva=None):
+        _ejecutar_tareas('actualizar_saldos_reservas')
+        reserva = reserva or self.reserva
+        reserva.refresh_from_db()
+        return reserva.saldo_pendiente
+
+    def test_pagos_guardados_y_eliminados(self):
+        self.assertEqual(self._saldo(), 30000)
+        with self.captureOnCommitCallbacks(execute=True):
+            pago = Pago.objects.create(reserva=self.reserva, monto=10000, metodo_pago='efectivo', estado='pagado')
+            Pago.objects.create(reserva=self.reserva, monto=5000, metodo_pago='efectivo', estado='pendiente')
+        self.assertEqual(self._saldo(), 20000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pago.monto = 40000
+            pago.save()
+        self.assertEqual(self._saldo(), 0)
+
+        otra = _crear_reserva(self.cliente, date(2026, 10, 20), 50000)
+        with self.captureOnCommitCallbacks(execute=True):
+            pago.reserva = otra
+            pago.save()
+        self.assertEqual((self._saldo(), self._saldo(otra)), (30000, 10000))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pago.delete()
+        self.assertEqual(self._saldo(otra), 50000)
+
+    def test_reserva_cancelada_no_adeuda(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reserva.estado = 'cancelada'
+            self.reserva.save()
+        self.assertEqual(self._saldo(), 0)
+
+    def test_instalacion_cobrada_en_la_entrega(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            instalacion = _crear_instalacion(self.reserva)
+        self.assertEqual(self._saldo(), 30000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            instalacion.estado_instalacion = 'realizada'
+            instalacion.metodo_pago = 'efectivo'
+            instalacion.save()
+        self.assertEqual(self._saldo(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            instalacion.estado_instalacion = 'programada'
+            instalacion.save()
+        self.assertEqual(self._saldo(), 30000)
+
+    def test_cambio_de_estado_en_lote(self):
+        instalacion = _crear_instalacion(self.reserva, metodo_pago='transferencia')
+        with self.captureOnCommitCallbacks(execute=True):
+            resultados = cambiar_estado_en_lote([('instalacion', instalacion.id)], 'realizada', hoy=date(2026, 10, 19))
+        self.assertTrue(resultados[0]['success'])
+        self.assertEqual(self._saldo(), 0)
+
+    def test_varias_escrituras_encolan_un_solo_recalculo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                Pago.objects.create(reserva=self.reserva, monto=1000, metodo_pago='efectivo', estado='pagado')
+        self.assertEqual(TareaEnCola.objects.filter(nombre='actualizar_saldos_reservas', estado='pendiente').count(), 1)
+        self.assertEqual(self._saldo(), 27000)
+
+
+class ResumenesTestCase(TestCase):
+    """Escrituras sobre reservas cuyos resúmenes incrementales deben igualar una reconstrucción completa"""
+
+    TAREAS = ('actualizar_resumen_diario', 'actualizar_resumen_juego', 'actualizar_contadores_cliente')
+
+    def setUp(self):
+        self.ana = _crear_cliente('ana')
+        self.beto = _crear_cliente('beto')
+        self.dia1, self.dia2 = date(2026, 10, 10), date(2026, 10, 11)
+
+    def _escribir(self, funcion):
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = funcion()
+        _ejecutar_tareas(*self.TAREAS)
+        return resultado
+
+
+class ResumenDiarioTests(ResumenesTestCase):
+
+    def _resumenes(self):
+        return sorted(
+            (r.fecha, r.total_reservas, r.total_ventas, r.clientes_distintos, bytes(r.clientes_hll))
+            for r in ResumenDiario.objects.all()
+        )
+
+    def _comprobar(self, descripcion):
+        incrementales = self._resumenes()
+        reconstruir_resumenes_diarios()
+        self.assertEqual(incrementales, self._resumenes(), descripcion)
+
+    def test_igual_a_reconstruir(self):
+        r1, r2, r3 = self._escribir(lambda: (
+            _crear_reserva(self.ana, self.dia1, 10000),
+            _crear_reserva(self.beto, self.dia1, 20000, estado='pendiente'),
+            _crear_reserva(self.ana, self.dia2, 5000, estado='completada'),
+        ))
+        self._comprobar('reservas nuevas')
+        self.assertEqual(ResumenDiario.objects.get(fecha=self.dia1).total_ventas, 10000)
+
+        pasos = [
+            ('reserva confirmada', r2, {'estado': 'Confirmada'}),
+            ('cambio de fecha', r1, {'fecha_evento': self.dia2}),
+            ('cambio de cliente', r3, {'cliente': self.beto}),
+            ('cambio de total', r3, {'total_reserva': Decimal('7000')}),
+            ('reserva cancelada', r1, {'estado': 'cancelada'}),
+        ]
+        for descripcion, reserva, cambios in pasos:
+            for campo, valor in cambios.items():
+                setattr(reserva, campo, valor)
+            self._escribir(reserva.save)
+            self._comprobar(descripcion)
+
+        self._escribir(r3.delete)
+        self._comprobar('reserva eliminada')
+        self.assertEqual(
+            [(r[0], r[1], r[2]) for r in self._resumenes()],
+            [(self.dia1, 1, Decimal('20000'))]
+        )
+
+    def test_clientes_distintos_aproximados(self):
+        self._escribir(lambda: [
+            _crear_reserva(cliente, self.dia1 + timedelta(days=indice % 3), 1000)
+            for indice, cliente in enumerate([self.ana, self.beto] * 3)
+        ])
+        self.assertEqual(contar_clientes_distintos(self.dia1, self.dia2 + timedelta(days=1)), (2, mock.ANY))
+        self.assertEqual(contar_clientes_distintos(self.dia1, self.dia2 + timedelta(days=1), exacto=True), (2, 0.0))
+
+
+class ResumenJuegoTests(ResumenesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.castillo, self.tobogan, self.piscina = (
+            Juego.objects.create(
+                nombre=nombre, categoria='Mediano', capacidad_personas=5, peso_maximo=100, precio_base=10000
+            )
+            for nombre in ('Castillo', 'Tobogán', 'Piscina de pelotas')
+        )
+
+    def _detalle(self, reserva, juego, cantidad=1):
+        return DetalleReserva.objects.create(
+            reserva=reserva, juego=juego, cantidad=cantidad,
+            precio_unitario=Decimal(juego.precio_base), subtotal=Decimal(juego.precio_base * cantidad)
+        )
+
+    def _resumenes(self):
+        return sorted(ResumenDiarioJuego.objects.values_list('juego_id', 'fecha', 'reservas', 'unidades', 'ingresos'))
+
+    def _comprobar(self, descripcion):
+        incrementales = self._resumenes()
+        reconstruir_resumenes_juegos()
+        self.assertEqual(incrementales, self._resumenes(), descripcion)
+
+    def test_igual_a_reconstruir(self):
+        r1 = self._escribir(lambda: _crear_reserva(self.ana, self.dia1, 30000))
+        r2 = self._escribir(lambda: _crear_reserva(self.beto, self.dia1, 10000))
+        d1 = self._escribir(lambda: self._detalle(r1, self.castillo, 2))
+        d2 = self._escribir(lambda: self._detalle(r1, self.tobogan))
+        self._escribir(lambda: self._detalle(r2, self.castillo))
+        self._comprobar('detalles nuevos')
+        self.assertEqual(
+            ResumenDiarioJuego.objects.values_list('reservas', 'unidades', 'ingresos').get(juego=self.castillo),
+            (2, 3, Decimal('30000'))
+        )
+
+        def cambiar(objeto, **cambios):
+            for campo, valor in cambios.items():
+                setattr(objeto, campo, valor)
+            self._escribir(objeto.save)
+
+        cambiar(d2, juego=self.piscina)
+        self._comprobar('cambio de juego del detalle')
+        cambiar(d1, cantidad=1, subtotal=Decimal('10000'))
+        self._comprobar('cambio de cantidad')
+        cambiar(r1, fecha_evento=self.dia2)
+        self._comprobar('cambio de fecha de la reserva')
+        cambiar(r2, estado='cancelada')
+        self._comprobar('reserva cancelada')
+        cambiar(r2, estado='Confirmada')
+        self._comprobar('reserva confirmada de nuevo')
+        self._escribir(d2.delete)
+        self._comprobar('detalle eliminado')
+        self._escribir(r1.delete)
+        self._comprobar('reserva eliminada')
+        self.assertEqual(
+            self._resumenes(),
+            [(self.castillo.id, self.dia1, 1, 1, Decimal('10000'))]
+        )
+
+
+def _variantes(resumen):
+    return {
+        'hash': resumen, 'ancho': 1200, 'alto': 900,
+        'miniatura': {'ruta': f'comprobantes/{resumen}-miniatura.webp', 'ancho': 320},
+        'mediana': {'ruta': f'comprobantes/{resumen}-mediana.webp', 'ancho': 960},
+    }
+
+
+class PuedeVerTests(TestCase):
+
+    def setUp(self):
+        self.ana = _crear_repartidor('ana')
+        self.beto = _crear_repartidor('beto')
+        cliente = _crear_cliente('cliente')
+        _crear_instalacion(
+            _crear_reserva(cliente, date(2026, 10, 10)), self.ana,
+            comprobante_pago='comprobantes/ana.jpg', comprobante_variantes=_variantes('aaaa1111')
+        )
+        _crear_instalacion(
+            _crear_reserva(cliente, date(2026, 10, 11)), self.beto,
+            comprobante_pago='comprobantes/beto.jpg', comprobante_variantes=_variantes('bbbb2222')
+        )
+
+    def test_repartidor_ve_sus_comprobantes_y_versiones(self):
+        for ruta in ('comprobantes/ana.jpg', 'comprobantes/aaaa1111-miniatura.webp', 'comprobantes/aaaa1111-mediana.webp'):
+            self.assertTrue(puede_ver(self.ana.usuario, ruta), ruta)
+
+    def test_repartidor_no_ve_los_de_otro(self):
+        for ruta in ('comprobantes/beto.jpg', 'comprobantes/bbbb2222-miniatura.webp', 'comprobantes/bbbb2222-mediana.webp'):
+            self.assertFalse(puede_ver(self.ana.usuario, ruta), ruta)
+
+    def test_version_inventada_con_hash_propio(self):
+        # El hash coincide pero la ruta no es una de las versiones guardadas
+        self.assertFalse(puede_ver(self.ana.usuario, 'comprobantes/aaaa1111-beto.jpg'))
+        self.assertFalse(puede_ver(self.ana.usuario, 'comprobantes/aaaa1111-../beto.jpg'))
+
+    def test_administrador_ve_todo_y_cliente_nada(self):
+        administrador = Usuario.objects.create(username='admin', tipo_usuario='administrador')
+        cliente = Usuario.objects.get(username='cliente')
+        self.assertTrue(puede_ver(administrador, 'comprobantes/beto.jpg'))
+        self.assertFalse(puede_ver(cliente, 'comprobantes/beto.jpg'))
+
+    def test_vista_rechaza_comprobante_ajeno(self):
+        self.client.force_login(self.ana.usuario)
+        self.assertEqual(self.client.get('/privado/comprobantes/bbbb2222-mediana.webp').status_code, 403)
+
+
+class AplicarAsignacionTests(TestCase):
+
+    def setUp(self):
+        self.dia = date(2026, 10, 10)
+        self.ana = _crear_repartidor('ana')
+        self.beto = _crear_repartidor('beto')
+        cliente = _crear_cliente('cliente')
+        primera, segunda = _crear_reserva(cliente, self.dia), _crear_reserva(cliente, self.dia)
+        self.instalaciones = [_crear_instalacion(primera), _crear_instalacion(segunda)]
+        self.retiro = Retiro.objects.create(reserva=primera, fecha_retiro=self.dia, hora_retiro=time(18))
+
+    def test_omite_repartos_cambiados_despues_de_la_vista_previa(self):
+        asignaciones = proponer_asignacion(self.dia, self.dia)['asignaciones']
+        self.assertEqual(len(asignaciones), 3)
+        manual, cancelada = self.instalaciones
+        # Después de la vista previa un administrador asigna una y cancela la otra
+        Instalacion.objects.filter(id=manual.id).update(repartidor=self.beto)
+        Instalacion.objects.filter(id=cancelada.id).update(estado_instalacion='cancelada')
+
+        self.assertEqual(aplicar_asignacion(asignaciones), (1, 2))
+        self.assertEqual(Instalacion.objects.get(id=manual.id).repartidor_id, self.beto.id)
+        self.assertIsNone(Instalacion.objects.get(id=cancelada.id).repartidor_id)
+        propuesto = next(a['repartidor_id'] for a in asignaciones if a['tipo'] == 'retiro')
+        self.assertEqual(Retiro.objects.get(id=self.retiro.id).repartidor_id, propuesto)
+        self.assertEqual(
+            list(EventoReparto.objects.filter(tipo='asignado').values_list('tipo_reparto', 'reparto_id')),
+            [('retiro', self.retiro.id)]
+        )
+
+    def test_omite_repartidores_deshabilitados(self):
+        asignaciones = [{'tipo': 'instalacion', 'id': i.id, 'repartidor_id': self.ana.id} for i in self.instalaciones]
+        Repartidor.objects.filter(id=self.ana.id).update(estado='Deshabilitado')
+        self.assertEqual(aplicar_asignacion(asignaciones), (0, 2))
+        self.assertFalse(Instalacion.objects.filter(repartidor__isnull=False).exists())
+
+
+class RepartosEnLoteTests(TestCase):
+
+    def setUp(self):
+        self.hoy = timezone.localdate()
+        self.ana = _crear_repartidor('ana')
+        cliente = _crear_cliente('cliente')
+        primera, segunda = _crear_reserva(cliente, self.hoy), _crear_reserva(cliente, self.hoy + timedelta(days=1))
+        self.hoy_instalacion = _crear_instalacion(primera)
+        self.manana_instalacion = _crear_instalacion(segunda)
+        self.cancelada = _crear_instalacion(_crear_reserva(cliente, self.hoy), estado_instalacion='cancelada')
+        self.retiro = Retiro.objects.create(reserva=primera, fecha_retiro=self.hoy, hora_retiro=time(18))
+        self.client.force_login(Usuario.objects.create(username='admin', tipo_usuario='administrador'))
+
+    def _enviar(self, nombre, repartos, **datos):
+        return self.client.post(
+            reverse(f'jio_app:{nombre}'), {'repartos': [{'tipo': t, 'id': pk} for t, pk in repartos], **datos},
+            content_type='application/json'
+        )
+
+    def test_asignar_informa_el_error_de_cada_item(self):
+        respuesta = self._enviar('asignar_repartidor_lote', [
+            ('instalacion', self.hoy_instalacion.id), ('instalacion', self.cancelada.id),
+            ('retiro', self.retiro.id), ('instalacion', 0), ('visita', self.retiro.id),
+        ], repartidor_id=self.ana.usuario_id)
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos['message'], '2 de 5 repartos asignados a Ana')
+        self.assertEqual([r.get('error') for r in datos['resultados']], [
+            None, 'No se puede asignar un reparto en estado cancelada', None,
+            'Reparto no encontrado', 'Tipo de reparto inválido',
+        ])
+        self.assertEqual(Instalacion.objects.get(id=self.hoy_instalacion.id).repartidor_id, self.ana.id)
+        self.assertIsNone(Instalacion.objects.get(id=self.cancelada.id).repartidor_id)
+        self.assertEqual(Retiro.objects.get(id=self.retiro.id).repartidor_id, self.ana.id)
+
+    def test_cambiar_estado_informa_el_error_de_cada_item(self):
+        respuesta = self._enviar('cambiar_estado_reparto_lote', [
+            ('instalacion', self.hoy_instalacion.id), ('instalacion', self.manana_instalacion.id),
+            ('retiro', self.retiro.id),
+        ], nuevo_estado='realizada')
+        self.assertEqual(respuesta.status_code, 200)
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['success'] for r in resultados], [True, False, True])
+        self.assertTrue(resultados[1]['error'].startswith('Solo se puede marcar como realizado el día agendado'))
+        self.assertEqual(Instalacion.objects.get(id=self.manana_instalacion.id).estado_instalacion, 'programada')
+        # El retiro usa el estado en masculino
+        self.assertEqual(Retiro.objects.get(id=self.retiro.id).estado_retiro, 'realizado')
+
+    def test_sin_exitos_responde_error(self):
+        respuesta = self._enviar(
+            'cambiar_estado_reparto_lote', [('instalacion', self.cancelada.id)], nuevo_estado='volando'
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        datos = respuesta.json()
+        self.assertFalse(datos['success'])
+        self.assertEqual(datos['errors'], ['0 de 1 repartos actualizados'])
+        self.assertEqual(datos['resultados'][0]['error'], 'Estado inválido')
+
+
+class HistorialRepartoTests(TestCase):
+
+    def setUp(self):
+        self.ana = _crear_repartidor('ana')
+        self.instalacion = _crear_instalacion(_crear_reserva(_crear_cliente('cliente'), date(2026, 10, 10)), self.ana)
+        inicio = timezone.make_aware(datetime(2026, 10, 10, 9))
+        # Varios eventos comparten fecha y los hechos sin conexión llegan después con una
+        # fecha anterior, así que el orden por id no es el orden por fecha
+        registrar(
+            evento_historial('estado', 'instalacion', self.instalacion.id, fecha=inicio + timedelta(minutes=n // 3))
+            for n in range(EVENTOS_POR_PAGINA * 2)
+        )
+        registrar(
+            evento_historial(
+                'estado', 'instalacion', self.instalacion.id, fecha=inicio + timedelta(minutes=n * 2), sin_conexion=True
+            )
+            for n in range(5)
+        )
+        self.client.force_login(self.ana.usuario)
+
+    def _pagina(self, antes=None):
+        url = reverse('jio_app:historial_reparto_json', args=['instalacion', self.instalacion.id])
+        return self.client.get(url, {'antes': antes} if antes else {})
+
+    def test_recorre_todo_sin_repetir_aunque_lleguen_eventos(self):
+        esperados = list(EventoReparto.objects.order_by('-fecha', '-id').values_list('id', flat=True))
+        vistos = []
+        antes = None
+        while True:
+            datos = self._pagina(antes).json()
+            vistos += [evento['id'] for evento in datos['eventos']]
+            # Un evento nuevo no desplaza las páginas siguientes
+            registrar([evento_historial('incidente', 'instalacion', self.instalacion.id)])
+            antes = datos['siguiente']
+            if antes is None:
+                break
+        self.assertEqual(vistos, esperados)
+
+    def test_parametros_invalidos_y_repartos_ajenos(self):
+        self.assertEqual(self._pagina('abc').status_code, 400)
+        self.instalacion.repartidor = _crear_repartidor('beto')
+        self.instalacion.save()
+        self.assertEqual(self._pagina().status_code, 403)
+
+
+class ClientesRecurrentesTests(TestCase):
+
+    def test_reserva_anterior_cancelada_cuenta_como_recurrente(self):
+        ana, beto, carla = (_crear_cliente(nombre) for nombre in ('ana', 'beto', 'carla'))
+        for cliente in (ana, beto, carla):
+            _crear_reserva(cliente, date(2026, 10, 10))
+        _crear_reserva(ana, date(2026, 9, 5))
+        _crear_reserva(beto, date(2026, 9, 5), estado='cancelada')
+        self.client.force_login(Usuario.objects.create(username='admin', tipo_usuario='administrador'))
+        contexto = self.client.get(reverse('jio_app:estadisticas'), {'year': 2026, 'month': 10}).context
+        self.assertEqual(
+            (contexto['total_clientes_mes'], contexto['clientes_recurrentes'], contexto['clientes_nuevos']), (3, 2, 1)
+        )
@@ -0,0 +1,290 @@
+"""
+Eventos de repartos en vivo (asignaciones, cambios de estado e incidentes) para los
+paneles de repartos y de repartidor, entregados por Server-Sent Events.
+
+Publicar un evento es un INSERT en la tabla EventoTiempoReal (outbox) más un
+pg_notify en la misma transacción: si el cambio se revierte, el evento también.
+Cada proceso ASGI mantiene una sola conexión con LISTEN y despierta a todos sus
+streams cuando llega un aviso; cada stream lee de la tabla los eventos que aún no envió.
+Sin PostgreSQL, los streams revisan la tabla cada pocos segundos.
+
+Los ids salen de una secuencia y no del orden en que se confirman las transacciones: un
+evento con id menor puede hacerse visible después de uno mayor. Por eso el id que recibe
+el navegador (y devuelve en Last-Event-ID al reconectar) es un cursor que solo avanza
+sobre eventos más antiguos que MARGEN_CURSOR, igual que en la sincronización sin conexión.
+Los eventos recientes pueden enviarse de nuevo tras reconectar; el cliente los descarta
+por su 'evento_id'.
+
+MARGEN_CURSOR es una heurística, no una garantía: supone que ninguna transacción que
+publica eventos queda abierta más de 60 segundos. El evento de una transacción más larga
+que se confirma cuando el cursor ya lo pasó no llega a los streams ni a la sincronización
+(el panel lo muestra al recargar). Las vistas publican dentro de transacciones cortas;
+los procesos largos (importaciones, comandos) no deben publicar eventos en una sola
+transacción.
+
+El stream necesita un servidor ASGI (uvicorn, ver render.yaml): con WSGI cada petición
+envía lo pendiente y termina, y el navegador vuelve a conectarse.
+"""
+import asyncio
+import json
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import EventoTiempoReal
+
+CANAL_NOTIFY = 'jio_eventos_repartos'
+# Sin avisos, cada cuánto se envía un comentario para mantener viva la conexión
+ESPERA_MAXIMA_SEGUNDOS = 15
+# Revisión periódica de la tabla cuando no hay LISTEN/NOTIFY disponible
+ESPERA_SIN_NOTIFY_SEGUNDOS = 3
+# Los streams se cierran después de este tiempo; el navegador reconecta solo
+DURACION_MAXIMA_STREAM = timedelta(minutes=30)
+EVENTOS_POR_LECTURA = 100
+DIAS_RETENCION = 7
+# Se supone que las transacciones que publican eventos duran menos que esto: los eventos
+# más antiguos ya están confirmados y el cursor puede avanzar hasta ellos (heurística, ver
+# el docstring del módulo)
+MARGEN_CURSOR = timedelta(seconds=60)
+
+
+# ========== PUBLICACIÓN ==========
+
+def evento_reparto(tipo, tipo_reparto, reparto_id, repartidor_id, **datos):
+    """Evento sin guardar; se publica con publicar()"""
+    return EventoTiempoReal(
+        tipo=tipo,
+        tipo_reparto=tipo_reparto,
+        reparto_id=reparto_id,
+        repartidor_id=repartidor_id,
+        datos=datos,
+    )
+
+
+def datos_reparto(tipo_reparto, reparto):
+    """Estado, fecha, hora y repartidor de una instalación o retiro para el payload del evento"""
+    if tipo_reparto == 'instalacion':
+        estado, display = reparto.estado_instalacion, reparto.get_estado_instalacion_display()
+        fecha, hora = reparto.fecha_instalacion, reparto.hora_instalacion
+    else:
+        estado, display = reparto.estado_retiro, reparto.get_estado_retiro_display()
+        fecha, hora = reparto.fecha_retiro, reparto.hora_retiro
+    return {
+        'estado': estado,
+        'estado_display': display,
+        'fecha': fecha.isoformat() if fecha else None,
+        'hora': hora.strftime('%H:%M') if hora else None,
+    }
+
+
+def eventos_asignacion(tipo_reparto, reparto, repartidor_anterior_id, nombre_repartidor=''):
+    """
+    Eventos de una asignación: 'asignado' para el nuevo repartidor y, si lo reemplazó,
+    'desasignado' para el anterior
+    """
+    datos = {**datos_reparto(tipo_reparto, reparto), 'repartidor': nombre_repartidor}
+    eventos = [evento_reparto('asignado', tipo_reparto, reparto.id, reparto.repartidor_id, **datos)]
+    if repartidor_anterior_id and repartidor_anterior_id != reparto.repartidor_id:
+        eventos.append(evento_reparto('desasignado', tipo_reparto, reparto.id, repartidor_anterior_id, **datos))
+    return eventos
+
+
+def publicar(eventos):
+    """
+    Guarda los eventos con un solo INSERT y avisa a los streams. Llamar dentro de la
+    transacción del cambio: NOTIFY solo se entrega al confirmarla.
+    """
+    eventos = list(eventos)
+    if not eventos:
+        return []
+    creados = EventoTiempoReal.objects.bulk_create(eventos)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CANAL_NOTIFY, ''])
+    return creados
+
+
+def limpiar_eventos_antiguos():
+    limite = timezone.now() - timedelta(days=DIAS_RETENCION)
+    eliminados, _ = EventoTiempoReal.objects.filter(fecha_creacion__lt=limite).delete()
+    return eliminados
+
+
+# ========== ESCUCHA (LISTEN) ==========
+
+class _Escucha:
+    """
+    Conexión con LISTEN compartida por todos los streams de un event loop. El socket se
+    vigila con loop.add_reader, así que esperar avisos no ocupa hilos.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.conexion = None
+        self.suscriptores = set()
+
+    @property
+    def espera(self):
+        return ESPERA_MAXIMA_SEGUNDOS if self.conexion is not None else ESPERA_SIN_NOTIFY_SEGUNDOS
+
+    def _abrir_conexion(self):
+        conexion = connection.Database.connect(**connection.get_connection_params())
+        conexion.autocommit = True
+        with conexion.cursor() as cursor:
+            cursor.execute(f'LISTEN {CANAL_NOTIFY}')
+        return conexion
+
+    async def conectar(self):
+        if self.conexion is not None or connection.vendor != 'postgresql':
+            return
+        from asgiref.sync import sync_to_async
+        try:
+            self.conexion = await sync_to_async(self._abrir_conexion, thread_sensitive=False)()
+        except Exception:
+            # Sin LISTEN los streams siguen funcionando revisando la tabla periódicamente
+            self.conexion = None
+            return
+        self.loop.add_reader(self.conexion.fileno(), self._leer_avisos)
+
+    def _leer_avisos(self):
+        try:
+            self.conexion.poll()
+            self.conexion.notifies.clear()
+        except Exception:
+            self._cerrar()
+        self._despertar()
+
+    def _despertar(self):
+        for aviso in self.suscriptores:
+            aviso.set()
+
+    def _cerrar(self):
+        if self.conexion is None:
+            return
+        self.loop.remove_reader(self.conexion.fileno())
+        try:
+            self.conexion.close()
+        except Exception:
+            pass
+        self.conexion = None
+
+    def suscribir(self):
+        aviso = asyncio.Event()
+        self.suscriptores.add(aviso)
+        return aviso
+
+    def desuscribir(self, aviso):
+        self.suscriptores.discard(aviso)
+        if not self.suscriptores:
+            self._cerrar()
+
+
+_escuchas = {}
+
+
+async def obtener_escucha():
+    loop = asyncio.get_running_loop()
+    escucha = _escuchas.get(loop)
+    if escucha is None:
+        escucha = _escuchas[loop] = _Escucha(loop)
+    await escucha.conectar()
+    return escucha
+
+
+# ========== STREAM ==========
+
+def eventos_visibles(repartidor_id=None):
+    """Eventos que ve un usuario: los administradores (repartidor_id None) ven todos"""
+    eventos = EventoTiempoReal.objects.all()
+    if repartidor_id is not None:
+        eventos = eventos.filter(repartidor_id=repartidor_id)
+    return eventos
+
+
+def _formatear(evento):
+    datos = {
+        'evento_id': evento.id,
+        'tipo': evento.tipo,
+        'tipo_reparto': evento.tipo_reparto,
+        'id': evento.reparto_id,
+        **evento.datos,
+    }
+    return f'event: {evento.tipo}\ndata: {json.dumps(datos)}\n\n'
+
+
+async def cursor_inicial(eventos):
+    """Cursor para un stream nuevo: el último evento que ya no puede tener anteriores sin confirmar"""
+    return await eventos.filter(
+        fecha_creacion__lt=timezone.now() - MARGEN_CURSOR
+    ).order_by('-id').values_list('id', flat=True).afirst() or 0
+
+
+async def _avanzar_cursor(eventos, cursor, enviados):
+    """
+    Avanza el cursor sobre los eventos ya enviados y más antiguos que MARGEN_CURSOR, en
+    orden de id y sin saltarse ninguno. Quita de enviados los ids que quedan cubiertos.
+    """
+    limite = timezone.now() - MARGEN_CURSOR
+    async for id_evento, fecha in eventos.filter(id__gt=cursor).order_by('id').values_list(
+        'id', 'fecha_creacion'
+    )[:EVENTOS_POR_LECTURA]:
+        if fecha >= limite or id_evento not in enviados:
+            break
+        cursor = id_evento
+    enviados.difference_update([id_evento for id_evento in enviados if id_evento <= cursor])
+    return cursor
+
+
+async def flujo_eventos(eventos, desde_id, continuo=True):
+    """
+    Generador asíncrono con el texto SSE de los eventos posteriores al cursor desde_id.
+    Con continuo=False envía los pendientes y termina (servidor WSGI: el navegador
+    vuelve a conectarse tras el 'retry').
+    """
+    cursor = desde_id
+    # Ids posteriores al cursor que ya se enviaron en este stream
+    enviados = set()
+
+    async def leer():
+        nonlocal cursor
+        pendientes = eventos.filter(id__gt=cursor)
+        if enviados:
+            pendientes = pendientes.exclude(id__in=enviados)
+        textos = []
+        async for evento in pendientes.order_by('id')[:EVENTOS_POR_LECTURA]:
+            enviados.add(evento.id)
+            textos.append(_formatear(evento))
+        leidos = len(textos)
+        anterior = cursor
+        cursor = await _avanzar_cursor(eventos, cursor, enviados)
+        if cursor != anterior:
+            # Un bloque con solo 'id' actualiza Last-Event-ID sin disparar un evento
+            textos.append(f'id: {cursor}\n\n')
+        return textos, leidos
+
+    if not continuo:
+        yield f'retry: {ESPERA_MAXIMA_SEGUNDOS * 1000}\n\nid: {cursor}\n\n'
+        textos, _ = await leer()
+        for texto in textos:
+            yield texto
+        return
+
+    escucha = await obtener_escucha()
+    aviso = escucha.suscribir()
+    limite = timezone.now() + DURACION_MAXIMA_STREAM
+    try:
+        yield f'retry: 3000\n\nid: {cursor}\n\n'
+        while timezone.now() < limite:
+            aviso.clear()
+            textos, leidos = await leer()
+            for texto in textos:
+                yield texto
+            if leidos == EVENTOS_POR_LECTURA:
+                continue
+            try:
+                await asyncio.wait_for(aviso.wait(), timeout=escucha.espera)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+    finally:
+        escucha.desuscribir(aviso)
@@ -38,15 +38,30 @@ urlpatterns = [
     # Gestión de Repartos
     path('panel/repartos/', views.repartos_list, name='repartos_list'),
     path('panel/repartos/agenda/json/', views.agenda_repartos_json, name='agenda_repartos_json'),
+    path('panel/repartos/asignacion-automatica/', views.asignacion_automatica_json, name='asignacion_automatica_json'),
+    path('panel/repartos/lote/asignar/', views.asignar_repartidor_lote, name='asignar_repartidor_lote'),
+    path('panel/repartos/lote/cambiar-estado/', views.cambiar_estado_reparto_lote, name='cambiar_estado_reparto_lote'),
+    path('panel/repartos/eventos/', views.eventos_repartos_stream, name='eventos_repartos_stream'),
     path('panel/repartos/<str:tipo_reparto>/<int:reparto_id>/asignar/', views.asignar_repartidor, name='asignar_repartidor'),
     path('panel/repartos/<str:tipo_reparto>/<int:reparto_id>/cambiar-estado/', views.cambiar_estado_reparto, name='cambiar_estado_reparto'),
     path('panel/repartos/<str:tipo_reparto>/<int:reparto_id>/registrar-incidente/', views.registrar_incidente, name='registrar_incidente'),
 
     # Endpoints para Repartidores
     path('delivery/cambiar-estado/', views.cambiar_estado_repartidor, name='cambiar_estado_repartidor'),
+    path('delivery/sincronizar/', views.sincronizar_repartos_repartidor, name='sincronizar_repartos_repartidor'),
+    path('delivery/sincronizar/acciones/', views.subir_acciones_repartidor, name='subir_acciones_repartidor'),
     path('delivery/instalacion/<int:instalacion_id>/detalle/', views.detalle_instalacion_json, name='detalle_instalacion_json'),
     path('delivery/retiro/<int:retiro_id>/detalle/', views.detalle_retiro_json, name='detalle_retiro_json'),
     path('delivery/<str:tipo_reparto>/<int:reparto_id>/marcar-realizado/', views.marcar_reparto_realizado, name='marcar_reparto_realizado'),
+    path('delivery/<str:tipo_reparto>/<int:reparto_id>/historial/', views.historial_reparto_json, name='historial_reparto_json'),
+
+    # Subida por partes (reanudable) de comprobantes de pago
+    path('delivery/instalacion/<int:instalacion_id>/comprobante/subidas/', views.iniciar_subida_comprobante, name='iniciar_subida_comprobante'),
+    path('delivery/subidas/<uuid:subida_id>/', views.bloque_subida_comprobante, name='bloque_subida_comprobante'),
+    path('delivery/subidas/<uuid:subida_id>/confirmar/', views.confirmar_subida_comprobante, name='confirmar_subida_comprobante'),
+
+    # Comprobantes de pago (archivos privados, ver MEDIA_PRIVADO_URL)
+    path('privado/<path:ruta>', views.archivo_privado, name='archivo_privado'),
     
     # CRUD de juegos inflables
     path('panel/juegos/', views.juegos_list, name='juegos_list'),
@@ -65,7 +80,11 @@ urlpatterns = [
 
     #Estadisticas   
     path('panel/estadisticas/', views.estadisticas, name='estadisticas'),
+    path('panel/estadisticas/juegos/', views.reporte_juegos, name='reporte_juegos'),
+    path('panel/estadisticas/ocupacion/json/', views.ocupacion_anual_json, name='ocupacion_anual_json'),
     
     #Contabilidad
     path('panel/contabilidad/', views.contabilidad, name='contabilidad'),
+    path('panel/contabilidad/deudas/', views.deudas_pendientes, name='deudas_pendientes'),
+    path('panel/exportar/<str:conjunto>/', views.exportar_datos, name='exportar_datos'),
 ]
\ No newline at end of file
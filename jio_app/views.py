@@ -5,7 +5,12 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.core.exceptions import PermissionDenied
 from django.urls import reverse
-from .models import Juego, Usuario, Repartidor, Cliente, Instalacion, Retiro, Reserva, DetalleReserva
+from .models import Juego, Usuario, Repartidor, Cliente, Instalacion, Retiro, Reserva, DetalleReserva, ResumenDiario
+from .reportes import (
+    METODOS_REDUCCION, contar_clientes_distintos, histograma_anticipacion, histograma_hora_instalacion,
+    matriz_retencion_cohortes, normalizar_puntos_objetivo, ocupacion_anual, reducir_serie,
+    reporte_utilizacion_juegos
+)
 from django.views.decorators.http import require_http_methods
 from django.core import signing
 from django.utils import timezone
@@ -770,6 +775,10 @@ def delivery_panel(request):
         repartidor=repartidor
     ).select_related('reserva__cliente__usuario').order_by('-fecha_retiro', '-hora_retiro')[:20]
     
+    # Ruta sugerida para los repartos pendientes de hoy
+    from .rutas import ruta_del_dia
+    ruta_hoy = ruta_del_dia(repartidor, fecha_hoy)
+    
     context = {
         'user': request.user,
         'fecha_hoy': fecha_hoy,
@@ -777,6 +786,7 @@ def delivery_panel(request):
         'instalaciones_todas': instalaciones_todas,
         'retiros_hoy': retiros_hoy,
         'retiros_todos': retiros_todos,
+        'ruta_hoy': ruta_hoy,
     }
     return render(request, 'jio_app/delivery_panel.html', context)
 
@@ -1340,37 +1350,11 @@ def repartos_list(request):
     # Obtener fecha base
     from datetime import date, timedelta, datetime
     from calendar import monthrange
-    from django.utils import timezone
     
     fecha_hoy = date.today()
     
-    # Cancelar automáticamente instalaciones fuera de fecha que no están realizadas ni canceladas
-    instalaciones_vencidas = Instalacion.objects.filter(
-        fecha_instalacion__lt=fecha_hoy,
-        estado_instalacion__in=['programada', 'pendiente']
-    )
-    count_instalaciones_canceladas = 0
-    for instalacion in instalaciones_vencidas:
-        obs_actual = instalacion.observaciones_instalacion or ''
-        nueva_obs = f"[{timezone.now().strftime('%d/%m/%Y %H:%M')}] Cancelada automáticamente por estar fuera de fecha y no haber sido realizada."
-        instalacion.observaciones_instalacion = f"{obs_actual}\n{nueva_obs}".strip() if obs_actual else nueva_obs
-        instalacion.estado_instalacion = 'cancelada'
-        instalacion.save()
-        count_instalaciones_canceladas += 1
-    
-    # Cancelar automáticamente retiros fuera de fecha que no están realizados ni cancelados
-    retiros_vencidos = Retiro.objects.filter(
-        fecha_retiro__lt=fecha_hoy,
-        estado_retiro__in=['programado', 'pendiente']
-    )
-    count_retiros_cancelados = 0
-    for retiro in retiros_vencidos:
-        obs_actual = retiro.observaciones_retiro or ''
-        nueva_obs = f"[{timezone.now().strftime('%d/%m/%Y %H:%M')}] Cancelado automáticamente por estar fuera de fecha y no haber sido realizado."
-        retiro.observaciones_retiro = f"{obs_actual}\n{nueva_obs}".strip() if obs_actual else nueva_obs
-        retiro.estado_retiro = 'cancelado'
-        retiro.save()
-        count_retiros_cancelados += 1
+    # Las instalaciones y retiros vencidos se cancelan con el comando
+    # cancelar_repartos_vencidos (tarea programada); esta vista solo lee.
 
     query = request.GET.get('q', '').strip()
     estado_filter = request.GET.get('estado', '').strip()
@@ -1657,20 +1641,34 @@ def asignar_repartidor(request, tipo_reparto: str, reparto_id: int):
     except Repartidor.DoesNotExist:
         return JsonResponse({'success': False, 'errors': ['Repartidor no encontrado']}, status=404)
     
+    from django.db import transaction
+    from .historial import evento_historial, registrar
+    from .tiempo_real import eventos_asignacion, publicar
+    
     try:
         if tipo_reparto == 'instalacion':
             instalacion = Instalacion.objects.get(id=reparto_id)
+            anterior_id = instalacion.repartidor_id
             instalacion.repartidor = repartidor
-            if observaciones:
-                instalacion.observaciones_instalacion = observaciones
-            instalacion.save()
+            with transaction.atomic():
+                instalacion.save()
+                registrar([evento_historial(
+                    'asignado', 'instalacion', instalacion.id, request.user,
+                    repartidor=repartidor.usuario.get_full_name(), observaciones=observaciones
+                )])
+                publicar(eventos_asignacion('instalacion', instalacion, anterior_id, repartidor.usuario.get_full_name()))
             message = f'Repartidor {repartidor.usuario.get_full_name()} asignado a la instalación'
         elif tipo_reparto == 'retiro':
             retiro = Retiro.objects.get(id=reparto_id)
+            anterior_id = retiro.repartidor_id
             retiro.repartidor = repartidor
-            if observaciones:
-                retiro.observaciones_retiro = observaciones
-            retiro.save()
+            with transaction.atomic():
+                retiro.save()
+                registrar([evento_historial(
+                    'asignado', 'retiro', retiro.id, request.user,
+                    repartidor=repartidor.usuario.get_full_name(), observaciones=observaciones
+                )])
+                publicar(eventos_asignacion('retiro', retiro, anterior_id, repartidor.usuario.get_full_name()))
             message = f'Repartidor {repartidor.usuario.get_full_name()} asignado al retiro'
         else:
             return JsonResponse({'success': False, 'errors': ['Tipo de reparto inválido']}, status=400)
@@ -1681,6 +1679,194 @@ def asignar_repartidor(request, tipo_reparto: str, reparto_id: int):
         return JsonResponse({'success': False, 'errors': ['Reparto no encontrado']}, status=404)
 
 
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def asignacion_automatica_json(request):
+    """
+    Asignación automática de repartidores. GET retorna la propuesta para las
+    instalaciones y retiros sin asignar entre 'desde' y 'hasta' (sin guardar);
+    POST aplica las asignaciones enviadas (la propuesta revisada) en un solo paso.
+    """
+    if request.user.tipo_usuario != 'administrador':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    import json
+    from datetime import date, timedelta, datetime
+    from .asignacion import aplicar_asignacion, proponer_asignacion
+    
+    if request.method == 'POST':
+        try:
+            asignaciones = json.loads(request.body).get('asignaciones', [])
+        except (ValueError, AttributeError):
+            return JsonResponse({'success': False, 'errors': ['Datos inválidos']}, status=400)
+        if not isinstance(asignaciones, list) or not asignaciones:
+            return JsonResponse({'success': False, 'errors': ['No hay asignaciones para aplicar']}, status=400)
+        
+        asignados, omitidos = aplicar_asignacion([a for a in asignaciones if isinstance(a, dict)], request.user)
+        message = f'{asignados} repartos asignados'
+        if omitidos:
+            message += f' ({omitidos} omitidos porque ya tenían repartidor o cambiaron de estado)'
+        return JsonResponse({'success': True, 'message': message, 'asignados': asignados, 'omitidos': omitidos})
+    
+    fecha_hoy = date.today()
+    try:
+        desde = datetime.strptime(request.GET.get('desde', ''), '%Y-%m-%d').date()
+        hasta = datetime.strptime(request.GET.get('hasta', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'success': False, 'errors': ['Debe indicar un rango de fechas válido']}, status=400)
+    
+    desde = max(desde, fecha_hoy)
+    if hasta < desde:
+        return JsonResponse({'success': False, 'errors': ['La fecha final debe ser posterior a la inicial']}, status=400)
+    if (hasta - desde) > timedelta(days=31):
+        return JsonResponse({'success': False, 'errors': ['El rango no puede superar los 31 días']}, status=400)
+    
+    propuesta = proponer_asignacion(desde, hasta)
+    if propuesta['sin_repartidores']:
+        return JsonResponse({'success': False, 'errors': ['No hay repartidores habilitados']}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'desde': desde.strftime('%Y-%m-%d'),
+        'hasta': hasta.strftime('%Y-%m-%d'),
+        'asignaciones': propuesta['asignaciones'],
+        'resumen': propuesta['resumen'],
+    })
+
+
+MAX_REPARTOS_LOTE = 500
+
+
+def _leer_lote_repartos(request):
+    """
+    Lee el cuerpo JSON de los endpoints en lote: {"repartos": [{"tipo": ..., "id": ...}], ...}.
+    Retorna (datos, items) o (None, JsonResponse de error).
+    """
+    import json
+    
+    try:
+        data = json.loads(request.body)
+        repartos = data.get('repartos')
+    except (ValueError, AttributeError):
+        return None, JsonResponse({'success': False, 'errors': ['Datos inválidos']}, status=400)
+    if not isinstance(repartos, list) or not repartos:
+        return None, JsonResponse({'success': False, 'errors': ['Debe seleccionar al menos un reparto']}, status=400)
+    if len(repartos) > MAX_REPARTOS_LOTE:
+        return None, JsonResponse({
+            'success': False,
+            'errors': [f'No se pueden procesar más de {MAX_REPARTOS_LOTE} repartos a la vez']
+        }, status=400)
+    
+    items = []
+    for reparto in repartos:
+        try:
+            items.append((str(reparto['tipo']), int(reparto['id'])))
+        except (KeyError, TypeError, ValueError):
+            return None, JsonResponse({'success': False, 'errors': ['Reparto inválido en la selección']}, status=400)
+    return data, items
+
+
+def _respuesta_lote(resultados, accion):
+    exitosos = sum(1 for r in resultados if r['success'])
+    message = f'{exitosos} de {len(resultados)} repartos {accion}'
+    return JsonResponse({
+        'success': exitosos > 0,
+        'message': message,
+        'resultados': resultados,
+        'errors': [] if exitosos else [message],
+    }, status=200 if exitosos else 400)
+
+
+@login_required
+@require_http_methods(["POST"])
+def asignar_repartidor_lote(request):
+    """Asignar un repartidor a varias instalaciones y/o retiros en una sola operación"""
+    if request.user.tipo_usuario != 'administrador':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    from .repartos import asignar_repartidor_en_lote
+    
+    data, items = _leer_lote_repartos(request)
+    if data is None:
+        return items
+    
+    repartidor_id = data.get('repartidor_id')
+    if not repartidor_id:
+        return JsonResponse({'success': False, 'errors': ['Debe seleccionar un repartidor']}, status=400)
+    
+    try:
+        repartidor = Repartidor.objects.select_related('usuario').get(usuario_id=repartidor_id)
+    except (Repartidor.DoesNotExist, ValueError):
+        return JsonResponse({'success': False, 'errors': ['Repartidor no encontrado']}, status=404)
+    
+    resultados = asignar_repartidor_en_lote(
+        items, repartidor, str(data.get('observaciones') or '').strip(), actor=request.user
+    )
+    return _respuesta_lote(resultados, f'asignados a {repartidor.usuario.get_full_name()}')
+
+
+@login_required
+@require_http_methods(["POST"])
+def cambiar_estado_reparto_lote(request):
+    """Cambiar el estado de varias instalaciones y/o retiros en una sola operación"""
+    if request.user.tipo_usuario != 'administrador':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    from .repartos import cambiar_estado_en_lote
+    
+    data, items = _leer_lote_repartos(request)
+    if data is None:
+        return items
+    
+    nuevo_estado = data.get('nuevo_estado')
+    if not nuevo_estado:
+        return JsonResponse({'success': False, 'errors': ['Debe seleccionar un estado']}, status=400)
+    
+    resultados = cambiar_estado_en_lote(
+        items, str(nuevo_estado), str(data.get('observaciones') or '').strip(), actor=request.user
+    )
+    return _respuesta_lote(resultados, 'actualizados')
+
+
+@login_required
+@require_http_methods(["GET"])
+async def eventos_repartos_stream(request):
+    """
+    Stream SSE (text/event-stream) con los eventos de repartos del usuario actual:
+    todos para administradores y los propios para repartidores. Requiere el servidor
+    ASGI; con WSGI envía los eventos pendientes y el navegador reconecta solo.
+    """
+    from django.core.handlers.asgi import ASGIRequest
+    from django.http import StreamingHttpResponse
+    from .tiempo_real import cursor_inicial, eventos_visibles, flujo_eventos
+    
+    user = await request.auser()
+    if user.tipo_usuario not in ['administrador', 'repartidor']:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    repartidor_id = None
+    if user.tipo_usuario == 'repartidor':
+        repartidor_id = await Repartidor.objects.filter(usuario=user).values_list('id', flat=True).afirst()
+        if repartidor_id is None:
+            return JsonResponse({'error': 'Usuario no tiene perfil de repartidor'}, status=403)
+    eventos = eventos_visibles(repartidor_id)
+    
+    # Al reconectar el navegador envía el último cursor recibido (ver tiempo_real)
+    desde = request.headers.get('Last-Event-ID') or request.GET.get('desde')
+    try:
+        desde_id = int(desde)
+    except (TypeError, ValueError):
+        desde_id = await cursor_inicial(eventos)
+    
+    response = StreamingHttpResponse(
+        flujo_eventos(eventos, desde_id, continuo=isinstance(request, ASGIRequest)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 # --------- Endpoints para Repartidores ---------
 
 @login_required
@@ -1911,6 +2097,7 @@ def juego_detail_json(request, juego_id: int):
         juego = Juego.objects.get(id=juego_id)
         # Obtener URL completa de la imagen si existe
         foto_url = request.build_absolute_uri(juego.foto.url) if juego.foto else ''
+        foto_miniatura_url = request.build_absolute_uri(juego.foto_miniatura_url) if juego.foto else ''
         
         return JsonResponse({
             'id': juego.id,
@@ -1927,6 +2114,7 @@ def juego_detail_json(request, juego_id: int):
             'peso_maximo': juego.peso_maximo,
             'precio_base': int(juego.precio_base),
             'foto': foto_url,
+            'foto_miniatura': foto_miniatura_url,
             'estado': juego.estado,
             'categoria_choices': Juego.CATEGORIA_CHOICES,
             'estado_choices': Juego.ESTADO_CHOICES,
@@ -2184,6 +2372,10 @@ def cambiar_estado_reparto(request, tipo_reparto: str, reparto_id: int):
     if not nuevo_estado:
         return JsonResponse({'success': False, 'errors': ['Debe seleccionar un estado']}, status=400)
     
+    from django.db import transaction
+    from .historial import evento_estado, registrar
+    from .tiempo_real import datos_reparto, evento_reparto, publicar
+    
     try:
         if tipo_reparto == 'instalacion':
             instalacion = Instalacion.objects.get(id=reparto_id)
@@ -2202,11 +2394,17 @@ def cambiar_estado_reparto(request, tipo_reparto: str, reparto_id: int):
                         'errors': [f'Solo se puede marcar como realizado el día agendado ({instalacion.fecha_instalacion.strftime("%d/%m/%Y")}). Hoy es {fecha_hoy.strftime("%d/%m/%Y")}']
                     }, status=400)
             
+            estado_anterior = instalacion.estado_instalacion
             instalacion.estado_instalacion = nuevo_estado
-            if observaciones:
-                obs_actual = instalacion.observaciones_instalacion or ''
-                instalacion.observaciones_instalacion = f"{obs_actual}\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {observaciones}".strip()
-            instalacion.save()
+            with transaction.atomic():
+                instalacion.save()
+                registrar([evento_estado(
+                    'instalacion', instalacion, estado_anterior, request.user, observaciones=observaciones
+                )])
+                publicar([evento_reparto(
+                    'estado', 'instalacion', instalacion.id, instalacion.repartidor_id,
+                    **datos_reparto('instalacion', instalacion)
+                )])
             message = 'Estado de instalación actualizado correctamente'
             
         elif tipo_reparto == 'retiro':
@@ -2226,11 +2424,17 @@ def cambiar_estado_reparto(request, tipo_reparto: str, reparto_id: int):
                         'errors': [f'Solo se puede marcar como realizado el día agendado ({retiro.fecha_retiro.strftime("%d/%m/%Y")}). Hoy es {fecha_hoy.strftime("%d/%m/%Y")}']
                     }, status=400)
             
+            estado_anterior = retiro.estado_retiro
             retiro.estado_retiro = nuevo_estado
-            if observaciones:
-                obs_actual = retiro.observaciones_retiro or ''
-                retiro.observaciones_retiro = f"{obs_actual}\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {observaciones}".strip()
-            retiro.save()
+            with transaction.atomic():
+                retiro.save()
+                registrar([evento_estado(
+                    'retiro', retiro, estado_anterior, request.user, observaciones=observaciones
+                )])
+                publicar([evento_reparto(
+                    'estado', 'retiro', retiro.id, retiro.repartidor_id,
+                    **datos_reparto('retiro', retiro)
+                )])
             message = 'Estado de retiro actualizado correctamente'
         else:
             return JsonResponse({'success': False, 'errors': ['Tipo de reparto inválido']}, status=400)
@@ -2460,6 +2664,10 @@ def marcar_reparto_realizado(request, tipo_reparto: str, reparto_id: int):
     
     observaciones = request.POST.get('observaciones', '')
     
+    from django.db import transaction
+    from .historial import evento_historial, registrar
+    from .tiempo_real import datos_reparto, evento_reparto, publicar
+    
     try:
         if tipo_reparto == 'instalacion':
             instalacion = Instalacion.objects.get(id=reparto_id)
@@ -2485,16 +2693,32 @@ def marcar_reparto_realizado(request, tipo_reparto: str, reparto_id: int):
             if not metodo_pago:
                 return JsonResponse({'success': False, 'errors': ['Debe seleccionar un método de pago']}, status=400)
             
-            # Solo requerir comprobante si el método de pago es transferencia
-            if metodo_pago == 'transferencia' and not comprobante_pago:
+            # Solo requerir comprobante si el método de pago es transferencia (puede venir
+            # en el formulario o haberse adjuntado antes con una subida por partes)
+            if metodo_pago == 'transferencia' and not comprobante_pago and not instalacion.comprobante_pago:
                 return JsonResponse({'success': False, 'errors': ['Debe adjuntar el comprobante de transferencia']}, status=400)
             
+            if comprobante_pago:
+                from .imagenes import extension_comprobante, nombre_comprobante
+                
+                # Se revisa el contenido, no el nombre ni el tipo que informa el navegador
+                extension = extension_comprobante(comprobante_pago)
+                if extension is None:
+                    return JsonResponse({'success': False, 'errors': ['El comprobante debe ser una imagen JPEG, PNG o WebP']}, status=400)
+                comprobante_pago.name = nombre_comprobante(comprobante_pago.name, extension)
+            
             # Actualizar instalación
             instalacion.estado_instalacion = 'realizada'
             instalacion.metodo_pago = metodo_pago
             if comprobante_pago:
                 instalacion.comprobante_pago = comprobante_pago
             
+            datos_historial = {
+                'metodo_pago': metodo_pago,
+                'metodo_pago_display': instalacion.get_metodo_pago_display(),
+                'observaciones': observaciones,
+            }
+            
             # Actualizar hora de retiro si se proporcionó
             if hora_retiro:
                 try:
@@ -2505,22 +2729,21 @@ def marcar_reparto_realizado(request, tipo_reparto: str, reparto_id: int):
                         hora_obj = datetime.strptime(hora_retiro, '%H:%M').time()
                         retiro.hora_retiro = hora_obj
                         retiro.save()
-                        obs_adicional = f"\nHora de retiro actualizada: {hora_retiro}"
+                        datos_historial['hora_retiro'] = hora_retiro
                     else:
-                        obs_adicional = f"\nHora de retiro solicitada: {hora_retiro} (retiro no encontrado)"
+                        datos_historial['error_hora_retiro'] = f'Hora de retiro solicitada: {hora_retiro} (retiro no encontrado)'
                 except Exception as e:
-                    obs_adicional = f"\nError al actualizar hora de retiro: {str(e)}"
-            else:
-                obs_adicional = ""
-            
-            if observaciones:
-                obs_actual = instalacion.observaciones_instalacion or ''
-                instalacion.observaciones_instalacion = f"{obs_actual}\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] Realizado por {request.user.get_full_name()}\nMétodo de pago: {instalacion.get_metodo_pago_display()}\n{observaciones}{obs_adicional}".strip()
-            else:
-                obs_actual = instalacion.observaciones_instalacion or ''
-                instalacion.observaciones_instalacion = f"{obs_actual}\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] Realizado por {request.user.get_full_name()}\nMétodo de pago: {instalacion.get_metodo_pago_display()}{obs_adicional}".strip()
+                    datos_historial['error_hora_retiro'] = f'Error al actualizar hora de retiro: {str(e)}'
             
-            instalacion.save()
+            with transaction.atomic():
+                instalacion.save()
+                registrar([evento_historial(
+                    'realizado', 'instalacion', instalacion.id, request.user, **datos_historial
+                )])
+                publicar([evento_reparto(
+                    'estado', 'instalacion', instalacion.id, instalacion.repartidor_id,
+                    **datos_reparto('instalacion', instalacion)
+                )])
             message = 'Instalación marcada como realizada'
             if hora_retiro:
                 message += f'. Hora de retiro actualizada: {hora_retiro}'
@@ -2544,14 +2767,15 @@ def marcar_reparto_realizado(request, tipo_reparto: str, reparto_id: int):
             # Actualizar retiro
             retiro.estado_retiro = 'realizado'
             
-            if observaciones:
-                obs_actual = retiro.observaciones_retiro or ''
-                retiro.observaciones_retiro = f"{obs_actual}\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] Realizado por {request.user.get_full_name()}\n{observaciones}".strip()
-            else:
-                obs_actual = retiro.observaciones_retiro or ''
-                retiro.observaciones_retiro = f"{obs_actual}\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] Realizado por {request.user.get_full_name()}".strip()
-            
-            retiro.save()
+            with transaction.atomic():
+                retiro.save()
+                registrar([evento_historial(
+                    'realizado', 'retiro', retiro.id, request.user, observaciones=observaciones
+                )])
+                publicar([evento_reparto(
+                    'estado', 'retiro', retiro.id, retiro.repartidor_id,
+                    **datos_reparto('retiro', retiro)
+                )])
             message = 'Retiro marcado como realizado'
         else:
             return JsonResponse({'success': False, 'errors': ['Tipo de reparto inválido']}, status=400)
@@ -2576,26 +2800,36 @@ def registrar_incidente(request, tipo_reparto: str, reparto_id: int):
     if not tipo_incidente or not descripcion:
         return JsonResponse({'success': False, 'errors': ['Complete todos los campos obligatorios']}, status=400)
     
-    # Formatear el incidente
-    timestamp = timezone.now().strftime('%d/%m/%Y %H:%M')
-    incidente_texto = f"\n--- INCIDENTE [{timestamp}] ---\nTipo: {tipo_incidente}\nDescripción: {descripcion}"
-    if solucion:
-        incidente_texto += f"\nSolución: {solucion}"
-    incidente_texto += "\n"
+    from django.db import transaction
+    from .historial import evento_historial, registrar
+    from .tiempo_real import evento_reparto, publicar
+    
+    # El incidente queda en el historial del reparto; el reparto en sí no cambia
+    datos_incidente = {'tipo_incidente': tipo_incidente, 'descripcion': descripcion, 'solucion': solucion}
     
     try:
         if tipo_reparto == 'instalacion':
             instalacion = Instalacion.objects.get(id=reparto_id)
-            obs_actual = instalacion.observaciones_instalacion or ''
-            instalacion.observaciones_instalacion = (obs_actual + incidente_texto).strip()
-            instalacion.save()
+            with transaction.atomic():
+                registrar([evento_historial(
+                    'incidente', 'instalacion', instalacion.id, request.user, **datos_incidente
+                )])
+                publicar([evento_reparto(
+                    'incidente', 'instalacion', instalacion.id, instalacion.repartidor_id,
+                    tipo_incidente=tipo_incidente, descripcion=descripcion
+                )])
             message = 'Incidente registrado en la instalación'
             
         elif tipo_reparto == 'retiro':
             retiro = Retiro.objects.get(id=reparto_id)
-            obs_actual = retiro.observaciones_retiro or ''
-            retiro.observaciones_retiro = (obs_actual + incidente_texto).strip()
-            retiro.save()
+            with transaction.atomic():
+                registrar([evento_historial(
+                    'incidente', 'retiro', retiro.id, request.user, **datos_incidente
+                )])
+                publicar([evento_reparto(
+                    'incidente', 'retiro', retiro.id, retiro.repartidor_id,
+                    tipo_incidente=tipo_incidente, descripcion=descripcion
+                )])
             message = 'Incidente registrado en el retiro'
         else:
             return JsonResponse({'success': False, 'errors': ['Tipo de reparto inválido']}, status=400)
@@ -2638,6 +2872,165 @@ def cambiar_estado_repartidor(request):
         return JsonResponse({'success': False, 'errors': [str(e)]}, status=400)
 
 
+@login_required
+@require_http_methods(["GET"])
+def sincronizar_repartos_repartidor(request):
+    """
+    Sincronización para trabajar sin conexión: repartos del repartidor actual que
+    cambiaron desde ?cursor= (o todos si no se envía). Ver sincronizacion.sincronizar.
+    """
+    if request.user.tipo_usuario != 'repartidor':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    from .sincronizacion import sincronizar
+    
+    cursor = request.GET.get('cursor')
+    try:
+        cursor = int(cursor) if cursor not in (None, '') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'errors': ['Cursor inválido']}, status=400)
+    
+    try:
+        repartidor = request.user.repartidor
+    except Repartidor.DoesNotExist:
+        return JsonResponse({'error': 'Usuario no tiene perfil de repartidor'}, status=403)
+    
+    return JsonResponse({
+        'success': True,
+        'estado_repartidor': repartidor.estado,
+        **sincronizar(repartidor, cursor)
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def subir_acciones_repartidor(request):
+    """
+    Recibe las acciones que el repartidor hizo sin conexión: {"acciones": [{"id", "tipo",
+    "fecha", ...}]}. Reenviar el mismo lote es seguro: las acciones ya procesadas no se
+    aplican de nuevo y se responde con su resultado original.
+    """
+    if request.user.tipo_usuario != 'repartidor':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    import json
+    from .sincronizacion import MAX_ACCIONES_POR_LOTE, aplicar_acciones
+    
+    try:
+        acciones = json.loads(request.body).get('acciones')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'errors': ['Datos inválidos']}, status=400)
+    if not isinstance(acciones, list) or not acciones:
+        return JsonResponse({'success': False, 'errors': ['No hay acciones para sincronizar']}, status=400)
+    if len(acciones) > MAX_ACCIONES_POR_LOTE:
+        return JsonResponse({
+            'success': False,
+            'errors': [f'No se pueden sincronizar más de {MAX_ACCIONES_POR_LOTE} acciones a la vez']
+        }, status=400)
+    
+    try:
+        repartidor = request.user.repartidor
+    except Repartidor.DoesNotExist:
+        return JsonResponse({'error': 'Usuario no tiene perfil de repartidor'}, status=403)
+    
+    resultados = aplicar_acciones(repartidor, acciones)
+    aplicadas = sum(1 for r in resultados if r.get('success'))
+    return JsonResponse({
+        'success': True,
+        'message': f'{aplicadas} de {len(resultados)} acciones aplicadas',
+        'resultados': resultados,
+    })
+
+
+def _respuesta_error_subida(error):
+    respuesta = {'success': False, 'errors': [str(error)]}
+    if error.subida is not None:
+        from .subidas import datos_subida
+        respuesta['subida'] = datos_subida(error.subida)
+    return JsonResponse(respuesta, status=error.estado_http)
+
+
+@login_required
+@require_http_methods(["POST"])
+def iniciar_subida_comprobante(request, instalacion_id: int):
+    """
+    Abre una subida por partes del comprobante de una instalación: {"nombre", "tamano",
+    "tipo"}. Retorna la sesión con los bytes ya recibidos (0, o más si se retoma).
+    """
+    if request.user.tipo_usuario != 'repartidor':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    import json
+    from .subidas import ErrorSubida, datos_subida, iniciar_subida
+    
+    try:
+        datos = json.loads(request.body)
+        nombre, tamano, tipo = datos.get('nombre'), datos.get('tamano'), datos.get('tipo')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'errors': ['Datos inválidos']}, status=400)
+    
+    try:
+        instalacion = Instalacion.objects.get(id=instalacion_id)
+    except Instalacion.DoesNotExist:
+        return JsonResponse({'error': 'Instalación no encontrada'}, status=404)
+    if instalacion.repartidor_id is None or instalacion.repartidor != getattr(request.user, 'repartidor', None):
+        return JsonResponse({'success': False, 'errors': ['No autorizado para actualizar esta instalación']}, status=403)
+    
+    try:
+        subida = iniciar_subida(instalacion, instalacion.repartidor, nombre, tamano, tipo)
+    except ErrorSubida as e:
+        return _respuesta_error_subida(e)
+    return JsonResponse({'success': True, 'subida': datos_subida(subida)})
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def bloque_subida_comprobante(request, subida_id):
+    """
+    GET: estado de la subida (bytes recibidos, para retomarla).
+    POST: un bloque del archivo en el cuerpo, con la cabecera Content-Range.
+    """
+    if request.user.tipo_usuario != 'repartidor':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    from .subidas import ErrorSubida, datos_subida, escribir_bloque, obtener_subida
+    
+    try:
+        if request.method == 'GET':
+            subida = obtener_subida(subida_id, request.user.repartidor)
+        else:
+            subida = escribir_bloque(
+                subida_id, request.user.repartidor, request.headers.get('Content-Range'), request
+            )
+    except Repartidor.DoesNotExist:
+        return JsonResponse({'error': 'Usuario no tiene perfil de repartidor'}, status=403)
+    except ErrorSubida as e:
+        return _respuesta_error_subida(e)
+    return JsonResponse({'success': True, 'subida': datos_subida(subida)})
+
+
+@login_required
+@require_http_methods(["POST"])
+def confirmar_subida_comprobante(request, subida_id):
+    """Adjunta a la instalación el comprobante ya subido por completo"""
+    if request.user.tipo_usuario != 'repartidor':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    from .subidas import ErrorSubida, confirmar_subida
+    
+    try:
+        instalacion = confirmar_subida(subida_id, request.user.repartidor)
+    except Repartidor.DoesNotExist:
+        return JsonResponse({'error': 'Usuario no tiene perfil de repartidor'}, status=403)
+    except ErrorSubida as e:
+        return _respuesta_error_subida(e)
+    return JsonResponse({
+        'success': True,
+        'message': 'Comprobante adjuntado correctamente',
+        'comprobante': instalacion.comprobante_pago.url,
+    })
+
+
 @login_required
 @require_http_methods(["GET"])
 def detalle_instalacion_json(request, instalacion_id: int):
@@ -2655,6 +3048,9 @@ def detalle_instalacion_json(request, instalacion_id: int):
         if request.user.tipo_usuario == 'repartidor' and instalacion.repartidor != request.user.repartidor:
             return JsonResponse({'error': 'No autorizado'}, status=403)
         
+        from .historial import pagina_historial
+        from .imagenes import srcset, url_variante
+        
         # Obtener juegos de la reserva
         juegos = []
         precio_juegos_total = 0.0
@@ -2662,11 +3058,13 @@ def detalle_instalacion_json(request, instalacion_id: int):
             subtotal_juego = float(detalle.cantidad * detalle.precio_unitario)
             precio_juegos_total += subtotal_juego
             
-            # Intentar obtener URL de imagen del juego
+            # Intentar obtener URL de imagen del juego (versión mediana si ya se generó)
             imagen_url = None
+            imagen_srcset = ''
             if detalle.juego.foto:
                 try:
-                    imagen_url = request.build_absolute_uri(detalle.juego.foto.url)
+                    imagen_url = request.build_absolute_uri(detalle.juego.foto_mediana_url)
+                    imagen_srcset = srcset(detalle.juego.foto_variantes, request.build_absolute_uri)
                 except:
                     imagen_url = None
             
@@ -2674,7 +3072,8 @@ def detalle_instalacion_json(request, instalacion_id: int):
                 'nombre': detalle.juego.nombre,
                 'cantidad': detalle.cantidad,
                 'precio': str(detalle.precio_unitario),
-                'imagen_url': imagen_url
+                'imagen_url': imagen_url,
+                'imagen_srcset': imagen_srcset
             })
         
         # Calcular precio de distancia (total - precio juegos)
@@ -2708,7 +3107,15 @@ def detalle_instalacion_json(request, instalacion_id: int):
             'precio_distancia': str(int(precio_distancia)) if precio_distancia > 0 else '0',
             'kilometros': kilometros,
             'total': str(int(total_reserva)),
-            'mapa_url': None  # Puede agregarse en el futuro si se guarda en el modelo
+            'comprobante': {
+                'url': request.build_absolute_uri(
+                    url_variante(instalacion.comprobante_variantes, 'mediana', 'comprobante')
+                    or instalacion.comprobante_pago.url
+                ),
+                'srcset': srcset(instalacion.comprobante_variantes, request.build_absolute_uri, 'comprobante'),
+            } if instalacion.comprobante_pago else None,
+            'mapa_url': None,  # Puede agregarse en el futuro si se guarda en el modelo
+            'historial': pagina_historial('instalacion', instalacion.id),
         }
         
         return JsonResponse(data)
@@ -2733,6 +3140,8 @@ def detalle_retiro_json(request, retiro_id: int):
         if request.user.tipo_usuario == 'repartidor' and retiro.repartidor != request.user.repartidor:
             return JsonResponse({'error': 'No autorizado'}, status=403)
         
+        from .historial import pagina_historial
+        
         data = {
             'id': retiro.id,
             'fecha': retiro.fecha_retiro.strftime('%d/%m/%Y'),
@@ -2748,7 +3157,8 @@ def detalle_retiro_json(request, retiro_id: int):
             },
             'repartidor': {
                 'nombre': retiro.repartidor.usuario.get_full_name() if retiro.repartidor else 'Sin asignar'
-            }
+            },
+            'historial': pagina_historial('retiro', retiro.id),
         }
         
         return JsonResponse(data)
@@ -2756,6 +3166,51 @@ def detalle_retiro_json(request, retiro_id: int):
         return JsonResponse({'error': 'Retiro no encontrado'}, status=404)
 
 
+@login_required
+@require_http_methods(["GET"])
+def historial_reparto_json(request, tipo_reparto: str, reparto_id: int):
+    """Página siguiente del historial de una instalación o retiro (?antes=<id del último evento>)"""
+    if request.user.tipo_usuario not in ['administrador', 'repartidor']:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    modelos = {'instalacion': Instalacion, 'retiro': Retiro}
+    if tipo_reparto not in modelos:
+        return JsonResponse({'error': 'Tipo de reparto inválido'}, status=400)
+    
+    try:
+        antes = int(request.GET['antes']) if request.GET.get('antes') else None
+    except ValueError:
+        return JsonResponse({'error': 'Parámetro antes inválido'}, status=400)
+    
+    reparto = modelos[tipo_reparto].objects.filter(id=reparto_id).values('repartidor_id').first()
+    if reparto is None:
+        return JsonResponse({'error': 'Reparto no encontrado'}, status=404)
+    # Si es repartidor, solo puede ver el historial de sus propios repartos
+    if request.user.tipo_usuario == 'repartidor' and (
+        not hasattr(request.user, 'repartidor') or reparto['repartidor_id'] != request.user.repartidor.id
+    ):
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    from .historial import pagina_historial
+    
+    return JsonResponse(pagina_historial(tipo_reparto, reparto_id, antes))
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def archivo_privado(request, ruta: str):
+    """
+    Entrega un comprobante de pago (o una de sus versiones) a los administradores y al
+    repartidor asignado a la instalación. El envío lo hace el servidor web si está
+    configurado (X-Accel-Redirect / X-Sendfile).
+    """
+    from .archivos_privados import puede_ver, respuesta_archivo
+
+    if not puede_ver(request.user, ruta):
+        raise PermissionDenied
+    return respuesta_archivo(ruta)
+
+
 @login_required
 @require_http_methods(["POST"])
 def actualizar_estado_reparto_repartidor(request, tipo_reparto: str, reparto_id: int):
@@ -2769,6 +3224,10 @@ def actualizar_estado_reparto_repartidor(request, tipo_reparto: str, reparto_id:
     if not nuevo_estado:
         return JsonResponse({'success': False, 'errors': ['Debe seleccionar un estado']}, status=400)
     
+    from django.db import transaction
+    from .historial import evento_estado, registrar
+    from .tiempo_real import datos_reparto, evento_reparto, publicar
+    
     try:
         if tipo_reparto == 'instalacion':
             instalacion = Instalacion.objects.get(id=reparto_id)
@@ -2782,11 +3241,17 @@ def actualizar_estado_reparto_repartidor(request, tipo_reparto: str, reparto_id:
             if nuevo_estado not in estados_validos:
                 return JsonResponse({'success': False, 'errors': ['Estado inválido']}, status=400)
             
+            estado_anterior = instalacion.estado_instalacion
             instalacion.estado_instalacion = nuevo_estado
-            if observaciones:
-                obs_actual = instalacion.observaciones_instalacion or ''
-                instalacion.observaciones_instalacion = f"{obs_actual}\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {observaciones}".strip()
-            instalacion.save()
+            with transaction.atomic():
+                instalacion.save()
+                registrar([evento_estado(
+                    'instalacion', instalacion, estado_anterior, request.user, observaciones=observaciones
+                )])
+                publicar([evento_reparto(
+                    'estado', 'instalacion', instalacion.id, instalacion.repartidor_id,
+                    **datos_reparto('instalacion', instalacion)
+                )])
             message = 'Estado de instalación actualizado'
             
         elif tipo_reparto == 'retiro':
@@ -2801,11 +3266,17 @@ def actualizar_estado_reparto_repartidor(request, tipo_reparto: str, reparto_id:
             if nuevo_estado not in estados_validos:
                 return JsonResponse({'success': False, 'errors': ['Estado inválido']}, status=400)
             
+            estado_anterior = retiro.estado_retiro
             retiro.estado_retiro = nuevo_estado
-            if observaciones:
-                obs_actual = retiro.observaciones_retiro or ''
-                retiro.observaciones_retiro = f"{obs_actual}\n[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {observaciones}".strip()
-            retiro.save()
+            with transaction.atomic():
+                retiro.save()
+                registrar([evento_estado(
+                    'retiro', retiro, estado_anterior, request.user, observaciones=observaciones
+                )])
+                publicar([evento_reparto(
+                    'estado', 'retiro', retiro.id, retiro.repartidor_id,
+                    **datos_reparto('retiro', retiro)
+                )])
             message = 'Estado de retiro actualizado'
         else:
             return JsonResponse({'success': False, 'errors': ['Tipo de reparto inválido']}, status=400)
@@ -3009,16 +3480,17 @@ def juego_update_json(request, juego_id: int):
             juego.peso_excedido_por = None
             juego.peso_excedido_fecha = None
         
-        # Manejar la foto
+        # Manejar la foto (la anterior se borra del almacenamiento en segundo plano)
+        from .cola import encolar_al_confirmar
         if foto:
             # Si hay una foto anterior, eliminarla
             if juego.foto:
-                juego.foto.delete(save=False)
+                encolar_al_confirmar('eliminar_archivo', ruta=juego.foto.name)
             juego.foto = foto
         elif eliminar_foto:
             # Eliminar la foto si se solicitó
             if juego.foto:
-                juego.foto.delete(save=False)
+                encolar_al_confirmar('eliminar_archivo', ruta=juego.foto.name)
             juego.foto = None
         # Si no hay foto nueva ni se solicita eliminar, mantener la existente
         
@@ -3075,7 +3547,7 @@ def estadisticas(request):
     from collections import defaultdict
     import json
     from calendar import monthrange
-    from django.db.models import Sum, Count, Q
+    from django.db.models import Sum, Count, Q, Exists, OuterRef
     
     # Obtener fecha actual
     hoy = datetime.now().date()
@@ -3302,7 +3774,50 @@ def estadisticas(request):
     
     ventas_anuales_data = [ventas_anuales[label] for label in ventas_anuales_labels]
     ventas_anuales_rango = f"{año_inicio_str} - {año_fin_str}"
-    
+
+    # Ventas diarias en un rango libre de fechas (puede abarcar varios años)
+    # La serie se reduce en el servidor para que el payload quede acotado
+    ventas_desde = request.GET.get('ventas_desde', '').strip()
+    ventas_hasta = request.GET.get('ventas_hasta', '').strip()
+    ventas_puntos = normalizar_puntos_objetivo(request.GET.get('ventas_puntos'))
+    ventas_metodo = request.GET.get('ventas_metodo', 'lttb').strip()
+    if ventas_metodo not in METODOS_REDUCCION:
+        ventas_metodo = 'lttb'
+
+    try:
+        rango_desde = datetime.strptime(ventas_desde, '%Y-%m-%d').date()
+    except ValueError:
+        rango_desde = hoy - timedelta(days=365)
+    try:
+        rango_hasta = datetime.strptime(ventas_hasta, '%Y-%m-%d').date()
+    except ValueError:
+        rango_hasta = hoy
+    if rango_desde > rango_hasta:
+        rango_desde, rango_hasta = rango_hasta, rango_desde
+    rango_desde = max(rango_desde, date(2000, 1, 1))
+    rango_hasta = min(rango_hasta, date(2100, 12, 31))
+
+    # Se lee desde los resúmenes diarios (una fila por día) en lugar de recorrer las reservas
+    totales_por_dia = {
+        fecha: float(total)
+        for fecha, total in ResumenDiario.objects.filter(
+            fecha__gte=rango_desde,
+            fecha__lte=rango_hasta
+        ).values_list('fecha', 'total_ventas')
+    }
+
+    ventas_rango_labels = []
+    ventas_rango_data = []
+    for i in range((rango_hasta - rango_desde).days + 1):
+        fecha_dia = rango_desde + timedelta(days=i)
+        ventas_rango_labels.append(fecha_dia.strftime('%d/%m/%Y'))
+        ventas_rango_data.append(totales_por_dia.get(fecha_dia, 0.0))
+
+    ventas_rango_labels, ventas_rango_data = reducir_serie(
+        ventas_rango_labels, ventas_rango_data, ventas_puntos, ventas_metodo
+    )
+    ventas_rango_rango = f"{rango_desde.strftime('%d/%m/%Y')} - {rango_hasta.strftime('%d/%m/%Y')}"
+
     # ========== VENTAS POR CATEGORÍA ==========
     # Obtener categorías ordenadas según el modelo
     categorias_orden = ['Pequeño', 'Mediano', 'Grande']
@@ -3624,27 +4139,27 @@ def estadisticas(request):
         crecimiento_ventas = 100.0 if ventas_mes_seleccionado > 0 else 0.0
     
     # Clientes nuevos vs recurrentes (mes seleccionado)
-    clientes_mes_seleccionado = Cliente.objects.filter(
-        reservas__fecha_evento__year=año_seleccionado,
-        reservas__fecha_evento__month=mes_seleccionado
-    ).distinct()
-    
-    clientes_nuevos = 0
-    clientes_recurrentes = 0
-    
+    # Se resuelve con subconsultas EXISTS en lugar de consultar cliente por cliente
     fecha_inicio_mes_seleccionado = datetime(año_seleccionado, mes_seleccionado, 1).date()
     
-    for cliente in clientes_mes_seleccionado:
-        reservas_anteriores = Reserva.objects.filter(
-            cliente=cliente,
-            fecha_evento__lt=fecha_inicio_mes_seleccionado
-        ).exists()
-        if reservas_anteriores:
-            clientes_recurrentes += 1
-        else:
-            clientes_nuevos += 1
+    clientes_mes_seleccionado = Cliente.objects.filter(Exists(
+        Reserva.objects.filter(
+            cliente=OuterRef('pk'),
+            fecha_evento__year=año_seleccionado,
+            fecha_evento__month=mes_seleccionado
+        )
+    ))
     
     total_clientes_mes = clientes_mes_seleccionado.count()
+    # Recurrente: tiene alguna reserva anterior al mes, incluso cancelada. No se usa
+    # Cliente.primera_reserva porque ese contador ignora las reservas canceladas
+    clientes_recurrentes = clientes_mes_seleccionado.filter(Exists(
+        Reserva.objects.filter(
+            cliente=OuterRef('pk'),
+            fecha_evento__lt=fecha_inicio_mes_seleccionado
+        )
+    )).count()
+    clientes_nuevos = total_clientes_mes - clientes_recurrentes
     
     # ========== COMPARACIONES AÑO A AÑO ==========
     # Ventas del año seleccionado
@@ -3676,6 +4191,26 @@ def estadisticas(request):
         crecimiento_reservas_año = ((reservas_año_seleccionado - reservas_año_anterior) / reservas_año_anterior) * 100
     else:
         crecimiento_reservas_año = 100.0 if reservas_año_seleccionado > 0 else 0.0
+
+    # Clientes únicos del año seleccionado (aproximado con HyperLogLog, o exacto si se solicita)
+    clientes_exacto = request.GET.get('clientes_exacto', '') == '1'
+    clientes_unicos_año, clientes_unicos_error = contar_clientes_distintos(
+        date(año_seleccionado, 1, 1),
+        date(año_seleccionado, 12, 31),
+        exacto=clientes_exacto
+    )
+
+    # Histogramas de anticipación y hora de instalación (eventos del año seleccionado)
+    anticipacion = histograma_anticipacion(date(año_seleccionado, 1, 1), date(año_seleccionado, 12, 31))
+    hora_instalacion = histograma_hora_instalacion(date(año_seleccionado, 1, 1), date(año_seleccionado, 12, 31))
+
+    # Matriz de retención por cohortes (últimos 12 meses cerrados)
+    retencion_cohortes = matriz_retencion_cohortes(12, hoy=hoy)
+    retencion_columnas = list(range(1, len(retencion_cohortes)))
+    for fila in retencion_cohortes:
+        fila['nombre'] = f"{meses_espanol[fila['cohorte'].month]} {fila['cohorte'].year}"
+        # Opacidad de la celda proporcional al porcentaje (mapa de calor)
+        fila['celdas'] = [(p, f"{min(p / 100, 1) * 0.8 + 0.05:.2f}") for p in fila['retencion']]
     
     # Generar lista de años disponibles (desde 2020 hasta el año actual)
     años_disponibles = list(range(2020, hoy.year + 1))
@@ -3731,6 +4266,21 @@ def estadisticas(request):
         'reservas_año_actual': reservas_año_seleccionado,
         'reservas_año_anterior': reservas_año_anterior,
         'crecimiento_reservas_año': crecimiento_reservas_año,
+        'clientes_unicos_año': clientes_unicos_año,
+        'clientes_unicos_error': clientes_unicos_error * 100,
+        'clientes_exacto': clientes_exacto,
+        # Histogramas de anticipación y hora de instalación
+        'anticipacion_labels': json.dumps(anticipacion['etiquetas']),
+        'anticipacion_data': json.dumps(anticipacion['cantidades']),
+        'anticipacion_total': anticipacion['total'],
+        'anticipacion_percentiles': anticipacion['percentiles'],
+        'hora_instalacion_labels': json.dumps(hora_instalacion['etiquetas']),
+        'hora_instalacion_data': json.dumps(hora_instalacion['cantidades']),
+        'hora_instalacion_total': hora_instalacion['total'],
+        'hora_instalacion_percentiles': hora_instalacion['percentiles'],
+        # Retención por cohortes
+        'retencion_cohortes': retencion_cohortes,
+        'retencion_columnas': retencion_columnas,
         # Datos de gráficos
         'ventas_semanales_labels': json.dumps(ventas_semanales_labels),
         'ventas_semanales_data': json.dumps(ventas_semanales_data),
@@ -3741,6 +4291,13 @@ def estadisticas(request):
         'ventas_anuales_labels': json.dumps(ventas_anuales_labels),
         'ventas_anuales_data': json.dumps(ventas_anuales_data),
         'ventas_anuales_rango': ventas_anuales_rango,
+        'ventas_rango_labels': json.dumps(ventas_rango_labels),
+        'ventas_rango_data': json.dumps(ventas_rango_data),
+        'ventas_rango_rango': ventas_rango_rango,
+        'ventas_desde': rango_desde.strftime('%Y-%m-%d'),
+        'ventas_hasta': rango_hasta.strftime('%Y-%m-%d'),
+        'ventas_puntos': ventas_puntos,
+        'ventas_metodo': ventas_metodo,
         'ventas_periodo': ventas_periodo,
         'ventas_semana': ventas_semana,
         'ventas_mes': ventas_mes if ventas_mes else '',
@@ -3775,6 +4332,114 @@ def estadisticas(request):
     return render(request, 'jio_app/estadisticas.html', context)
 
 
+@login_required
+def reporte_juegos(request):
+    """
+    Ranking de juegos por utilización (días reservados / días del período) e ingresos
+    """
+    if not request.user.tipo_usuario == 'administrador':
+        raise PermissionDenied("Solo los administradores pueden acceder a este recurso.")
+
+    from datetime import datetime, timedelta
+
+    hoy = datetime.now().date()
+    try:
+        hasta = datetime.strptime(request.GET.get('hasta', ''), '%Y-%m-%d').date()
+    except ValueError:
+        hasta = hoy
+    try:
+        desde = datetime.strptime(request.GET.get('desde', ''), '%Y-%m-%d').date()
+    except ValueError:
+        desde = hasta - timedelta(days=364)
+    if desde > hasta:
+        desde, hasta = hasta, desde
+
+    orden = request.GET.get('orden', 'utilizacion')
+    if orden not in ['utilizacion', 'ingresos']:
+        orden = 'utilizacion'
+
+    filas = reporte_utilizacion_juegos(desde, hasta, orden)
+
+    return render(request, 'jio_app/reporte_juegos.html', {
+        'filas': filas,
+        'desde': desde.strftime('%Y-%m-%d'),
+        'hasta': hasta.strftime('%Y-%m-%d'),
+        'dias_periodo': (hasta - desde).days + 1,
+        'orden': orden,
+        'total_ingresos': sum(fila['ingresos'] for fila in filas),
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def ocupacion_anual_json(request):
+    """
+    Ocupación diaria de un año completo para el mapa de calor.
+    Con ?por_juego=1 incluye un bitmask (base64) de días ocupados por cada juego.
+    """
+    if request.user.tipo_usuario != 'administrador':
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+
+    from datetime import datetime
+
+    try:
+        año = int(request.GET.get('year', datetime.now().year))
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Año inválido'}, status=400)
+    if año < 2000 or año > 2100:
+        return JsonResponse({'error': 'Año inválido'}, status=400)
+
+    por_juego = request.GET.get('por_juego', '') == '1'
+    return JsonResponse(ocupacion_anual(año, por_juego=por_juego))
+
+
+@login_required
+@require_http_methods(["GET"])
+def exportar_datos(request, conjunto):
+    """
+    Exporta reservas (con detalles), pagos o repartos en CSV o XLSX como respuesta en streaming.
+    Parámetros: formato (csv|xlsx), desde y hasta (YYYY-MM-DD, por defecto el año en curso).
+    """
+    if request.user.tipo_usuario != 'administrador':
+        raise PermissionDenied("Solo los administradores pueden acceder a este recurso.")
+
+    from datetime import datetime, date
+    from django.http import Http404, StreamingHttpResponse
+    from .exportaciones import CONJUNTOS_EXPORTACION, FORMATOS_EXPORTACION, generar_csv, generar_xlsx
+
+    if conjunto not in CONJUNTOS_EXPORTACION:
+        raise Http404("Conjunto de datos no válido")
+
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        formato = 'csv'
+
+    hoy = datetime.now().date()
+    try:
+        desde = datetime.strptime(request.GET.get('desde', ''), '%Y-%m-%d').date()
+    except ValueError:
+        desde = date(hoy.year, 1, 1)
+    try:
+        hasta = datetime.strptime(request.GET.get('hasta', ''), '%Y-%m-%d').date()
+    except ValueError:
+        hasta = date(desde.year, 12, 31)
+    if desde > hasta:
+        desde, hasta = hasta, desde
+
+    encabezados, filas = CONJUNTOS_EXPORTACION[conjunto](desde, hasta)
+    if formato == 'xlsx':
+        contenido = generar_xlsx(encabezados, filas, nombre_hoja=conjunto.capitalize())
+    else:
+        contenido = generar_csv(encabezados, filas)
+
+    tipo_contenido, extension = FORMATOS_EXPORTACION[formato]
+    response = StreamingHttpResponse(contenido, content_type=tipo_contenido)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{conjunto}_{desde:%Y%m%d}_{hasta:%Y%m%d}.{extension}"'
+    )
+    return response
+
+
 @login_required
 def contabilidad(request):
     """
@@ -3783,10 +4448,11 @@ def contabilidad(request):
     if not request.user.tipo_usuario == 'administrador':
         raise PermissionDenied("Solo los administradores pueden acceder a este recurso.")
     
-    from datetime import datetime, timedelta
+    from datetime import datetime
     from collections import defaultdict
     from calendar import monthrange
-    from django.db.models import Sum, Q
+    from django.db.models import Count, Sum
+    from .finanzas import egresos_diarios, ingresos_diarios, resumen_balances
     
     # Obtener parámetros de mes y año (si existen)
     hoy = datetime.now().date()
@@ -3816,51 +4482,31 @@ def contabilidad(request):
     ultimo_dia_mes = datetime(año_seleccionado, mes_seleccionado, monthrange(año_seleccionado, mes_seleccionado)[1]).date()
     
     # ========== INGRESOS (Pagos recibidos) ==========
-    from jio_app.models import Pago, Reserva
-    
-    # Obtener pagos pagados del mes seleccionado
-    pagos_mes = Pago.objects.filter(
-        estado='pagado',
-        fecha_pago__year=año_seleccionado,
-        fecha_pago__month=mes_seleccionado
-    )
-    
-    # También incluir pagos sin fecha_pago pero de reservas del mes
-    reservas_mes = Reserva.objects.filter(
-        fecha_evento__year=año_seleccionado,
-        fecha_evento__month=mes_seleccionado
-    )
-    
-    pagos_sin_fecha = Pago.objects.filter(
-        estado='pagado',
-        reserva__in=reservas_mes,
-        fecha_pago__isnull=True
-    )
-    
-    # Calcular ingresos por día del mes
+    # Una sola consulta agrupada por día (ver finanzas.ingresos_diarios)
     ingresos_por_dia = defaultdict(float)
     pagos_por_dia = defaultdict(int)
     
-    # Ingresos de pagos con fecha_pago
-    for pago in pagos_mes:
-        if pago.fecha_pago:
-            dia = pago.fecha_pago.day
-            ingresos_por_dia[dia] += float(pago.monto)
-            pagos_por_dia[dia] += 1
-    
-    # Ingresos de pagos sin fecha_pago pero de reservas del mes
-    for pago in pagos_sin_fecha:
-        dia = pago.reserva.fecha_evento.day
-        ingresos_por_dia[dia] += float(pago.monto)
-        pagos_por_dia[dia] += 1
+    for fecha, (total, cantidad) in ingresos_diarios(primer_dia_mes, ultimo_dia_mes).items():
+        ingresos_por_dia[fecha.day] += float(total)
+        pagos_por_dia[fecha.day] += cantidad
     
     # Total de ingresos del mes
     total_ingresos_mes = sum(ingresos_por_dia.values())
     total_pagos_mes = sum(pagos_por_dia.values())
     
-    # ========== EGRESOS (Por ahora vacío, se puede expandir después) ==========
+    # ========== EGRESOS ==========
     egresos_por_dia = defaultdict(float)
-    total_egresos_mes = 0.0
+    
+    for fecha, (total, cantidad) in egresos_diarios(primer_dia_mes, ultimo_dia_mes).items():
+        egresos_por_dia[fecha.day] += float(total)
+    
+    total_egresos_mes = sum(egresos_por_dia.values())
+    
+    # ========== BALANCE ANUAL ==========
+    # Suma los cierres mensuales del año; solo los meses sin cierre se calculan en vivo
+    balance_anual = resumen_balances((año_seleccionado, 1), (año_seleccionado, 12), hoy=hoy)
+    for fila in balance_anual['filas']:
+        fila['mes_nombre'] = meses_espanol[fila['mes']]
     
     # ========== CALENDARIO ==========
     # Crear estructura de calendario
@@ -3924,6 +4570,12 @@ def contabilidad(request):
     # Calcular saldo neto del mes
     saldo_neto_mes = total_ingresos_mes - total_egresos_mes
     
+    # Deuda pendiente total (índice parcial de reservas con saldo)
+    deuda_pendiente = Reserva.objects.filter(saldo_pendiente__gt=0).aggregate(
+        total=Sum('saldo_pendiente'),
+        cantidad=Count('id')
+    )
+    
     context = {
         # Datos del calendario mensual
         'mes_seleccionado': mes_seleccionado,
@@ -3942,11 +4594,41 @@ def contabilidad(request):
         'puede_avanzar': puede_avanzar,
         'meses_espanol': meses_espanol,
         'años_disponibles': años_disponibles,
+        # Balance anual (cierres mensuales)
+        'balance_anual': balance_anual,
+        # Exportaciones disponibles
+        'conjuntos_exportacion': [('reservas', 'Reservas'), ('pagos', 'Pagos'), ('repartos', 'Repartos')],
+        # Deuda pendiente de las reservas
+        'deuda_pendiente_total': deuda_pendiente['total'] or 0,
+        'deuda_pendiente_reservas': deuda_pendiente['cantidad'],
     }
     
     return render(request, 'jio_app/contabilidad.html', context)
 
 
+@login_required
+def deudas_pendientes(request):
+    """
+    Reporte de cobranza: reservas con saldo pendiente, ordenables por antigüedad o monto
+    """
+    if not request.user.tipo_usuario == 'administrador':
+        raise PermissionDenied("Solo los administradores pueden acceder a este recurso.")
+
+    from .finanzas import reservas_con_deuda
+
+    orden = request.GET.get('orden', 'antiguedad')
+    if orden not in ['antiguedad', 'reciente', 'saldo']:
+        orden = 'antiguedad'
+
+    reservas = reservas_con_deuda(orden)
+
+    return render(request, 'jio_app/deudas_pendientes.html', {
+        'reservas': reservas,
+        'orden': orden,
+        'total_deuda': sum(reserva.saldo_pendiente for reserva in reservas),
+    })
+
+
 # --------- CRUD de Arriendos (solo administrador) ---------
 
 @login_required
@@ -4146,6 +4828,10 @@ def arriendo_detail_json(request, arriendo_id: int):
             'cliente_telefono': reserva.cliente.usuario.telefono or '',
             'cliente_rut': reserva.cliente.rut,
             'cliente_tipo': reserva.cliente.get_tipo_cliente_display(),
+            'cliente_total_reservas': reserva.cliente.total_reservas,
+            'cliente_primera_reserva': reserva.cliente.primera_reserva.strftime('%Y-%m-%d') if reserva.cliente.primera_reserva else '',
+            'cliente_ultima_reserva': reserva.cliente.ultima_reserva.strftime('%Y-%m-%d') if reserva.cliente.ultima_reserva else '',
+            'cliente_gasto_total': float(reserva.cliente.gasto_total),
             'fecha_evento': reserva.fecha_evento.strftime('%Y-%m-%d'),
             'hora_instalacion': reserva.hora_instalacion.strftime('%H:%M'),
             'hora_retiro': reserva.hora_retiro.strftime('%H:%M'),